@@ -0,0 +1,134 @@
+"""
+Compare the LLM backends: per-call overhead, throughput and memory
+
+Each backend runs in its own process against the local stub server so
+imports and memory do not mix. For each one it reports:
+
+    import s     importing the backend's libraries and building the email model
+    call ms      mean wall time of one sequential ainvoke + parse
+    cpu ms       mean CPU time of the same calls, i.e. the client-side overhead
+    emails/s     throughput of agenerate_email_for_multiple_leads over --leads
+    peak MB      peak RSS of the process
+
+Usage:
+    python benchmarks/bench_backends.py --calls 300 --leads 1000 --latency 0
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from stub_openai_server import StubOpenAIServer
+
+BACKENDS = ["langchain", "openai"]
+PRODUCT = "InvestorBase: AI-powered deal flow screening for venture capital funds."
+
+
+def _leads(count: int) -> list:
+    return [
+        {
+            "name": f"Lead {i}",
+            "lead_id": f"bench-{i}",
+            "experience": f"Partner at Fund {i % 37}; previously {i % 11 + 2} years as an operator in B2B SaaS.",
+            "education": "MBA",
+            "company": f"Fund {i % 37}",
+            "company_overview": f"Fund {i % 37} backs seed and Series A software companies across India.",
+            "company_industry": "Venture Capital",
+        }
+        for i in range(count)
+    ]
+
+
+async def _measure(backend: str, calls: int, leads: int, concurrency: int) -> dict:
+    start = time.perf_counter()
+    from llm_client import aget_structured_model
+    from personalised_email import (
+        EmailResponse,
+        MAX_TOKENS,
+        MODEL_NAME,
+        TEMPERATURE,
+        agenerate_email_for_multiple_leads,
+        prepare_messages,
+    )
+
+    model = await aget_structured_model(EmailResponse, MODEL_NAME, TEMPERATURE, MAX_TOKENS, backend=backend)
+    import_s = time.perf_counter() - start
+
+    messages, _ = prepare_messages(_leads(1)[0], PRODUCT)
+    model.parse(await model.ainvoke(messages))
+    wall, cpu = [], []
+    for _ in range(calls):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        model.parse(await model.ainvoke(messages))
+        wall.append(time.perf_counter() - wall_start)
+        cpu.append(time.process_time() - cpu_start)
+
+    start = time.perf_counter()
+    results = await agenerate_email_for_multiple_leads(
+        _leads(leads), PRODUCT, max_concurrency=concurrency, use_cache=False
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "import_s": import_s,
+        "call_ms": statistics.mean(wall) * 1000,
+        "cpu_ms": statistics.mean(cpu) * 1000,
+        "emails_per_s": len(results) / elapsed,
+        "failed": sum(result.get("status") != "ok" for result in results),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300, help="Sequential calls timed per backend")
+    parser.add_argument("--leads", type=int, default=1000, help="Leads in the throughput run")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub latency per call in seconds")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Runs inside the per-backend process; the stub URL comes from the parent
+        result = asyncio.run(_measure(args.child, args.calls, args.leads, args.concurrency))
+        print(json.dumps(result))
+        return
+
+    with StubOpenAIServer(latency=args.latency) as stub:
+        env = dict(
+            os.environ,
+            OPENAI_API_BASE=stub.base_url,
+            OPENAI_API_KEY="stub",
+            EMAIL_CACHE_ENABLED="0",
+            OPENAI_RPM_LIMIT="100000000",
+            OPENAI_TPM_LIMIT="100000000000",
+        )
+        print(f"{'backend':<10} {'import s':>9} {'call ms':>8} {'cpu ms':>7} {'emails/s':>9} {'peak MB':>8}")
+        for backend in args.backends.split(","):
+            output = subprocess.check_output(
+                [
+                    sys.executable, os.path.abspath(__file__), "--child", backend,
+                    "--calls", str(args.calls), "--leads", str(args.leads), "--concurrency", str(args.concurrency),
+                ],
+                env=dict(env, EMAIL_LLM_BACKEND=backend),
+                text=True,
+            )
+            result = json.loads(output.strip().splitlines()[-1])
+            failed = f"  ({result['failed']} failed)" if result["failed"] else ""
+            print(
+                f"{backend:<10} {result['import_s']:>9.2f} {result['call_ms']:>8.2f} {result['cpu_ms']:>7.2f} "
+                f"{result['emails_per_s']:>9.1f} {result['peak_rss_mb']:>8.1f}{failed}"
+            )
+
+
+if __name__ == "__main__":
+    main()
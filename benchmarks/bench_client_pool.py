@@ -0,0 +1,136 @@
+"""
+Benchmark the per-call overhead saved by the shared LLM client registry
+
+Runs generate_email_for_single_lead against the local stub server twice:
+once building a fresh ChatOpenAI + with_structured_output per call (the old
+behaviour) and once through llm_client's cached, pooled runnable.
+
+Usage:
+    python benchmarks/bench_client_pool.py --calls 200 --latency 0
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai_server import StubOpenAIServer
+
+SAMPLE_LEAD = {
+    "name": "Ada Lovelace",
+    "lead_id": "bench-1",
+    "experience": "Head of Engineering",
+    "education": "Mathematics",
+    "company": "Analytical Engines",
+    "company_overview": "Builds general purpose computing machinery.",
+    "company_industry": "Technology",
+}
+PRODUCT = "InvestorBase: AI-powered deal flow screening for venture capital funds."
+
+
+def _leads(count: int) -> list:
+    """
+    Distinct copies of SAMPLE_LEAD, so no call is coalesced with another
+    """
+    return [{**SAMPLE_LEAD, "name": f"Ada Lovelace {i}", "lead_id": f"bench-{i}"} for i in range(count)]
+
+
+def _fresh_runnable():
+    """
+    The pre-registry behaviour: a new client and schema conversion per call
+    """
+    from langchain_openai import ChatOpenAI
+    from personalised_email import EmailResponse, MODEL_NAME, TEMPERATURE, MAX_TOKENS
+
+    model = ChatOpenAI(
+        model=MODEL_NAME,
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+    )
+    return model.with_structured_output(EmailResponse)
+
+
+def _time_calls(invoke, calls: int) -> list:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        invoke()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def _time_concurrent(agenerate, leads: list) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(agenerate(lead) for lead in leads))
+    return time.perf_counter() - start
+
+
+def _report(label: str, timings: list):
+    ordered = sorted(timings)
+    print(
+        f"{label:<22} mean {statistics.mean(timings) * 1000:8.2f} ms   "
+        f"p50 {ordered[len(ordered) // 2] * 1000:8.2f} ms   "
+        f"p95 {ordered[int(len(ordered) * 0.95) - 1] * 1000:8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub latency in seconds")
+    args = parser.parse_args()
+
+    with StubOpenAIServer(latency=args.latency) as stub:
+        os.environ["OPENAI_API_BASE"] = stub.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+        import personalised_email
+        from llm_client import get_structured_model
+        from prompts import build_messages
+
+        messages = build_messages(SAMPLE_LEAD, PRODUCT)
+        settings = (
+            personalised_email.EmailResponse,
+            personalised_email.MODEL_NAME,
+            personalised_email.TEMPERATURE,
+            personalised_email.MAX_TOKENS,
+        )
+
+        # Warm up imports and the registry so only steady-state cost is measured
+        get_structured_model(*settings).invoke(messages)
+        _fresh_runnable().invoke(messages)
+
+        fresh = _time_calls(lambda: _fresh_runnable().invoke(messages), args.calls)
+        pooled = _time_calls(lambda: get_structured_model(*settings).invoke(messages), args.calls)
+
+        print(f"{args.calls} sequential calls, stub latency {args.latency * 1000:.0f} ms")
+        _report("per-call client", fresh)
+        _report("shared pooled client", pooled)
+        saved = statistics.mean(fresh) - statistics.mean(pooled)
+        print(f"overhead saved per call: {saved * 1000:.2f} ms")
+
+        async def fresh_async(lead: dict):
+            await asyncio.to_thread(_fresh_runnable().invoke, build_messages(lead, PRODUCT))
+
+        async def pooled_async(lead: dict):
+            # Uncached, or every call after the first would be a cache hit
+            await personalised_email.agenerate_email_for_single_lead(lead, PRODUCT, use_cache=False)
+
+        async def run_concurrent():
+            leads = _leads(args.calls)
+            await pooled_async(SAMPLE_LEAD)
+            return await _time_concurrent(fresh_async, leads), await _time_concurrent(pooled_async, leads)
+
+        fresh_total, pooled_total = asyncio.run(run_concurrent())
+        print(f"\n{args.calls} concurrent calls")
+        print(f"{'per-call client':<22} {fresh_total:8.2f} s")
+        print(f"{'shared pooled client':<22} {pooled_total:8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
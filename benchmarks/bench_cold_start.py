@@ -0,0 +1,220 @@
+"""
+Benchmark worker cold start: import time, time to ready and first-email latency
+
+Each measurement runs in a fresh process so nothing is cached between runs:
+
+    import      time to 'import app' with the LLM libraries loaded lazily, and
+                with them imported up front as the app used to
+    uvicorn     time from process start to the first /health answer, and the
+                latency of the first /generate-single-email sent --idle seconds
+                later, for eager imports, lazy imports and lazy imports with
+                the background warmup
+    gunicorn    time to the first /health answer and total memory (PSS) of
+                --workers workers, with and without preload_app
+
+Usage:
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --repeat 5 --workers 4 --skip gunicorn
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARK_DIR, "..", "src")
+sys.path.insert(0, BENCHMARK_DIR)
+
+from stub_openai_server import StubOpenAIServer
+
+# Imported before the app to reproduce loading the LLM libraries at import time
+EAGER_IMPORTS = "import langchain_openai, openai"
+
+LEAD = {
+    "name": "Lead 1",
+    "lead_id": "bench-1",
+    "experience": "Partner at Fund 1; previously 4 years as an operator in B2B SaaS.",
+    "education": "MBA",
+    "company": "Fund 1",
+    "company_overview": "Fund 1 backs seed and Series A software companies across India.",
+    "company_industry": "Venture Capital",
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _env(stub: StubOpenAIServer, **extra) -> dict:
+    env = dict(os.environ)
+    env.update(
+        OPENAI_API_BASE=stub.base_url,
+        OPENAI_API_KEY="x",
+        EMAIL_CACHE_ENABLED="0",
+        EMAIL_JOBS_DB=os.path.join("/tmp", f"bench_cold_start_{os.getpid()}.sqlite3"),
+    )
+    env.update(extra)
+    return env
+
+
+def _wait_healthy(port: int, process: subprocess.Popen, timeout: float = 60) -> float:
+    """
+    Poll /health until it answers; returns the time at which it did
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return time.perf_counter()
+        except OSError:
+            time.sleep(0.01)
+    raise RuntimeError("server did not become healthy")
+
+
+def _post_email(port: int) -> float:
+    body = json.dumps({"lead": LEAD, "product": {"details": "InvestorBase: deal flow screening."}}).encode()
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/generate-single-email",
+        data=body,
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def _stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _pss_mb(pid: int) -> float:
+    """
+    Proportional set size of a process and its children, so shared pages count once
+    """
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children:
+            pids += [int(child) for child in children.read().split()]
+    except OSError:
+        pass
+    total_kb = 0
+    for each in pids:
+        try:
+            with open(f"/proc/{each}/smaps_rollup") as smaps:
+                for line in smaps:
+                    if line.startswith("Pss:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return total_kb / 1024
+
+
+def bench_import(repeat: int) -> dict:
+    results = {}
+    for mode, prelude in (("eager", EAGER_IMPORTS + "; "), ("lazy", "")):
+        code = f"import time; start = time.perf_counter(); {prelude}import app; print(time.perf_counter() - start)"
+        times = [
+            float(subprocess.check_output([sys.executable, "-c", code], cwd=SRC_DIR, text=True))
+            for _ in range(repeat)
+        ]
+        results[mode] = {"import_s": statistics.median(times)}
+    return results
+
+
+def bench_uvicorn(stub: StubOpenAIServer, repeat: int, idle: float) -> dict:
+    modes = {
+        "eager": (EAGER_IMPORTS + "; ", "0"),
+        "lazy": ("", "0"),
+        "lazy+warmup": ("", "1"),
+    }
+    results = {}
+    for mode, (prelude, warmup) in modes.items():
+        ready, first_email = [], []
+        for _ in range(repeat):
+            port = _free_port()
+            code = f"{prelude}import uvicorn; uvicorn.run('app:app', port={port}, log_level='warning')"
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, "-c", code], cwd=SRC_DIR, env=_env(stub, EMAIL_WARMUP=warmup)
+            )
+            try:
+                ready.append(_wait_healthy(port, process) - start)
+                time.sleep(idle)
+                first_email.append(_post_email(port))
+            finally:
+                _stop(process)
+        results[mode] = {"ready_s": statistics.median(ready), "first_email_s": statistics.median(first_email)}
+    return results
+
+
+def bench_gunicorn(stub: StubOpenAIServer, repeat: int, workers: int, settle: float) -> dict:
+    gunicorn = shutil.which("gunicorn")
+    if gunicorn is None:
+        print("gunicorn not installed, skipping")
+        return {}
+    results = {}
+    for mode, preload in (("no-preload", "0"), ("preload", "1")):
+        ready, memory = [], []
+        for _ in range(repeat):
+            port = _free_port()
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [gunicorn, "-c", "gunicorn.conf.py", "--log-level", "warning", "app:app"],
+                cwd=SRC_DIR,
+                env=_env(stub, EMAIL_BIND=f"127.0.0.1:{port}", EMAIL_WORKERS=str(workers), EMAIL_PRELOAD=preload),
+            )
+            try:
+                ready.append(_wait_healthy(port, process) - start)
+                # Give every worker time to finish booting and warming up
+                time.sleep(settle)
+                memory.append(_pss_mb(process.pid))
+            finally:
+                _stop(process)
+        results[mode] = {"ready_s": statistics.median(ready), "pss_mb": statistics.median(memory)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the median is reported")
+    parser.add_argument("--idle", type=float, default=2.0, help="Seconds between ready and the first email")
+    parser.add_argument("--workers", type=int, default=4, help="Gunicorn workers")
+    parser.add_argument("--settle", type=float, default=5.0, help="Seconds before measuring gunicorn memory")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub latency per call in seconds")
+    parser.add_argument("--skip", default="", help="Comma-separated benchmarks to skip: import,uvicorn,gunicorn")
+    args = parser.parse_args()
+    skip = set(filter(None, args.skip.split(",")))
+
+    with StubOpenAIServer(latency=args.latency) as stub:
+        if "import" not in skip:
+            print(f"{'import':<12} {'import s':>9}")
+            for mode, result in bench_import(args.repeat).items():
+                print(f"{mode:<12} {result['import_s']:>9.3f}")
+        if "uvicorn" not in skip:
+            print(f"\n{'uvicorn':<12} {'ready s':>9} {'1st email s':>12}")
+            for mode, result in bench_uvicorn(stub, args.repeat, args.idle).items():
+                print(f"{mode:<12} {result['ready_s']:>9.3f} {result['first_email_s']:>12.3f}")
+        if "gunicorn" not in skip:
+            print(f"\n{'gunicorn x' + str(args.workers):<12} {'ready s':>9} {'PSS MB':>12}")
+            for mode, result in bench_gunicorn(stub, args.repeat, args.workers, args.settle).items():
+                print(f"{mode:<12} {result['ready_s']:>9.3f} {result['pss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark packed generation: throughput and tokens per email against pack size
+
+Runs agenerate_email_for_multiple_leads over the same leads once per pack
+size against the local stub server. The stub's per-token latency makes
+larger packs slower per call, as decoding a longer answer would be.
+
+Usage:
+    python benchmarks/bench_packing.py --leads 200 --pack-sizes 1,2,5,10 --latency 0.3 --token-latency 0.002
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_openai_server import StubOpenAIServer
+
+PRODUCT = "InvestorBase: AI-powered deal flow screening for venture capital funds."
+
+
+def _leads(count: int) -> list:
+    return [
+        {
+            "name": f"Lead {i}",
+            "lead_id": f"bench-{i}",
+            "experience": f"Partner at Fund {i % 17}, previously operator at a fintech startup for {i % 9 + 2} years.",
+            "education": "MBA",
+            "company": f"Fund {i % 17}",
+            "company_overview": f"Fund {i % 17} backs early-stage B2B software companies in India and Southeast Asia.",
+            "company_industry": "Venture Capital",
+        }
+        for i in range(count)
+    ]
+
+
+async def _run(leads: list, pack_size: int, concurrency: int) -> tuple:
+    from personalised_email import agenerate_email_for_multiple_leads
+
+    start = time.perf_counter()
+    results = await agenerate_email_for_multiple_leads(
+        leads,
+        PRODUCT,
+        max_concurrency=concurrency,
+        use_cache=False,
+        include_usage=True,
+        pack_size=pack_size,
+    )
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=200)
+    parser.add_argument("--pack-sizes", default="1,2,5,10")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3, help="Stub latency per call in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Stub latency per completion token")
+    args = parser.parse_args()
+
+    with StubOpenAIServer(latency=args.latency, token_latency=args.token_latency) as stub:
+        os.environ["OPENAI_API_BASE"] = stub.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        leads = _leads(args.leads)
+
+        print(f"{args.leads} leads, concurrency {args.concurrency}, stub latency "
+              f"{args.latency * 1000:.0f} ms + {args.token_latency * 1000:.1f} ms/token")
+        print(f"{'pack':>4} {'calls':>6} {'seconds':>8} {'emails/s':>9} {'prompt tok/email':>17} "
+              f"{'completion tok/email':>21} {'fallbacks':>10} {'errors':>7}")
+        for pack_size in (int(n) for n in args.pack_sizes.split(",")):
+            requests_before = stub.requests
+            results, elapsed = asyncio.run(_run(leads, pack_size, args.concurrency))
+            usages = [r.get("usage") or {} for r in results]
+            errors = sum(r.get("status") != "ok" for r in results)
+            fallbacks = sum(pack_size > 1 and "pack_size" not in usage for usage in usages)
+            print(
+                f"{pack_size:>4} {stub.requests - requests_before:>6} {elapsed:>8.2f} {len(leads) / elapsed:>9.1f} "
+                f"{sum(u.get('prompt_tokens', 0) for u in usages) / len(leads):>17.0f} "
+                f"{sum(u.get('completion_tokens', 0) for u in usages) / len(leads):>21.0f} "
+                f"{fallbacks:>10} {errors:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
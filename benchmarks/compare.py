@@ -0,0 +1,73 @@
+"""
+Compare two run_benchmarks.py result files
+
+Prints throughput, p95 latency and peak memory side by side for every
+scenario and batch size present in both runs, and flags changes worse than
+--threshold. Exits with status 1 if any regression was found.
+
+Usage:
+    python benchmarks/compare.py benchmarks/results/before.json benchmarks/results/after.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+# (label, getter, True if higher is better)
+METRICS = [
+    ("emails/s", lambda r: r["throughput"], True),
+    ("p95 ms", lambda r: (r["latency"]["p95"] or 0) * 1000, False),
+    ("peak MB", lambda r: r["peak_rss_mb"], False),
+]
+
+
+def load(path: str) -> tuple:
+    with open(path) as file:
+        report = json.load(file)
+    return report["meta"], {(r["scenario"], r["batch_size"]): r for r in report["results"]}
+
+
+def change(before: float, after: float) -> float:
+    return (after - before) / before if before else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    before_meta, before = load(args.before)
+    after_meta, after = load(args.after)
+    print(f"before: {before_meta['version']} ({before_meta['timestamp']})")
+    print(f"after:  {after_meta['version']} ({after_meta['timestamp']})")
+    if before_meta.get("llm_backend") != after_meta.get("llm_backend"):
+        print(f"note: LLM backend {before_meta.get('llm_backend')} vs {after_meta.get('llm_backend')}")
+    for key in ("latency", "latency_dist", "concurrency", "rate_limit_rate"):
+        if before_meta["settings"].get(key) != after_meta["settings"].get(key):
+            print(f"warning: runs used different {key}: "
+                  f"{before_meta['settings'].get(key)} vs {after_meta['settings'].get(key)}")
+
+    header = f"{'scenario':<11} {'batch':>6}" + "".join(f" {label:>27}" for label, _, _ in METRICS)
+    print(header)
+    regressions = 0
+    for key in sorted(before.keys() & after.keys()):
+        row = f"{key[0]:<11} {key[1]:>6}"
+        for label, get, higher_is_better in METRICS:
+            old, new = get(before[key]), get(after[key])
+            delta = change(old, new)
+            worse = -delta if higher_is_better else delta
+            flag = "!" if worse > args.threshold else " "
+            regressions += flag == "!"
+            row += f" {old:>9.1f} -> {new:>9.1f} {delta:>+5.0%}{flag}"
+        print(row)
+
+    missing = before.keys() ^ after.keys()
+    if missing:
+        print(f"only in one run: {', '.join(f'{s}/{b}' for s, b in sorted(missing))}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
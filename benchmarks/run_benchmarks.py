@@ -0,0 +1,346 @@
+"""
+Benchmark suite for email generation against the local stub server
+
+Runs each scenario for each batch size and reports throughput, latency
+percentiles and memory:
+
+    single      generate_email_for_single_lead, batch_size calls from a thread pool
+    multi       generate_email_for_multiple_leads with batch_size leads
+    api-single  POST /generate-single-email, batch_size concurrent requests
+    api-multi   POST /generate-multiple-emails with batch_size leads
+    api-stream  POST /generate-multiple-emails/stream; latency is time to each email
+
+Latency percentiles are per call for 'single' and 'api-single', per request
+for 'multi' and 'api-multi' (over --repeat runs) and per email for
+'api-stream'. Results are written as JSON; compare two runs with compare.py.
+The generation cache is off unless --cache is given, so every lead reaches
+the stub.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --scenarios multi,api-stream --batch-sizes 1,100,1000,10000
+    python benchmarks/run_benchmarks.py --latency 0.5 --latency-dist lognormal --rate-limit-rate 0.01
+    python benchmarks/compare.py benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from stub_openai_server import StubOpenAIServer, add_stub_arguments, stub_options
+
+SCENARIOS = ["single", "multi", "api-single", "api-multi", "api-stream"]
+PRODUCT = "InvestorBase: AI-powered deal flow screening for venture capital funds."
+
+
+def make_leads(count: int, offset: int = 0) -> list:
+    """
+    Distinct leads spread over a few dozen companies, like a real upload
+    """
+    return [
+        {
+            "name": f"Lead {i}",
+            "lead_id": f"bench-{i}",
+            "experience": f"Partner at Fund {i % 37}; previously {i % 11 + 2} years as an operator in B2B SaaS.",
+            "education": "MBA, Indian Institute of Management",
+            "company": f"Fund {i % 37}",
+            "company_overview": f"Fund {i % 37} backs seed and Series A software companies across India.",
+            "company_industry": "Venture Capital",
+        }
+        for i in range(offset, offset + count)
+    ]
+
+
+def percentile(values: list, pct: float) -> float:
+    """
+    Nearest-rank percentile of values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(max(int(round(pct / 100 * len(ordered))) - 1, 0), len(ordered) - 1)]
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # ru_maxrss is the peak so far (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class RssSampler:
+    """
+    Track the peak resident memory of the process while a scenario runs
+    """
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.baseline = self.peak = _rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_mb())
+
+
+def run_single(batch_size: int, args) -> tuple:
+    from personalised_email import generate_email_for_single_lead
+
+    def one(lead: dict):
+        start = time.perf_counter()
+        result = generate_email_for_single_lead(lead, PRODUCT, use_cache=args.cache)
+        return time.perf_counter() - start, result.get("subject") == "Error generating email"
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(one, make_leads(batch_size)))
+    return [latency for latency, _ in outcomes], batch_size, sum(error for _, error in outcomes)
+
+
+def run_multi(batch_size: int, args) -> tuple:
+    from personalised_email import generate_email_for_multiple_leads
+
+    latencies, errors = [], 0
+    for repeat in range(args.repeat):
+        leads = make_leads(batch_size, offset=repeat * batch_size)
+        start = time.perf_counter()
+        results = generate_email_for_multiple_leads(
+            leads, PRODUCT, max_concurrency=args.concurrency, use_cache=args.cache
+        )
+        latencies.append(time.perf_counter() - start)
+        errors += sum(result.get("status") != "ok" for result in results)
+    return latencies, batch_size * args.repeat, errors
+
+
+class ApiServer:
+    """
+    Serve the FastAPI app with uvicorn on a free local port in a background thread
+    """
+
+    def __init__(self):
+        import uvicorn
+        from app import app
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self.base_url = "http://127.0.0.1:%d" % self._socket.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+async def _api_single(base_url: str, batch_size: int, args) -> tuple:
+    import httpx
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    params = {"bypass_cache": str(not args.cache).lower()}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+
+        async def one(lead: dict):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/generate-single-email", params=params, json={"lead": lead, "product": {"details": PRODUCT}}
+                )
+                return time.perf_counter() - start, response.status_code != 200
+
+        outcomes = await asyncio.gather(*(one(lead) for lead in make_leads(batch_size)))
+    return [latency for latency, _ in outcomes], batch_size, sum(error for _, error in outcomes)
+
+
+async def _api_multi(base_url: str, batch_size: int, args) -> tuple:
+    import httpx
+
+    params = {"bypass_cache": str(not args.cache).lower()}
+    latencies, errors = [], 0
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        for repeat in range(args.repeat):
+            leads = make_leads(batch_size, offset=repeat * batch_size)
+            start = time.perf_counter()
+            response = await client.post(
+                "/generate-multiple-emails", params=params, json={"leads": leads, "product": {"details": PRODUCT}}
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += batch_size
+            else:
+                errors += sum(result.get("status") != "ok" for result in response.json())
+    return latencies, batch_size * args.repeat, errors
+
+
+async def _api_stream(base_url: str, batch_size: int, args) -> tuple:
+    import httpx
+
+    params = {"bypass_cache": str(not args.cache).lower()}
+    latencies, errors = [], 0
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        start = time.perf_counter()
+        request = {"leads": make_leads(batch_size), "product": {"details": PRODUCT}}
+        async with client.stream("POST", "/generate-multiple-emails/stream", params=params, json=request) as response:
+            async for line in response.aiter_lines():
+                if line:
+                    latencies.append(time.perf_counter() - start)
+                    errors += json.loads(line).get("status") != "ok"
+    return latencies, batch_size, errors + batch_size - len(latencies)
+
+
+def run_scenario(name: str, batch_size: int, args, api: ApiServer) -> tuple:
+    if name == "single":
+        return run_single(batch_size, args)
+    if name == "multi":
+        return run_multi(batch_size, args)
+    runner = {"api-single": _api_single, "api-multi": _api_multi, "api-stream": _api_stream}[name]
+    return asyncio.run(runner(api.base_url, batch_size, args))
+
+
+def _git_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--batch-sizes", default="1,10,100,1000", help="Comma separated, e.g. 1,10,100,1000,10000")
+    parser.add_argument("--concurrency", type=int, default=32, help="Client threads/requests and max_concurrency")
+    parser.add_argument("--repeat", type=int, default=1, help="Requests per batch size for multi and api-multi")
+    parser.add_argument("--cache", action="store_true", help="Leave the generation cache enabled")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub latency in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Stub latency per completion token")
+    add_stub_arguments(parser)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<time>-<version>.json)")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="email-bench-")
+    stub = StubOpenAIServer(latency=args.latency, token_latency=args.token_latency, **stub_options(args)).start()
+    # Configure the service before its modules are imported
+    os.environ.update({
+        "OPENAI_API_BASE": stub.base_url,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "stub"),
+        "EMAIL_CACHE_ENABLED": "1" if args.cache else "0",
+        "EMAIL_CACHE_DB": os.path.join(workdir, "cache.sqlite3"),
+        "EMAIL_JOBS_DB": os.path.join(workdir, "jobs.sqlite3"),
+        "MAX_PENDING_LEADS": str(max(max(batch_sizes) * max(args.repeat, 1), 10000)),
+        "MAX_CONCURRENT_LLM_CALLS": str(args.concurrency),
+    })
+    # The client-side budget would otherwise cap throughput at the default
+    # OpenAI tier; with --rpm-limit the stub's headers resize it as usual
+    os.environ.setdefault("OPENAI_RPM_LIMIT", "100000000")
+    os.environ.setdefault("OPENAI_TPM_LIMIT", "100000000000")
+    api = ApiServer().start() if any(name.startswith("api-") for name in scenarios) else None
+
+    version = _git_version()
+    results = []
+    print(f"version {version}, stub {args.latency_dist} {args.latency * 1000:.0f} ms, concurrency {args.concurrency}")
+    print(f"{'scenario':<11} {'batch':>6} {'emails/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'peak MB':>8} {'+MB':>6} {'errors':>6} {'429s':>5}")
+    try:
+        # Warm up imports, clients and the API before measuring
+        run_scenario(scenarios[0], 1, argparse.Namespace(**{**vars(args), "repeat": 1}), api)
+        for name in scenarios:
+            for batch_size in batch_sizes:
+                requests_before, limited_before = stub.requests, stub.rate_limited
+                with RssSampler() as memory:
+                    start = time.perf_counter()
+                    latencies, emails, errors = run_scenario(name, batch_size, args, api)
+                    elapsed = time.perf_counter() - start
+                result = {
+                    "scenario": name,
+                    "batch_size": batch_size,
+                    "emails": emails,
+                    "errors": errors,
+                    "seconds": round(elapsed, 4),
+                    "throughput": round(emails / elapsed, 2),
+                    "latency": {
+                        "mean": round(statistics.mean(latencies), 4) if latencies else None,
+                        "p50": percentile(latencies, 50),
+                        "p95": percentile(latencies, 95),
+                        "p99": percentile(latencies, 99),
+                    },
+                    "peak_rss_mb": round(memory.peak, 1),
+                    "rss_growth_mb": round(memory.peak - memory.baseline, 1),
+                    "llm_requests": stub.requests - requests_before,
+                    "rate_limited": stub.rate_limited - limited_before,
+                }
+                results.append(result)
+                print(
+                    f"{name:<11} {batch_size:>6} {result['throughput']:>9.1f} "
+                    + " ".join(f"{(result['latency'][p] or 0) * 1000:>9.0f}" for p in ("p50", "p95", "p99"))
+                    + f" {result['peak_rss_mb']:>8.0f} {result['rss_growth_mb']:>6.0f} {errors:>6} {result['rate_limited']:>5}"
+                )
+    finally:
+        if api is not None:
+            api.stop()
+        stub.stop()
+
+    report = {
+        "meta": {
+            "version": version,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "llm_backend": os.getenv("EMAIL_LLM_BACKEND", "langchain"),
+            "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, "results", f"{time.strftime('%Y%m%d-%H%M%S')}-{version}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+Local OpenAI-compatible chat-completions stub used by the benchmarks
+
+Serves POST /v1/chat/completions on localhost and answers with JSON that
+matches the requested structured-output schema (response_format json_schema
+or a function tool), so the real generation code paths can run offline.
+
+Latency can follow a fixed, uniform, exponential or lognormal distribution
+with an optional slow tail, and requests can be rejected with 429s (at a
+random rate, or above a requests-per-minute limit) carrying the same
+rate-limit headers as the real API.
+
+Usage:
+    python benchmarks/stub_openai_server.py --port 8900 --latency 0.2
+    python benchmarks/stub_openai_server.py --latency 0.5 --latency-dist lognormal --rate-limit-rate 0.02
+    OPENAI_API_KEY=stub OPENAI_API_BASE=http://127.0.0.1:8900/v1 python src/app.py
+"""
+import argparse
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LEAD_ID_PATTERN = re.compile(r"""['"]lead_id['"]\s*:\s*(?:['"]([^'"]+)['"]|(\d+))""")
+LEAD_NAME_PATTERN = re.compile(r"""['"]name['"]\s*:\s*['"]([^'"]+)['"]""")
+# Number of alternative emails a variants call asks for
+VARIANTS_PATTERN = re.compile(r"^Write (\d+) versions of the email", re.M)
+# Numbered paragraphs of a fix-up call, "[1] ..."
+PARAGRAPH_PATTERN = re.compile(r"^\[(\d+)\] ", re.M)
+# Variants cycle through these (subject, opening) pairs, so a third variant
+# repeats the first and should be dropped as a near duplicate
+VARIANT_OPENINGS = [
+    ("quick idea for your team", "I was going through your profile and noticed the work your team is doing."),
+    ("saving your analysts a few hours", "Screening every inbound deal by hand gets slow once volume picks up."),
+]
+FILLER_BODY = (
+    "Hi {name},\n\n{opening} "
+    + "We help teams like yours move faster with less manual effort. " * 8
+    + "\n\nOpen to a quick chat next week?\n\nBest,\nStub Sender"
+)
+
+
+def _fake_value(schema: dict, defs: dict, lead_ids: list, state: dict):
+    """
+    Produce a value that validates against a (simplified) JSON schema
+    """
+    if "$ref" in schema:
+        return _fake_value(defs[schema["$ref"].split("/")[-1]], defs, lead_ids, state)
+    if "anyOf" in schema:
+        return _fake_value(schema["anyOf"][0], defs, lead_ids, state)
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            name: _fake_field(name, prop, defs, lead_ids, state)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        if state.get("per_lead"):
+            count = max(len(lead_ids), 1)
+        else:
+            count = max(state.get("variants") or schema.get("minItems", 1), 1)
+        return [_fake_value(schema.get("items", {}), defs, lead_ids, state) for _ in range(count)]
+    if kind == "integer":
+        return 0
+    if kind == "number":
+        return 0.0
+    if kind == "boolean":
+        return True
+    return "stub"
+
+
+def _fake_field(name: str, schema: dict, defs: dict, lead_ids: list, state: dict):
+    """
+    Produce a value for one object property, recognising the email fields
+    """
+    if name == "lead_id":
+        index = state.setdefault("lead_index", 0)
+        state["lead_index"] = index + 1
+        return lead_ids[index % len(lead_ids)] if lead_ids else "unknown"
+    # subject and body precede lead_id in the schema, so lead_index still points at this email
+    index = state.get("lead_index", 0)
+    subject, opening = VARIANT_OPENINGS[index % len(VARIANT_OPENINGS) if state.get("variants") else 0]
+    if name == "subject":
+        return subject
+    if name == "body":
+        names = state.get("names") or ["there"]
+        return FILLER_BODY.format(name=names[index % len(names)], opening=opening)
+    if name == "paragraphs":
+        return ["This paragraph was rewritten by the stub fix-up call."] * max(state.get("paragraphs", 0), 1)
+    if name in ("emails", "variants"):
+        state["per_lead"] = name == "emails"
+    return _fake_value(schema, defs, lead_ids, state)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; avoid Nagle/delayed-ACK stalls
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.stub.requests += 1
+
+        limited, rate_headers = self.server.stub.admit()
+        if limited:
+            self._send_json(429, {
+                "error": {
+                    "message": "Rate limit reached for requests (stub)",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                },
+            }, rate_headers)
+            return
+
+        delay = self.server.stub.next_latency()
+        if delay > 0:
+            time.sleep(delay)
+
+        prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+        lead_ids = list(dict.fromkeys(quoted or bare for quoted, bare in LEAD_ID_PATTERN.findall(prompt)))
+        state = {
+            "names": [name.split()[0] for name in LEAD_NAME_PATTERN.findall(prompt)],
+            "paragraphs": len(PARAGRAPH_PATTERN.findall(prompt)),
+            "variants": int(VARIANTS_PATTERN.findall(prompt)[-1]) if VARIANTS_PATTERN.search(prompt) else 0,
+        }
+        message = {"role": "assistant", "content": None}
+
+        response_format = request.get("response_format") or {}
+        tools = request.get("tools") or []
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            value = _fake_value(schema, schema.get("$defs", {}), lead_ids, state)
+            message["content"] = json.dumps(value)
+        elif tools:
+            function = tools[0]["function"]
+            schema = function["parameters"]
+            value = _fake_value(schema, schema.get("$defs", {}), lead_ids, state)
+            message["tool_calls"] = [{
+                "id": "call_stub",
+                "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(value)},
+            }]
+        else:
+            message["content"] = FILLER_BODY.format(name="there", opening=VARIANT_OPENINGS[0][1])
+
+        prompt_tokens = max(len(prompt) // 4, 1)
+        completion_tokens = len(json.dumps(message)) // 4
+        # Emulate decoding time, which grows with the length of the answer
+        if self.server.stub.token_latency > 0:
+            time.sleep(self.server.stub.token_latency * completion_tokens)
+        cached_tokens = self.server.stub.cached_prefix_tokens(request.get("messages", []))
+        payload = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+        self._send_json(200, payload, rate_headers)
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients cancelling calls (hedging, timeouts) close connections mid-answer
+        pass
+
+
+class StubOpenAIServer:
+    """
+    Run the stub in a background thread
+
+    Args:
+        host (str): Interface to listen on
+        port (int): Port to listen on; 0 picks a free one
+        latency (float): Typical seconds before answering (the mean, or the
+            median for 'lognormal')
+        token_latency (float): Extra seconds per completion token
+        latency_dist (str): 'fixed', 'uniform', 'exponential' or 'lognormal'
+        latency_spread (float): Relative spread for 'uniform' and sigma for 'lognormal'
+        slow_rate (float): Fraction of requests that take slow_latency extra seconds
+        slow_latency (float): Extra delay of the slow requests
+        rate_limit_rate (float): Fraction of requests rejected with a 429
+        rpm_limit (int): Reject requests beyond this many per minute with a 429;
+            0 disables the limit and the x-ratelimit-* headers
+        retry_after (float): Seconds advertised in Retry-After of injected 429s
+        seed (int): Seed for the latency and 429 randomness
+
+    Example:
+        with StubOpenAIServer(latency=0.1) as stub:
+            os.environ["OPENAI_API_BASE"] = stub.base_url
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        latency_dist: str = "fixed",
+        latency_spread: float = 0.5,
+        slow_rate: float = 0.0,
+        slow_latency: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        rpm_limit: int = 0,
+        retry_after: float = 0.2,
+        seed: int = None,
+    ):
+        if latency_dist not in ("fixed", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {latency_dist}")
+        self.latency = latency
+        self.token_latency = token_latency
+        self.latency_dist = latency_dist
+        self.latency_spread = latency_spread
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm_limit = rpm_limit
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self._random = random.Random(seed)
+        self._window = deque()
+        self._prefixes = set()
+        self._lock = threading.Lock()
+        self._server = _StubHTTPServer((host, port), StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def next_latency(self) -> float:
+        """
+        Draw the delay before the next answer from the configured distribution
+        """
+        with self._lock:
+            if self.latency <= 0 or self.latency_dist == "fixed":
+                delay = self.latency
+            elif self.latency_dist == "uniform":
+                delay = self._random.uniform(
+                    self.latency * (1 - self.latency_spread), self.latency * (1 + self.latency_spread)
+                )
+            elif self.latency_dist == "exponential":
+                delay = self._random.expovariate(1 / self.latency)
+            else:
+                delay = self.latency * self._random.lognormvariate(0, self.latency_spread)
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                delay += self.slow_latency
+        return max(delay, 0.0)
+
+    def admit(self) -> tuple:
+        """
+        Decide whether a request is answered or rejected with a 429
+
+        Returns:
+            tuple: (True if rate limited, rate-limit response headers)
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._window and self._window[0] <= now - 60:
+                self._window.popleft()
+            over_limit = bool(self.rpm_limit) and len(self._window) >= self.rpm_limit
+            limited = over_limit or (
+                self.rate_limit_rate > 0 and self._random.random() < self.rate_limit_rate
+            )
+            if limited:
+                self.rate_limited += 1
+            else:
+                self._window.append(now)
+            headers = {}
+            if self.rpm_limit:
+                reset = 60 - (now - self._window[0]) if self._window else 0.0
+                headers = {
+                    "x-ratelimit-limit-requests": str(self.rpm_limit),
+                    "x-ratelimit-remaining-requests": str(max(self.rpm_limit - len(self._window), 0)),
+                    "x-ratelimit-reset-requests": f"{reset:.3f}s",
+                }
+        if limited:
+            # Past the per-minute limit nothing gets through until the window moves on
+            retry_after = max(self.retry_after, reset) if over_limit else self.retry_after
+            headers["retry-after-ms"] = str(int(retry_after * 1000))
+            headers["retry-after"] = str(max(math.ceil(retry_after), 1))
+        return limited, headers
+
+    def cached_prefix_tokens(self, messages: list) -> int:
+        """
+        Emulate automatic prompt caching: a system message seen before counts as
+        cached, in 128-token increments once it is at least 1024 tokens long
+        """
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        prefix = str(messages[0].get("content", ""))
+        tokens = len(prefix) // 4
+        with self._lock:
+            seen = prefix in self._prefixes
+            self._prefixes.add(prefix)
+        if not seen or tokens < 1024:
+            return 0
+        return tokens - tokens % 128
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    """
+    Latency distribution and 429 options, shared with the benchmark scripts
+    """
+    parser.add_argument("--latency-dist", default="fixed", choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--latency-spread", type=float, default=0.5, help="Uniform spread or lognormal sigma")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests answered slowly")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="Extra seconds for slow requests")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests rejected with 429")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="Requests per minute before 429s (0 = no limit)")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="Retry-After of injected 429s in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def stub_options(args) -> dict:
+    """
+    StubOpenAIServer keyword arguments from add_stub_arguments options
+    """
+    return {
+        "latency_dist": args.latency_dist,
+        "latency_spread": args.latency_spread,
+        "slow_rate": args.slow_rate,
+        "slow_latency": args.slow_latency,
+        "rate_limit_rate": args.rate_limit_rate,
+        "rpm_limit": args.rpm_limit,
+        "retry_after": args.retry_after,
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Extra seconds per completion token")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stub = StubOpenAIServer(args.host, args.port, args.latency, args.token_latency, **stub_options(args))
+    print(f"Stub OpenAI server listening on {stub.base_url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
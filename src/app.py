@@ -1,13 +1,91 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hashlib
+import os
+import time
+from contextlib import asynccontextmanager
+import json
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware 
 from typing import List, Optional, Union
-from personalised_email import generate_email_for_single_lead, generate_email_for_multiple_leads
+from cache import get_generation_cache
+from jobs import JobManager, JobStore
+from retry import classify_error, RETRYABLE_ERRORS
+from hedging import get_hedger, hedger_stats
+from scheduler import BULK, INTERACTIVE, FairScheduler
+from singleflight import get_single_flight
+from variants import MAX_VARIANTS
+from metrics import (
+    HTTP_REQUEST_SECONDS,
+    SERVER_TIMING_ENABLED,
+    render_metrics,
+    server_timing_header,
+    stage_timer,
+    start_request_timing,
+)
+from personalised_email import (
+    MAX_PACK_SIZE,
+    MODEL_NAME,
+    agenerate_email_for_single_lead,
+    agenerate_email_variants,
+    awarmup,
+    agenerate_email_for_multiple_leads,
+    aiter_emails_for_multiple_leads,
+)
+
+# Maximum number of LLM calls in flight across all requests in this worker
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "32"))
+# Maximum number of leads accepted but not yet finished; beyond this new requests get a 503
+MAX_PENDING_LEADS = int(os.getenv("MAX_PENDING_LEADS", "10000"))
+# Load the LLM client and build the model in the background once the worker starts,
+# rather than on the first request
+WARMUP_ENABLED = os.getenv("EMAIL_WARMUP", "1") == "1"
+
+# HTTP status returned by /generate-single-email for each kind of generation failure
+ERROR_STATUS_CODES = {
+    "rate_limited": 429,
+    "timeout": 504,
+    "server_error": 502,
+    "connection": 502,
+    "parse_error": 502,
+    "rejected": 502,
+}
+
+# Shared by every request so concurrent batches cannot exceed MAX_CONCURRENT_LLM_CALLS
+# together; single-email requests are scheduled ahead of bulk work (see scheduler.FairScheduler)
+llm_scheduler = FairScheduler(MAX_CONCURRENT_LLM_CALLS)
+pending_leads = 0
+job_manager = None
+
+
+async def warmup():
+    try:
+        await awarmup()
+    except Exception as e:
+        # Not fatal: the first request does the same work and reports the error
+        print(f"Warmup failed: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global job_manager
+    # Runs while the server starts accepting requests; requests arriving first
+    # simply share the model it builds
+    warmup_task = asyncio.create_task(warmup()) if WARMUP_ENABLED else None
+    job_manager = JobManager(JobStore(), scheduler=llm_scheduler)
+    # Pick up jobs interrupted by a previous shutdown or crash
+    job_manager.resume()
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await job_manager.shutdown()
 
 app = FastAPI(
     title="Personalized Email Generation API",
     description="API for generating personalized emails based on lead and product information",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -18,6 +96,77 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+
+
+def tenant_id(request: Request) -> str:
+    """
+    Tenant the fair scheduler shares capacity between: the X-Tenant-ID header,
+    else a digest of the X-API-Key header, else 'anonymous'
+    """
+    tenant = request.headers.get("x-tenant-id")
+    if tenant:
+        return tenant
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return "key-" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return "anonymous"
+
+
+def reserve_leads(count: int):
+    """
+    Reserve room for count leads in the pending queue or reject the request
+
+    A request that could never fit gets a 413 pointing to /jobs; one that
+    only has to wait for others to finish gets a 503 with Retry-After.
+    """
+    global pending_leads
+    if count > MAX_PENDING_LEADS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_PENDING_LEADS} leads per request; submit larger batches to POST /jobs",
+        )
+    if pending_leads + count > MAX_PENDING_LEADS:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy generating emails, please retry later",
+            headers={"Retry-After": "5"},
+        )
+    pending_leads += count
+
+
+def release_leads(count: int):
+    global pending_leads
+    pending_leads -= count
+
+
+@asynccontextmanager
+async def admit_leads(count: int):
+    """
+    Hold room for count leads in the pending queue for the duration of the block
+    """
+    reserve_leads(count)
+    try:
+        yield
+    finally:
+        release_leads(count)
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse calling on_close once it is done with, whether the body
+    was streamed to the end, cut short, or never started because the client
+    left first
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
 class LeadDetails(BaseModel):
     name: str
     lead_id: str
@@ -31,58 +180,302 @@ class EmailResponse(BaseModel):
     lead_id: str
     subject: str
     body: str
+    status: Optional[str] = None
+    error_type: Optional[str] = None
+    retryable: Optional[bool] = None
+    issues: Optional[List[str]] = None
+    variant: Optional[int] = None
+    usage: Optional[dict] = None
 
 class ProductDetails(BaseModel):
     details: str
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    # Stage timers anywhere below this request add to these timings
+    timings = start_request_timing()
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Streaming responses are timed up to their first byte
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        request.method, route.path if route is not None else "unmatched", response.status_code
+    ).observe(elapsed)
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+def render_emails(results) -> JSONResponse:
+    """
+    Render emails as a JSON response, timing the serialization
+    """
+    with stage_timer("serialize", MODEL_NAME):
+        if isinstance(results, list):
+            content = [EmailResponse(**result).model_dump(exclude_none=True) for result in results]
+        else:
+            content = results
+        return JSONResponse(content)
+
 @app.post("/generate-single-email", response_model=dict)
-async def generate_single_email(lead: LeadDetails, product: ProductDetails):
+async def generate_single_email(
+    lead: LeadDetails,
+    product: ProductDetails,
+    request: Request,
+    bypass_cache: bool = Query(False, description="Always call the model, ignoring cached emails"),
+    include_usage: bool = Query(False, description="Add prompt (cached/uncached) and completion token counts"),
+    variants: Optional[int] = Query(None, ge=1, le=MAX_VARIANTS, description="Alternative emails to write in one call"),
+):
     """
     Generate a personalized email for a single lead
     
     Args:
         lead: Lead details including name, experience, education, etc.
         product: Product information and details
+        request: Its X-Tenant-ID or X-API-Key header identifies the tenant for fair scheduling
+        bypass_cache: Skip the generation cache for this request
+        include_usage: Add a 'usage' dict with token counts to each email
+        variants: Return a list of this many distinct candidate emails, e.g. for A/B tests
         
     Returns:
-        Dictionary containing subject and body of the generated email
+        Dictionary containing subject and body of the generated email, or a
+        list of them numbered by 'variant' when variants is above 1
     """
-    try:
-        # Convert Pydantic model to dict using model_dump()
-        lead_dict = lead.model_dump()
-        # Generate email
-        result = generate_email_for_single_lead(lead_dict, product.details)
-        # Ensure lead_id is included in the response
-        if 'lead_id' not in result or result['lead_id'] is None:
-            result['lead_id'] = lead.lead_id
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating email: {str(e)}")
+    async with admit_leads(1):
+        try:
+            # Convert Pydantic model to dict using model_dump()
+            lead_dict = lead.model_dump()
+            if variants is not None and variants > 1:
+                results = await agenerate_email_variants(
+                    lead_dict,
+                    product.details,
+                    variants,
+                    semaphore=llm_scheduler.lane(INTERACTIVE, tenant_id(request)),
+                    include_usage=include_usage,
+                )
+                return render_emails(results)
+            # Generate email without blocking the event loop
+            result = await agenerate_email_for_single_lead(
+                lead_dict,
+                product.details,
+                use_cache=not bypass_cache,
+                semaphore=llm_scheduler.lane(INTERACTIVE, tenant_id(request)),
+                include_usage=include_usage,
+                hedge=True,
+            )
+            # Ensure lead_id is included in the response
+            if 'lead_id' not in result or result['lead_id'] is None:
+                result['lead_id'] = lead.lead_id
+            return render_emails(result)
+        except Exception as e:
+            # Retries are exhausted by now; tell the client what failed and whether to try again
+            error_type = classify_error(e)
+            retryable = error_type in RETRYABLE_ERRORS
+            raise HTTPException(
+                status_code=ERROR_STATUS_CODES.get(error_type, 500),
+                detail={
+                    "message": f"Error generating email: {str(e)}",
+                    "lead_id": lead.lead_id,
+                    "error_type": error_type,
+                    "retryable": retryable,
+                },
+                headers={"Retry-After": "5"} if retryable else None,
+            )
 
-@app.post("/generate-multiple-emails", response_model=List[EmailResponse])
-async def generate_multiple_emails(leads: List[LeadDetails], product: ProductDetails):
+@app.post("/generate-multiple-emails", response_model=List[EmailResponse], response_model_exclude_none=True)
+async def generate_multiple_emails(
+    leads: List[LeadDetails],
+    product: ProductDetails,
+    request: Request,
+    bypass_cache: bool = Query(False, description="Always call the model, ignoring cached emails"),
+    include_usage: bool = Query(False, description="Add prompt (cached/uncached) and completion token counts"),
+    pack_size: Optional[int] = Query(
+        None, ge=0, le=MAX_PACK_SIZE, description="Leads written per LLM call (0 = server default)"
+    ),
+    variants: Optional[int] = Query(None, ge=1, le=MAX_VARIANTS, description="Alternative emails per lead, one call each"),
+):
     """
     Generate personalized emails for multiple leads
     
     Args:
         leads: List of lead details
         product: Product information and details
+        request: Its X-Tenant-ID or X-API-Key header identifies the tenant for fair scheduling
+        bypass_cache: Skip the generation cache for this request
+        include_usage: Add a 'usage' dict with token counts to each email
+        pack_size: Generate several leads' emails per LLM call to save prompt tokens
+        variants: Write this many distinct candidate emails per lead, e.g. for A/B tests
         
     Returns:
-        List of dictionaries, each containing subject and body of generated emails
+        List of dictionaries, each containing subject and body of generated emails,
+        with a per-lead 'status' so failed lead_ids can be resubmitted on their own.
+        With variants, each lead's candidates follow each other, numbered by 'variant'.
     """
-    try:
-        # Convert Pydantic models to dicts using model_dump()
-        leads_dict = [lead.model_dump() for lead in leads]
-        # Generate emails
-        results = generate_email_for_multiple_leads(leads_dict, product.details)
-        # Ensure lead_id is included in each response
-        for i, result in enumerate(results):
-            if 'lead_id' not in result or result['lead_id'] is None:
-                result['lead_id'] = leads[i].lead_id
-        return results
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with admit_leads(len(leads)):
+        try:
+            # Convert Pydantic models to dicts using model_dump()
+            leads_dict = [lead.model_dump() for lead in leads]
+            # Generate emails concurrently, sharing the worker-wide LLM call limit
+            results = await agenerate_email_for_multiple_leads(
+                leads_dict,
+                product.details,
+                semaphore=llm_scheduler.lane(BULK, tenant_id(request)),
+                use_cache=not bypass_cache,
+                include_usage=include_usage,
+                pack_size=pack_size,
+                variants=variants,
+            )
+            # Ensure lead_id is included in each response (variants already carry theirs)
+            if variants is None or variants == 1:
+                for i, result in enumerate(results):
+                    if 'lead_id' not in result or result['lead_id'] is None:
+                        result['lead_id'] = leads[i].lead_id
+            return render_emails(results)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate-multiple-emails/stream")
+async def generate_multiple_emails_stream(
+    leads: List[LeadDetails],
+    product: ProductDetails,
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+    bypass_cache: bool = Query(False, description="Always call the model, ignoring cached emails"),
+    include_usage: bool = Query(False, description="Add prompt (cached/uncached) and completion token counts"),
+):
+    """
+    Generate personalized emails for multiple leads, streaming each email as it completes
+    
+    Args:
+        leads: List of lead details
+        product: Product information and details
+        request: Its X-Tenant-ID or X-API-Key header identifies the tenant for fair scheduling
+        format: 'ndjson' for one JSON object per line, 'sse' for Server-Sent Events
+        bypass_cache: Skip the generation cache for this request
+        include_usage: Add a 'usage' dict with token counts to each email
+        
+    Returns:
+        Stream of emails in completion order, each tagged with its lead_id
+    """
+    if not leads:
+        raise HTTPException(status_code=400, detail="No leads provided in the list")
+    count = len(leads)
+    # Reserved up front so an overloaded server can still answer 503
+    reserve_leads(count)
+
+    async def stream():
+        results = aiter_emails_for_multiple_leads(
+            (lead.model_dump() for lead in leads),
+            product.details,
+            semaphore=llm_scheduler.lane(BULK, tenant_id(request)),
+            use_cache=not bypass_cache,
+            include_usage=include_usage,
+        )
+        async for result in results:
+            with stage_timer("serialize", MODEL_NAME):
+                payload = json.dumps(EmailResponse(**result).model_dump(exclude_none=True))
+            if format == "sse":
+                yield f"event: email\ndata: {payload}\n\n"
+            else:
+                yield payload + "\n"
+        if format == "sse":
+            yield "event: done\ndata: {}\n\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return ReleasingStreamingResponse(
+        stream(), lambda: release_leads(count), media_type=media_type, headers={"Cache-Control": "no-cache"}
+    )
+
+@app.post("/jobs")
+async def create_job(leads: List[LeadDetails], product: ProductDetails, request: Request):
+    """
+    Submit a large batch of leads for background generation
+    
+    Args:
+        leads: List of lead details
+        product: Product information and details
+        request: Its X-Tenant-ID or X-API-Key header identifies the tenant for fair scheduling
+        
+    Returns:
+        Dictionary with the job_id to poll, its status and total number of leads
+    """
+    if not leads:
+        raise HTTPException(status_code=400, detail="No leads provided in the list")
+    job_id = await asyncio.to_thread(
+        job_manager.store.create_job, [lead.model_dump() for lead in leads], product.details, tenant_id(request)
+    )
+    job_manager.start(job_id)
+    return {"job_id": job_id, "status": "pending", "total": len(leads)}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Progress of a background job: status and completed/failed/pending lead counts
+    """
+    job = await asyncio.to_thread(job_manager.store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.pop("product_details")
+    job.pop("tenant")
+    return job
+
+@app.get("/jobs/{job_id}/results", response_model=List[EmailResponse], response_model_exclude_none=True)
+async def get_job_results(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """
+    Emails generated so far for a background job, in input order
+    """
+    if await asyncio.to_thread(job_manager.store.get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await asyncio.to_thread(job_manager.store.results, job_id, offset, limit)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancel a background job; emails already generated stay available
+    """
+    if not await job_manager.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await get_job(job_id)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters of the generation cache
+    """
+    cache = get_generation_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/hedging/stats")
+async def hedging_stats():
+    """
+    Call latency percentiles and hedged/timed-out call counters of single-email
+    calls, plus the same for every kind of call under 'by_kind'
+    """
+    return {**get_hedger().stats(), "by_kind": hedger_stats()}
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """
+    LLM calls queued and in flight, work done and recent waits per priority class
+    """
+    return llm_scheduler.stats()
+
+@app.get("/coalescing/stats")
+async def coalescing_stats():
+    """
+    Generations started and requests that joined an identical in-flight generation
+    """
+    return get_single_flight().stats()
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Stage latencies, token usage, retries and cache lookups in the Prometheus text format
+    """
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
 
 @app.get("/health")
 async def health_check():
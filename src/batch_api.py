@@ -0,0 +1,384 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+from cache import get_generation_cache
+from llm_client import get_http_client, response_format_for
+from personalised_email import (
+    EmailResponse,
+    MAX_TOKENS,
+    DEFAULT_MAX_CONCURRENCY,
+    MODEL_NAME,
+    TEMPERATURE,
+    avalidate_email,
+    email_cache_key,
+    error_email,
+    prepare_messages,
+    run_sync,
+)
+from validation import LLM_REPAIR_ENABLED
+
+# Which backend batch mode submits to: 'openai' or 'local'
+BATCH_BACKEND = os.getenv("EMAIL_BATCH_BACKEND", "openai")
+# Where request/result JSONL files (and local batches) are written
+BATCH_DIR = os.getenv("EMAIL_BATCH_DIR", "email_batches")
+BATCH_POLL_INTERVAL = float(os.getenv("EMAIL_BATCH_POLL_INTERVAL", "30"))
+
+# Batch states after which polling stops
+FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+# The lead's name in the lead details rendered into a request's prompt
+_LEAD_NAME = re.compile(r'"(?i:name)"\s*:\s*"([^"]+)"')
+# Body of placeholder_responder's emails: a greeting, about 110 words of text and a sign-off
+PLACEHOLDER_BODY = (
+    "Hi {name},\n\n"
+    "This email was written by the local batch backend instead of the model, so the "
+    "batch path can be tried out end to end without an API key or any cost. It is "
+    "long enough to pass the same checks as a real email, which keeps the results "
+    "comparable with what the Batch API would return.\n\n"
+    "A real email would open with something specific about your role and company, "
+    "explain the problem the product solves for teams like yours, and back that up "
+    "with a concrete result. Here every lead gets the same text apart from the "
+    "greeting, which still uses your name.\n\n"
+    "Would a short call next week to walk through the real thing be useful?\n\n"
+    "Best,\nLocal batch"
+)
+
+
+def build_batch_request(custom_id: str, lead_details: dict, product_details: str) -> dict:
+    """
+    One OpenAI Batch API request line for a lead, using the interactive prompt
+    """
+    messages, _ = prepare_messages(lead_details, product_details)
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": MODEL_NAME,
+            "messages": messages,
+            "temperature": TEMPERATURE,
+            "max_tokens": MAX_TOKENS,
+            "response_format": response_format_for(EmailResponse),
+        },
+    }
+
+
+def write_batch_requests(path: str, leads: list, product_details: str) -> int:
+    """
+    Write the requests for (index, lead) pairs to a JSONL file, one line per lead
+
+    Returns:
+        int: Number of requests written
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8") as file:
+        for index, lead in leads:
+            request = build_batch_request(f"{index}:{lead.get('lead_id')}", lead, product_details)
+            file.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def iter_batch_results(path: str):
+    """
+    Stream a Batch API output (or error) file
+
+    Yields:
+        tuple: (input index, EmailResponse dict or the Exception for that line, usage dict)
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            index = int(record["custom_id"].split(":", 1)[0])
+            response = record.get("response") or {}
+            body = response.get("body") or {}
+            try:
+                if record.get("error") or response.get("status_code") != 200:
+                    raise RuntimeError(
+                        (record.get("error") or {}).get("message")
+                        or (body.get("error") or {}).get("message")
+                        or f"Batch request failed with status {response.get('status_code')}"
+                    )
+                content = body["choices"][0]["message"]["content"]
+                result = EmailResponse.model_validate_json(content).model_dump()
+            except Exception as e:
+                yield index, e, {}
+                continue
+            usage = body.get("usage") or {}
+            yield index, result, {
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "cached_prompt_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0),
+            }
+
+
+class OpenAIBatchBackend:
+    """
+    Submit request files to the OpenAI Batch API
+    """
+
+    def __init__(self, workdir: str = BATCH_DIR, client=None):
+        import openai
+
+        self.workdir = workdir
+        self.client = client or openai.OpenAI(http_client=get_http_client())
+
+    def submit(self, requests_path: str) -> str:
+        with open(requests_path, "rb") as file:
+            uploaded = self.client.files.create(file=file, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> dict:
+        """
+        Current state of a batch; once it has finished the result files are downloaded locally
+
+        Expired and cancelled batches still have an output file with the
+        requests that did finish, so those are downloaded too.
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        state = {"status": batch.status, "output_path": None, "error_path": None}
+        if batch.status in FINAL_STATES:
+            for file_id, key in ((batch.output_file_id, "output_path"), (batch.error_file_id, "error_path")):
+                if file_id:
+                    path = os.path.join(self.workdir, f"{batch_id}-{key.split('_')[0]}.jsonl")
+                    with self.client.files.with_streaming_response.content(file_id) as response:
+                        response.stream_to_file(path)
+                    state[key] = path
+        return state
+
+
+def placeholder_responder(body: dict, custom_id: str) -> dict:
+    """
+    Offline stand-in for the model used by LocalBatchBackend
+
+    Returns a chat.completion body whose content is a fixed email that greets
+    the lead by name and passes validation, so the batch path can be
+    exercised end to end without an API key.
+    """
+    match = _LEAD_NAME.search(body["messages"][-1]["content"])
+    email = {
+        "subject": "Quick idea for your team",
+        "body": PLACEHOLDER_BODY.format(name=match.group(1).split()[0] if match else "there"),
+        "lead_id": custom_id.split(":", 1)[1],
+    }
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "model": body.get("model"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": json.dumps(email)},
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the Batch API
+
+    Batches live in workdir/<batch_id>/; the first poll answers every request
+    line with responder(body, custom_id) and writes an output file in the
+    Batch API format.
+
+    Args:
+        workdir (str): Directory holding local batches
+        responder: Callable (request body, custom_id) -> chat.completion body
+    """
+
+    def __init__(self, workdir: str = BATCH_DIR, responder=placeholder_responder):
+        self.workdir = workdir
+        self.responder = responder
+
+    def submit(self, requests_path: str) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex}"
+        batch_dir = os.path.join(self.workdir, batch_id)
+        os.makedirs(batch_dir)
+        shutil.copyfile(requests_path, os.path.join(batch_dir, "input.jsonl"))
+        return batch_id
+
+    def poll(self, batch_id: str) -> dict:
+        batch_dir = os.path.join(self.workdir, batch_id)
+        output_path = os.path.join(batch_dir, "output.jsonl")
+        if not os.path.exists(output_path):
+            with open(os.path.join(batch_dir, "input.jsonl"), encoding="utf-8") as requests, \
+                    open(output_path + ".tmp", "w", encoding="utf-8") as output:
+                for line in requests:
+                    request = json.loads(line)
+                    record = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"], "error": None}
+                    try:
+                        record["response"] = {
+                            "status_code": 200,
+                            "body": self.responder(request["body"], request["custom_id"]),
+                        }
+                    except Exception as e:
+                        record["response"] = None
+                        record["error"] = {"code": "local_error", "message": str(e)}
+                    output.write(json.dumps(record) + "\n")
+            os.replace(output_path + ".tmp", output_path)
+        return {"status": "completed", "output_path": output_path, "error_path": None}
+
+
+def _run_state_path(workdir: str, to_send: list, product_details: str) -> str:
+    """
+    File recording the batch submitted for these (index, lead) pairs
+    """
+    keys = "\n".join(f"{index}:{email_cache_key(lead, product_details)}" for index, lead in to_send)
+    return os.path.join(workdir, f"run-{hashlib.sha256(keys.encode('utf-8')).hexdigest()[:16]}.json")
+
+
+def load_run_state(path: str) -> dict:
+    """
+    The batch a previous, interrupted run submitted, or None
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_run_state(path: str, batch_id: str, requests_path: str, to_send: list):
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump({
+            "batch_id": batch_id,
+            "requests_path": requests_path,
+            "requests": [[index, lead.get("lead_id")] for index, lead in to_send],
+        }, file)
+    os.replace(path + ".tmp", path)
+
+
+def get_batch_backend(name: str = BATCH_BACKEND, workdir: str = BATCH_DIR):
+    if name == "local":
+        return LocalBatchBackend(workdir)
+    if name == "openai":
+        return OpenAIBatchBackend(workdir)
+    raise ValueError(f"Unknown batch backend: {name}")
+
+
+def run_email_batch(
+    leads_list: list,
+    product_details: str,
+    backend=None,
+    workdir: str = BATCH_DIR,
+    poll_interval: float = BATCH_POLL_INTERVAL,
+    use_cache: bool = True,
+    include_usage: bool = False,
+    llm_repair: bool = None,
+) -> list:
+    """
+    Generate emails for multiple leads through a Batch API backend
+
+    Writes one request per lead to a JSONL file, submits it, polls until the
+    batch finishes and streams the result file back, matching lines to leads
+    by their custom_id ('<input index>:<lead_id>'). Leads already in the
+    generation cache are not sent. The batch id and the input index of each
+    request are kept in workdir until the results are in, so running the
+    same leads again after a crash picks the submitted batch up instead of
+    paying for a new one. Results are validated and repaired like
+    interactive ones before they are cached, except that the local backend
+    makes no fix-up calls by default, so it stays offline.
+
+    Args:
+        leads_list (list): List of lead detail dictionaries
+        product_details (str): Product documentation/information
+        backend: OpenAIBatchBackend, LocalBatchBackend or anything with the
+            same submit/poll methods (defaults to EMAIL_BATCH_BACKEND)
+        workdir (str): Directory for the request and result files
+        poll_interval (float): Seconds between status checks
+        use_cache (bool): Serve and store results in the generation cache
+        include_usage (bool): Add a 'usage' dict with token counts to each result
+        llm_repair (bool): Send emails local repair cannot fix to a fix-up
+            LLM call; defaults to EMAIL_LLM_REPAIR, or False with LocalBatchBackend
+
+    Returns:
+        list: List of dictionaries, each containing 'subject', 'body', and 'lead_id' of the email
+    """
+    if not leads_list:
+        raise ValueError("No leads provided in the list")
+    os.makedirs(workdir, exist_ok=True)
+    backend = backend or get_batch_backend(workdir=workdir)
+    if llm_repair is None:
+        llm_repair = LLM_REPAIR_ENABLED and not isinstance(backend, LocalBatchBackend)
+    cache = get_generation_cache() if use_cache else None
+
+    results = [None] * len(leads_list)
+    to_send = []
+    for index, lead in enumerate(leads_list):
+        cached = cache.get(email_cache_key(lead, product_details)) if cache is not None else None
+        if cached is not None:
+            cached["status"] = "ok"
+            if include_usage:
+                cached["usage"] = {"cache_hit": True}
+            results[index] = cached
+        else:
+            to_send.append((index, lead))
+    if not to_send:
+        return results
+
+    state_path = _run_state_path(workdir, to_send, product_details)
+    run_state = load_run_state(state_path)
+    if run_state is not None:
+        batch_id = run_state["batch_id"]
+        print(f"Resuming batch {batch_id}")
+    else:
+        requests_path = os.path.join(workdir, f"requests-{uuid.uuid4().hex}.jsonl")
+        write_batch_requests(requests_path, to_send, product_details)
+        batch_id = backend.submit(requests_path)
+        save_run_state(state_path, batch_id, requests_path, to_send)
+        print(f"Submitted batch {batch_id}; rerun with the same leads to resume it")
+
+    state = backend.poll(batch_id)
+    while state["status"] not in FINAL_STATES:
+        time.sleep(poll_interval)
+        state = backend.poll(batch_id)
+
+    answers = []
+    for key in ("output_path", "error_path"):
+        if not state.get(key):
+            continue
+        for index, result, usage in iter_batch_results(state[key]):
+            if isinstance(result, Exception):
+                results[index] = error_email(leads_list[index], result)
+            else:
+                answers.append((index, result, usage))
+
+    async def validate_all():
+        # Fix-up calls for the emails that need one share the usual concurrency limit
+        semaphore = asyncio.Semaphore(DEFAULT_MAX_CONCURRENCY)
+        return await asyncio.gather(*(
+            avalidate_email(result, leads_list[index], product_details, semaphore, llm_repair=llm_repair)
+            for index, result, _ in answers
+        ))
+
+    validated = run_sync(validate_all()) if answers else []
+    for (index, _, usage), (result, repair_usage) in zip(answers, validated):
+        # Emails with problems left are not kept, so the next request tries again
+        if cache is not None and "issues" not in result:
+            cache.set(email_cache_key(leads_list[index], product_details), result)
+        result["status"] = "ok"
+        if include_usage:
+            result["usage"] = {"cache_hit": False, **usage}
+            if repair_usage is not None:
+                result["usage"]["repair"] = repair_usage
+        results[index] = result
+
+    # Leads missing from the output (failed or expired batch) get error dicts
+    for index, lead in to_send:
+        if results[index] is None:
+            results[index] = error_email(lead, RuntimeError(f"Batch {batch_id} ended as {state['status']}"))
+    os.remove(state_path)
+    return results
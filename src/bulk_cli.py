@@ -0,0 +1,243 @@
+"""
+Generate emails for a CSV or XLSX file of leads
+
+Leads are streamed row by row (openpyxl read-only mode for XLSX), generated
+in chunks and appended to the output as each chunk finishes, so memory use
+does not grow with the size of the sheet. Progress is checkpointed next to
+the output file; re-running the same command resumes after the last
+finished chunk. Rows whose lead failed after retries have status 'error'
+and an error_type; their leads can be run again on their own.
+
+Usage:
+    python src/bulk_cli.py leads.xlsx emails.csv --product-file product.txt
+    python src/bulk_cli.py leads.csv emails.jsonl --product "InvestorBase ..." --map name="Full Name"
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+
+from personalised_email import DEFAULT_MAX_CONCURRENCY, agenerate_email_for_multiple_leads
+
+# LeadDetails fields and the column headers accepted for each (compared lowercased, '_' for spaces)
+FIELD_ALIASES = {
+    "name": ["name", "full_name", "lead_name"],
+    "lead_id": ["lead_id", "id", "leadid"],
+    "experience": ["experience", "current_experience", "title", "job_title"],
+    "education": ["education"],
+    "company": ["company", "company_name", "organization"],
+    "company_overview": ["company_overview", "company_description", "about_company"],
+    "company_industry": ["company_industry", "industry"],
+}
+# status, error_type and retryable tell the failed rows apart so their leads can be resubmitted
+OUTPUT_FIELDS = ["lead_id", "subject", "body", "status", "error_type", "retryable"]
+
+
+def _normalise(header) -> str:
+    return str(header or "").strip().lower().replace(" ", "_").replace("-", "_")
+
+
+def build_column_map(headers: list, overrides: dict) -> dict:
+    """
+    Map each LeadDetails field to a column index of the input
+
+    Args:
+        headers (list): Header row of the input
+        overrides (dict): field -> header name given with --map
+
+    Returns:
+        dict: field -> column index for every field found
+    """
+    positions = {_normalise(header): index for index, header in enumerate(headers)}
+    column_map = {}
+    for field, aliases in FIELD_ALIASES.items():
+        if field in overrides:
+            header = _normalise(overrides[field])
+            if header not in positions:
+                raise ValueError(f"Column '{overrides[field]}' for {field} not found in input")
+            column_map[field] = positions[header]
+            continue
+        for alias in aliases:
+            if alias in positions:
+                column_map[field] = positions[alias]
+                break
+    return column_map
+
+
+def iter_rows(path: str):
+    """
+    Stream the rows of a CSV or XLSX file as lists, header row first
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as file:
+            yield from csv.reader(file)
+    elif extension in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"Unsupported input format: {extension}")
+
+
+def iter_leads(path: str, overrides: dict, skip: int = 0):
+    """
+    Yield (row number, lead dict) for the data rows of the input, skipping the first skip rows
+
+    Rows with nothing in any mapped column (blank lines, ',,' rows, the empty
+    trailing rows of a sheet) are left out. A lead without an id gets
+    'row-<row number>', which cannot clash with a numeric id from the file.
+    """
+    rows = iter_rows(path)
+    headers = next(rows, None)
+    if headers is None:
+        return
+    column_map = build_column_map(list(headers), overrides)
+    if "name" not in column_map:
+        raise ValueError("Input has no name column; use --map name=<column>")
+    for number, row in enumerate(rows, start=1):
+        if number <= skip:
+            continue
+        lead = {}
+        for field in FIELD_ALIASES:
+            index = column_map.get(field)
+            value = row[index] if index is not None and index < len(row) else None
+            lead[field] = "" if value is None else str(value).strip()
+        if not any(lead.values()):
+            continue
+        if not lead["lead_id"]:
+            lead["lead_id"] = f"row-{number}"
+        yield number, lead
+
+
+class ResultWriter:
+    """
+    Append results to a CSV or JSONL file; XLSX output is staged as JSONL and
+    converted once the run completes, since XLSX files cannot be appended to
+    """
+
+    def __init__(self, path: str, resume: bool):
+        self.path = path
+        self.format = os.path.splitext(path)[1].lower().lstrip(".")
+        if self.format not in ("csv", "jsonl", "xlsx"):
+            raise ValueError(f"Unsupported output format: .{self.format}")
+        self.staging_path = path + ".partial.jsonl" if self.format == "xlsx" else path
+        mode = "a" if resume and os.path.exists(self.staging_path) else "w"
+        self._file = open(self.staging_path, mode, newline="", encoding="utf-8")
+        self._csv = None
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS, extrasaction="ignore")
+            if mode == "w":
+                self._csv.writeheader()
+
+    def write(self, results: list):
+        for result in results:
+            if self._csv is not None:
+                self._csv.writerow(result)
+            else:
+                self._file.write(json.dumps({k: result.get(k) for k in OUTPUT_FIELDS}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self, finished: bool):
+        self._file.close()
+        if finished and self.format == "xlsx":
+            from openpyxl import Workbook
+
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet("emails")
+            sheet.append(OUTPUT_FIELDS)
+            with open(self.staging_path, encoding="utf-8") as staged:
+                for line in staged:
+                    record = json.loads(line)
+                    sheet.append([record.get(k) for k in OUTPUT_FIELDS])
+            workbook.save(self.path)
+            os.remove(self.staging_path)
+
+
+def load_checkpoint(path: str, input_path: str) -> int:
+    """
+    Number of input rows already written for this input, or 0 to start over
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as file:
+        checkpoint = json.load(file)
+    if checkpoint.get("input") != os.path.abspath(input_path):
+        return 0
+    return checkpoint.get("rows_done", 0)
+
+
+def save_checkpoint(path: str, input_path: str, rows_done: int):
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump({"input": os.path.abspath(input_path), "rows_done": rows_done}, file)
+    os.replace(path + ".tmp", path)
+
+
+async def run(args) -> int:
+    if args.product_file:
+        with open(args.product_file, encoding="utf-8") as file:
+            product_details = file.read()
+    else:
+        product_details = args.product
+
+    overrides = dict(item.split("=", 1) for item in args.map)
+    checkpoint_path = args.output + ".checkpoint.json"
+    skip = 0 if args.no_resume else load_checkpoint(checkpoint_path, args.input)
+    if skip:
+        print(f"Resuming after row {skip}")
+
+    writer = ResultWriter(args.output, resume=skip > 0)
+    rows_done = skip
+    finished = False
+    try:
+        chunk, last_row = [], skip
+        for number, lead in iter_leads(args.input, overrides, skip):
+            chunk.append(lead)
+            last_row = number
+            if len(chunk) >= args.chunk_size:
+                writer.write(await agenerate_email_for_multiple_leads(chunk, product_details, args.concurrency))
+                rows_done = last_row
+                save_checkpoint(checkpoint_path, args.input, rows_done)
+                print(f"Processed {rows_done} rows")
+                chunk = []
+        if chunk:
+            writer.write(await agenerate_email_for_multiple_leads(chunk, product_details, args.concurrency))
+            rows_done = last_row
+            save_checkpoint(checkpoint_path, args.input, rows_done)
+        finished = True
+    finally:
+        writer.close(finished)
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"Done: {rows_done} rows written to {args.output}")
+    return 0
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV or XLSX file of leads, header row first")
+    parser.add_argument("output", help="Output file: .csv, .jsonl or .xlsx")
+    product = parser.add_mutually_exclusive_group(required=True)
+    product.add_argument("--product", help="Product details text")
+    product.add_argument("--product-file", help="File containing the product details")
+    parser.add_argument(
+        "--map", action="append", default=[], metavar="FIELD=COLUMN",
+        help="Read a lead field from a differently named column (repeatable)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=200, help="Leads generated per checkpoint")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--no-resume", action="store_true", help="Ignore any checkpoint and start over")
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Generation cache settings
+CACHE_ENABLED = os.getenv("EMAIL_CACHE_ENABLED", "1") == "1"
+CACHE_MEMORY_ENTRIES = int(os.getenv("EMAIL_CACHE_SIZE", "1024"))
+CACHE_DISK_ENTRIES = int(os.getenv("EMAIL_CACHE_DISK_SIZE", "100000"))
+CACHE_TTL = float(os.getenv("EMAIL_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_DB_PATH = os.getenv("EMAIL_CACHE_DB", "email_cache.sqlite3")
+
+
+def cache_key(lead_details: dict, product_details: str, prompt_version: str, model: str, temperature: float) -> str:
+    """
+    Content-addressed key for one generation
+
+    The lead dict is serialised canonically (sorted keys, fixed separators) so
+    the same lead re-sent with its fields in another order maps to the same key.
+    """
+    payload = json.dumps(
+        {
+            "lead": lead_details,
+            "product": product_details,
+            "prompt_version": prompt_version,
+            "model": model,
+            "temperature": temperature,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Two-tier cache of generated emails
+
+    A bounded in-memory LRU sits in front of a SQLite table on local disk.
+    Entries expire after ttl seconds in both tiers; the disk tier keeps at most
+    max_disk_entries rows, dropping the least recently written first.
+
+    The disk tier may be shared with other worker processes, whose writes can
+    hold its lock for a while, so aget and aset only touch the in-memory tier
+    on the event loop and read and write the disk tier on a thread of their own.
+
+    Args:
+        max_entries (int): Size of the in-memory LRU tier
+        ttl (float): Seconds an entry stays valid
+        path (str): SQLite file for the disk tier; None keeps the cache in memory only
+        max_disk_entries (int): Size of the disk tier
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MEMORY_ENTRIES,
+        ttl: float = CACHE_TTL,
+        path: str = CACHE_DB_PATH,
+        max_disk_entries: int = CACHE_DISK_ENTRIES,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+        self._writes_since_prune = 0
+        self._conn = None
+        self._executor = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS generations_created ON generations (created_at)")
+            self._conn.commit()
+            # Disk reads and writes are serialised by _disk_lock anyway, so one thread is enough
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache")
+
+    def get(self, key: str) -> dict:
+        """
+        Return a copy of the cached value for key, or None on a miss
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._conn is not None:
+            value = self._get_disk(key, now)
+        return value
+
+    async def aget(self, key: str) -> dict:
+        """
+        get for callers on the event loop
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._conn is not None:
+            value = await asyncio.get_running_loop().run_in_executor(self._executor, self._get_disk, key, now)
+        return value
+
+    def set(self, key: str, value: dict):
+        expires_at, value = self._set_memory(key, value)
+        if self._conn is not None:
+            self._set_disk(key, expires_at, value)
+
+    async def aset(self, key: str, value: dict):
+        """
+        set for callers on the event loop
+        """
+        expires_at, value = self._set_memory(key, value)
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._set_disk, key, expires_at, value)
+
+    def _get_memory(self, key: str, now: float) -> dict:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return dict(value)
+                del self._memory[key]
+            if self._conn is None:
+                self._counters["misses"] += 1
+            return None
+
+    def _get_disk(self, key: str, now: float) -> dict:
+        with self._disk_lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM generations WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+        with self._lock:
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self._counters["disk_hits"] += 1
+            return dict(value)
+
+    def _set_memory(self, key: str, value: dict) -> tuple:
+        expires_at = time.time() + self.ttl
+        value = dict(value)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self._counters["sets"] += 1
+        return expires_at, value
+
+    def _set_disk(self, key: str, expires_at: float, value: dict):
+        with self._disk_lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), time.time(), expires_at),
+                )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 1000:
+                self._prune_disk()
+
+    def _remember(self, key: str, expires_at: float, value: dict):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _prune_disk(self):
+        """
+        Drop expired rows and trim the disk tier to max_disk_entries
+        """
+        self._writes_since_prune = 0
+        with self._conn:
+            self._conn.execute("DELETE FROM generations WHERE expires_at <= ?", (time.time(),))
+            self._conn.execute(
+                "DELETE FROM generations WHERE key IN ("
+                "SELECT key FROM generations ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._conn is not None:
+            with self._disk_lock, self._conn:
+                self._conn.execute("DELETE FROM generations")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+_generation_cache = None
+_generation_cache_lock = threading.Lock()
+
+
+def get_generation_cache() -> GenerationCache:
+    """
+    Return the process-wide generation cache, or None if EMAIL_CACHE_ENABLED is off
+    """
+    global _generation_cache
+    if not CACHE_ENABLED:
+        return None
+    with _generation_cache_lock:
+        if _generation_cache is None:
+            _generation_cache = GenerationCache()
+        return _generation_cache
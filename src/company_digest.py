@@ -0,0 +1,100 @@
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+from token_budget import clean_field, count_tokens
+
+# Token budget of the condensed company overview carried by each lead prompt
+COMPANY_DIGEST_TOKENS = int(os.getenv("EMAIL_COMPANY_DIGEST_TOKENS", "80"))
+
+# Lead fields describing the company rather than the person
+COMPANY_FIELDS = {"company", "company_overview", "company_industry"}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or our that the "
+    "their to we with you your this which who".split()
+)
+
+
+def _field_key(field: str) -> str:
+    return field.strip().lower().replace(" ", "_")
+
+
+def split_company_fields(lead_details: dict) -> tuple:
+    """
+    Split a lead into (company fields keyed by normalised name, remaining person fields)
+    """
+    company, person = {}, {}
+    for field, value in lead_details.items():
+        key = _field_key(field)
+        if key in COMPANY_FIELDS:
+            company[key] = value
+        else:
+            person[field] = value
+    return company, person
+
+
+def company_key(lead_details: dict) -> tuple:
+    """
+    Grouping key for leads at the same company
+    """
+    company, _ = split_company_fields(lead_details)
+    return (
+        str(company.get("company", "")).strip().lower(),
+        str(company.get("company_overview", "")),
+    )
+
+
+def condense_overview(overview: str, budget: int = COMPANY_DIGEST_TOKENS) -> str:
+    """
+    Extractive summary of a company overview within budget tokens
+
+    Keeps the opening sentence (usually what the company does), then the
+    sentences whose words recur most across the overview, in original order.
+    """
+    overview = clean_field(overview)
+    if count_tokens(overview) <= budget:
+        return overview
+    sentences = [s.strip() for s in _SENTENCE_END.split(overview.replace("\n", " ")) if s.strip()]
+    frequencies = Counter(
+        word for word in _WORD.findall(overview.lower()) if word not in _STOPWORDS
+    )
+
+    def score(sentence: str) -> float:
+        words = [w for w in _WORD.findall(sentence.lower()) if w not in _STOPWORDS]
+        return sum(frequencies[w] for w in words) / (len(words) + 1)
+
+    chosen = {0}
+    used = count_tokens(sentences[0])
+    for index in sorted(range(1, len(sentences)), key=lambda i: score(sentences[i]), reverse=True):
+        cost = count_tokens(sentences[index])
+        if used + cost <= budget:
+            chosen.add(index)
+            used += cost
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+@lru_cache(maxsize=4096)
+def _company_digest(company: str, industry: str, overview: str) -> str:
+    lines = []
+    if company:
+        lines.append(f"Name: {company}")
+    if industry:
+        lines.append(f"Industry: {industry}")
+    if overview:
+        lines.append(f"Overview: {condense_overview(overview)}")
+    return "\n".join(lines)
+
+
+def company_digest(company_fields: dict) -> str:
+    """
+    Compact description of a lead's company, computed once per distinct company
+    """
+    return _company_digest(
+        str(company_fields.get("company", "")).strip(),
+        str(company_fields.get("company_industry", "")).strip(),
+        str(company_fields.get("company_overview", "")).strip(),
+    )
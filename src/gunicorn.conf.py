@@ -0,0 +1,60 @@
+"""
+Gunicorn settings for serving the API with uvicorn workers
+
+Run from src/:
+    gunicorn -c gunicorn.conf.py app:app
+    EMAIL_WORKERS=4 gunicorn -c gunicorn.conf.py app:app
+
+With preload (the default) the master imports the app and the LLM client
+libraries once and forks workers from it, so each worker starts without
+importing them again and shares their memory with its siblings.
+
+With several workers they share one rate-limit budget for the API key
+(OPENAI_RATE_LIMIT_DB) and their Prometheus metrics (PROMETHEUS_MULTIPROC_DIR).
+The generation cache and job store are SQLite files every worker opens
+anyway. All of this assumes the workers run on one host.
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("EMAIL_BIND", "0.0.0.0:8001")
+workers = int(os.getenv("EMAIL_WORKERS", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("EMAIL_PRELOAD", "1") == "1"
+# Leave a worker longer than the LLM retry deadline before restarting it
+timeout = int(os.getenv("EMAIL_WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("EMAIL_GRACEFUL_TIMEOUT", "30"))
+
+if workers > 1:
+    # Set before the app is imported, since both are read at import time
+    os.environ.setdefault("OPENAI_RATE_LIMIT_DB", "rate_limit.sqlite3")
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "email_api_metrics"))
+
+
+def on_starting(server):
+    # Start every deployment from a fresh budget and empty metrics
+    if os.getenv("OPENAI_RATE_LIMIT_DB"):
+        from rate_limiter import reset_shared_budget
+
+        reset_shared_budget(os.environ["OPENAI_RATE_LIMIT_DB"])
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
+
+
+def when_ready(server):
+    # Runs in the master before the workers are forked. Only modules are
+    # imported here: clients and event loops must be created after the fork.
+    if preload_app:
+        import llm_client
+
+        llm_client.preload()
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,187 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+# Deadline for a single LLM call; a call still running after this is cancelled
+# and counts as a timeout (which retry.aretry may retry)
+CALL_TIMEOUT = float(os.getenv("EMAIL_CALL_TIMEOUT", "30"))
+# Hedge interactive calls: start a duplicate call once the first one is slower
+# than HEDGE_PERCENTILE of recent calls, and keep whichever answers first
+HEDGE_ENABLED = os.getenv("EMAIL_HEDGE_ENABLED", "1") == "1"
+HEDGE_PERCENTILE = float(os.getenv("EMAIL_HEDGE_PERCENTILE", "95"))
+# At most this fraction of recent calls may be hedged, bounding the extra cost
+HEDGE_MAX_RATE = float(os.getenv("EMAIL_HEDGE_MAX_RATE", "0.05"))
+# Number of recent calls the latency percentile and hedge rate are taken over
+HEDGE_WINDOW = int(os.getenv("EMAIL_HEDGE_WINDOW", "500"))
+# No hedging until this many latencies have been observed
+HEDGE_MIN_SAMPLES = int(os.getenv("EMAIL_HEDGE_MIN_SAMPLES", "20"))
+
+
+class Hedger:
+    """
+    Run LLM calls under a deadline, hedging the slow ones
+
+    Latencies of recent successful calls are kept in a rolling window. A
+    hedged call waits up to the window's HEDGE_PERCENTILE latency; if no
+    answer has arrived by then and fewer than max_rate of the window's calls
+    were hedged, an identical second call is started and the first of the two
+    to succeed wins. The loser is cancelled.
+
+    Args:
+        percentile (float): Latency percentile (0-100) after which a call is hedged
+        max_rate (float): Maximum fraction of calls that may be hedged
+        window (int): Number of recent calls tracked
+        min_samples (int): Latencies needed before the percentile is trusted
+    """
+
+    def __init__(
+        self,
+        percentile: float = HEDGE_PERCENTILE,
+        max_rate: float = HEDGE_MAX_RATE,
+        window: int = HEDGE_WINDOW,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+    ):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._sorted = []
+        self._hedged = deque(maxlen=window)
+        self._counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _record(self, latency: float = None, hedged: bool = False):
+        with self._lock:
+            self._counters["calls"] += 1
+            self._hedged.append(hedged)
+            if latency is None:
+                return
+            if len(self._latencies) == self._latencies.maxlen:
+                oldest = self._latencies[0]
+                del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+            self._latencies.append(latency)
+            bisect.insort(self._sorted, latency)
+
+    def latency_percentile(self, percentile: float) -> float:
+        """
+        Latency at the given percentile of the window, or None with too few samples
+        """
+        with self._lock:
+            if len(self._sorted) < self.min_samples:
+                return None
+            index = min(int(len(self._sorted) * percentile / 100), len(self._sorted) - 1)
+            return self._sorted[index]
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            return sum(self._hedged) < self.max_rate * max(len(self._hedged), 1)
+
+    async def run(self, call, timeout: float = CALL_TIMEOUT, hedge: bool = HEDGE_ENABLED, hedge_call=None):
+        """
+        Await call() within timeout seconds, hedging it if it runs slow
+
+        Args:
+            call: Coroutine function making the LLM call
+            timeout (float): Deadline for the call (and its hedge) in seconds
+            hedge (bool): Allow a hedged second call
+            hedge_call: Coroutine function for the second call; defaults to call
+
+        Returns:
+            The result of whichever call succeeded first
+
+        Raises:
+            asyncio.TimeoutError: Neither call finished within timeout
+        """
+        start = time.monotonic()
+        delay = self.latency_percentile(self.percentile) if hedge else None
+        if delay is None or delay >= timeout:
+            try:
+                result = await asyncio.wait_for(call(), timeout)
+            except asyncio.TimeoutError:
+                self._count("timeouts")
+                self._record()
+                raise
+            self._record(time.monotonic() - start)
+            return result
+
+        first = asyncio.ensure_future(call())
+        tasks = {first}
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._may_hedge():
+                hedged = True
+                self._count("hedged")
+                tasks.add(asyncio.ensure_future((hedge_call or call)()))
+
+            error = None
+            while tasks:
+                remaining = timeout - (time.monotonic() - start)
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self._count("timeouts")
+                    self._record(hedged=hedged)
+                    raise asyncio.TimeoutError(f"LLM call did not finish within {timeout}s")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self._count("hedge_wins")
+                        self._record(time.monotonic() - start, hedged)
+                        return task.result()
+                    error = task.exception()
+            # Every call failed: surface the last error
+            self._record(hedged=hedged)
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["p50_latency"] = self.latency_percentile(50)
+        stats["hedge_delay"] = self.latency_percentile(self.percentile)
+        return stats
+
+
+# Kinds of LLM call with latencies of their own: one email, a pack of emails,
+# several variants of one email, or a fix-up of a few paragraphs
+SINGLE_CALL = "single"
+PACKED_CALL = "packed"
+VARIANTS_CALL = "variants"
+REPAIR_CALL = "repair"
+
+_hedgers = {}
+_hedger_lock = threading.Lock()
+
+
+def get_hedger(kind: str = SINGLE_CALL) -> Hedger:
+    """
+    Return the process-wide hedger for one kind of call
+
+    Each kind keeps its own latency window, so slow packed calls do not
+    raise the hedge delay of single-email calls, and quick fix-up calls do
+    not lower it.
+    """
+    with _hedger_lock:
+        if kind not in _hedgers:
+            _hedgers[kind] = Hedger()
+        return _hedgers[kind]
+
+
+def hedger_stats() -> dict:
+    """
+    Stats of every hedger created so far, by kind of call
+    """
+    with _hedger_lock:
+        hedgers = dict(_hedgers)
+    return {kind: hedger.stats() for kind, hedger in hedgers.items()}
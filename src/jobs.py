@@ -0,0 +1,312 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from personalised_email import DEFAULT_MAX_CONCURRENCY, _generate_or_error
+from scheduler import BULK
+
+# SQLite file holding submitted jobs, their leads and every finished email
+JOBS_DB_PATH = os.getenv("EMAIL_JOBS_DB", "email_jobs.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    product_details TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner INTEGER,
+    tenant TEXT
+);
+CREATE TABLE IF NOT EXISTS job_leads (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    lead TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_leads_status ON job_leads (job_id, status);
+"""
+
+# Job statuses; 'pending' and 'running' jobs are resumed once the process running them exits
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+
+
+class JobStore:
+    """
+    SQLite checkpoint store for background generation jobs
+
+    Every finished lead is committed as soon as it completes, so a restarted
+    process only has to generate the leads still marked pending.
+
+    Several worker processes on one host may share the store: each job
+    records the pid of the process running it, and is only taken over by
+    another process once that one has exited.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if "owner" not in columns:
+            # Stores created before jobs recorded their owner
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+        if "tenant" not in columns:
+            # Stores created before jobs recorded their tenant
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN tenant TEXT")
+
+    def create_job(self, leads: list, product_details: str, tenant: str = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, product_details, status, total, created_at, updated_at, owner, tenant) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, product_details, PENDING, len(leads), now, now, os.getpid(), tenant),
+            )
+            self._conn.executemany(
+                "INSERT INTO job_leads (job_id, idx, lead, status) VALUES (?, ?, ?, ?)",
+                ((job_id, idx, json.dumps(lead), PENDING) for idx, lead in enumerate(leads)),
+            )
+        return job_id
+
+    def set_status(self, job_id: str, status: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                (status, time.time(), job_id),
+            )
+
+    def complete(self, job_id: str) -> bool:
+        """
+        Mark a running job completed, unless it was cancelled meanwhile or has leads left pending
+
+        Returns:
+            bool: Whether the job is now completed
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ? AND NOT EXISTS "
+                "(SELECT 1 FROM job_leads WHERE job_id = ? AND status = ?)",
+                (COMPLETED, time.time(), job_id, RUNNING, job_id, PENDING),
+            )
+        return cursor.rowcount > 0
+
+    def get_status(self, job_id: str) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def save_result(self, job_id: str, idx: int, status: str, result: dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE job_leads SET status = ?, result = ? WHERE job_id = ? AND idx = ?",
+                (status, json.dumps(result), job_id, idx),
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def get_job(self, job_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, product_details, status, total, created_at, updated_at, tenant FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_leads WHERE job_id = ? GROUP BY status",
+                (job_id,),
+            ).fetchall())
+        return {
+            "job_id": row[0],
+            "product_details": row[1],
+            "status": row[2],
+            "total": row[3],
+            "completed": counts.get("done", 0),
+            "failed": counts.get("error", 0),
+            "pending": counts.get(PENDING, 0),
+            "created_at": row[4],
+            "updated_at": row[5],
+            "tenant": row[6],
+        }
+
+    def pending_leads(self, job_id: str):
+        """
+        Yield (idx, lead) for the leads of a job that have not been generated yet
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, lead FROM job_leads WHERE job_id = ? AND status = ? ORDER BY idx",
+                (job_id, PENDING),
+            ).fetchall()
+        for idx, lead in rows:
+            yield idx, json.loads(lead)
+
+    def results(self, job_id: str, offset: int = 0, limit: int = 100) -> list:
+        """
+        Finished results of a job in input order, paginated by lead position
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result FROM job_leads WHERE job_id = ? AND status != ? "
+                "ORDER BY idx LIMIT ? OFFSET ?",
+                (job_id, PENDING, limit, offset),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def claim_unfinished_jobs(self) -> list:
+        """
+        Take over the pending and running jobs whose owning process has exited
+
+        Returns:
+            list: Ids of the claimed jobs, now owned by this process
+        """
+        with self._lock, self._conn:
+            # Hold the write lock from the read on, so two workers cannot claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT id, owner FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (PENDING, RUNNING)
+            ).fetchall()
+            job_ids = [job_id for job_id, owner in rows if not _process_alive(owner)]
+            self._conn.executemany(
+                "UPDATE jobs SET owner = ? WHERE id = ?", ((os.getpid(), job_id) for job_id in job_ids)
+            )
+        return job_ids
+
+
+def _process_alive(pid: int) -> bool:
+    """
+    Whether another process with this pid is running on this host
+    """
+    if pid is None or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobManager:
+    """
+    Run generation jobs in the background of the current event loop
+
+    Args:
+        store (JobStore): Checkpoint store for jobs and results
+        semaphore (asyncio.Semaphore): Shared semaphore bounding LLM calls;
+            each job also keeps at most max_concurrency leads in flight
+        max_concurrency (int): Maximum number of leads in flight per job
+        scheduler (scheduler.FairScheduler): Queue each job's LLM calls as
+            bulk work of the job's tenant instead of using semaphore
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        semaphore: asyncio.Semaphore = None,
+        max_concurrency: int = None,
+        scheduler=None,
+    ):
+        self.store = store
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+        self.scheduler = scheduler
+        self._tasks = {}
+
+    def resume(self) -> list:
+        """
+        Restart every job left pending or running by a process that has exited
+        """
+        job_ids = self.store.claim_unfinished_jobs()
+        for job_id in job_ids:
+            self.start(job_id)
+        return job_ids
+
+    async def cancel(self, job_id: str) -> bool:
+        job = await asyncio.to_thread(self.store.get_job, job_id)
+        if job is None:
+            return False
+        task = self._tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+        if job["status"] in (PENDING, RUNNING):
+            await asyncio.to_thread(self.store.set_status, job_id, CANCELLED)
+        return True
+
+    async def shutdown(self):
+        """
+        Stop running jobs without marking them cancelled, so they resume on restart
+        """
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def start(self, job_id: str):
+        """
+        Run (or continue) a stored job in the background
+        """
+        task = asyncio.get_running_loop().create_task(self._run(job_id))
+        self._tasks[job_id] = task
+
+        def forget(_):
+            if self._tasks.get(job_id) is task:
+                del self._tasks[job_id]
+
+        task.add_done_callback(forget)
+
+    async def _run(self, job_id: str):
+        job = await asyncio.to_thread(self.store.get_job, job_id)
+        product_details = job["product_details"]
+        await asyncio.to_thread(self.store.set_status, job_id, RUNNING)
+        semaphore = self.semaphore
+        if self.scheduler is not None:
+            # Jobs stored before tenants were recorded share one tenant
+            semaphore = self.scheduler.lane(BULK, job["tenant"] or "jobs")
+
+        async def process(idx: int, lead: dict):
+            result = await _generate_or_error(lead, product_details, semaphore=semaphore)
+            status = "done" if result["status"] == "ok" else "error"
+            if 'lead_id' not in result or result['lead_id'] is None:
+                result['lead_id'] = str(lead.get('lead_id'))
+            await asyncio.to_thread(self.store.save_result, job_id, idx, status, result)
+
+        def check(done: set):
+            # A lead whose result could not be saved stays pending for the next run
+            for task in done:
+                if task.exception() is not None:
+                    print(f"Saving a lead of job {job_id} failed: {str(task.exception())}")
+
+        pending = set()
+        try:
+            for idx, lead in await asyncio.to_thread(list, self.store.pending_leads(job_id)):
+                # Another worker process may have cancelled the job
+                if await asyncio.to_thread(self.store.get_status, job_id) == CANCELLED:
+                    break
+                if len(pending) >= self.max_concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    check(done)
+                pending.add(asyncio.ensure_future(process(idx, lead)))
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                check(done)
+        finally:
+            for task in pending:
+                task.cancel()
+        # With leads left pending the job stays running, so it is resumed once this process exits
+        await asyncio.to_thread(self.store.complete, job_id)
@@ -0,0 +1,335 @@
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+from pydantic import ValidationError
+
+from rate_limiter import get_rate_limiter
+
+# Connection pool settings shared by every model in the process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "100"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+# Library structured-output calls go through: 'langchain' (ChatOpenAI with
+# with_structured_output) or 'openai' (the SDK directly, json_schema response_format)
+LLM_BACKEND = os.getenv("EMAIL_LLM_BACKEND", "langchain")
+
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+_sync_http_client = None
+# Async HTTP clients and the runnables using them are bound to the event loop
+# they were created on, so they are kept per loop and dropped with the loop
+_async_http_clients = weakref.WeakKeyDictionary()
+_registry = {}
+_loop_registries = weakref.WeakKeyDictionary()
+
+
+class StructuredOutputError(ValueError):
+    """
+    The model answered, but its output could not be parsed into the schema
+    """
+
+
+def _observe_response(response: httpx.Response):
+    """
+    Feed every provider response, including SDK retries and 429s, to the rate limiter
+    """
+    get_rate_limiter().observe_response(response.status_code, response.headers)
+
+
+async def _aobserve_response(response: httpx.Response):
+    await get_rate_limiter().aobserve_response(response.status_code, response.headers)
+
+
+def _pool_settings() -> dict:
+    """
+    Keyword arguments shared by the sync and async httpx clients
+    """
+    return {
+        "limits": httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    }
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Return the process-wide pooled httpx client used for sync LLM calls
+    """
+    global _sync_http_client
+    with _lock:
+        if _sync_http_client is None:
+            _sync_http_client = httpx.Client(
+                **_pool_settings(), event_hooks={"response": [_observe_response]}
+            )
+        return _sync_http_client
+
+
+def get_async_http_client(loop: asyncio.AbstractEventLoop) -> httpx.AsyncClient:
+    """
+    Return the pooled httpx client used for async LLM calls on the given event loop
+    """
+    with _lock:
+        client = _async_http_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                **_pool_settings(), event_hooks={"response": [_aobserve_response]}
+            )
+            _async_http_clients[loop] = client
+        return client
+
+
+def _api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
+    return api_key
+
+
+class LangChainStructuredModel:
+    """
+    Structured output through ChatOpenAI.with_structured_output
+
+    Structured models of every backend share this interface: invoke/ainvoke
+    send role/content messages and return the raw output, parse turns that
+    output into (parsed object, usage dict) or raises StructuredOutputError.
+
+    Args:
+        schema: Pydantic model the output is parsed into
+        model (str): OpenAI model name
+        temperature (float): Sampling temperature
+        max_tokens (int): Maximum number of completion tokens
+        loop (asyncio.AbstractEventLoop): Event loop ainvoke will be awaited on
+    """
+
+    def __init__(self, schema, model: str, temperature: float, max_tokens: int, loop=None):
+        # Importing LangChain takes over a second, so it waits for the first model
+        from langchain_openai import ChatOpenAI
+
+        llm = ChatOpenAI(
+            model=model,
+            openai_api_key=_api_key(),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(loop) if loop is not None else None,
+            # The SDK applies its own 10 minute default per request unless told otherwise
+            request_timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            # Retries are handled by retry.aretry, which knows the request's deadline
+            max_retries=0,
+        )
+        # include_raw keeps the AIMessage, whose usage metadata reports cached prompt tokens
+        self.runnable = llm.with_structured_output(schema, include_raw=True)
+
+    def invoke(self, messages: list) -> dict:
+        return self.runnable.invoke(messages)
+
+    async def ainvoke(self, messages: list) -> dict:
+        return await self.runnable.ainvoke(messages)
+
+    def parse(self, output: dict) -> tuple:
+        return parse_structured_output(output)
+
+
+class OpenAIStructuredModel:
+    """
+    Structured output from the openai SDK directly
+
+    Sends the schema as a strict json_schema response_format and validates
+    the reply straight into it, without LangChain's message conversion and
+    runnable dispatch. Same interface and arguments as LangChainStructuredModel.
+    """
+
+    def __init__(self, schema, model: str, temperature: float, max_tokens: int, loop=None):
+        import openai
+
+        settings = {
+            "api_key": _api_key(),
+            # Same variable ChatOpenAI reads; unset, the SDK falls back to OPENAI_BASE_URL
+            "base_url": os.getenv("OPENAI_API_BASE") or None,
+            "timeout": httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            "max_retries": 0,
+        }
+        self.schema = schema
+        self.client = openai.OpenAI(http_client=get_http_client(), **settings)
+        self.async_client = (
+            openai.AsyncOpenAI(http_client=get_async_http_client(loop), **settings) if loop is not None else None
+        )
+        self.request = {
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_format": response_format_for(schema),
+        }
+
+    def invoke(self, messages: list):
+        return self.client.chat.completions.create(messages=messages, **self.request)
+
+    async def ainvoke(self, messages: list):
+        return await self.async_client.chat.completions.create(messages=messages, **self.request)
+
+    def parse(self, completion) -> tuple:
+        choice = completion.choices[0]
+        if choice.finish_reason == "length":
+            raise StructuredOutputError("Model output was cut off at max_tokens")
+        if choice.message.refusal:
+            raise StructuredOutputError(f"Model refused to answer: {choice.message.refusal}")
+        try:
+            parsed = self.schema.model_validate_json(choice.message.content or "")
+        except ValidationError as e:
+            raise StructuredOutputError(str(e)) from e
+        return parsed, usage_from_completion(completion.usage)
+
+
+LLM_BACKENDS = {"langchain": LangChainStructuredModel, "openai": OpenAIStructuredModel}
+
+
+def _build_structured_model(
+    schema, model: str, temperature: float, max_tokens: int, loop=None, backend: str = LLM_BACKEND
+):
+    """
+    Build a structured-output model of the given backend on the shared connection pool
+    """
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {backend}")
+    return LLM_BACKENDS[backend](schema, model, temperature, max_tokens, loop)
+
+
+def preload():
+    """
+    Import the LLM client libraries without creating any clients
+
+    Safe to call before forking (e.g. from a gunicorn master with preload_app),
+    so workers share the imported modules instead of each importing them.
+    """
+    import openai  # noqa: F401
+
+    if LLM_BACKEND == "langchain":
+        import langchain_openai  # noqa: F401
+
+
+def get_structured_model(
+    schema, model: str, temperature: float, max_tokens: int, loop=None, backend: str = LLM_BACKEND
+):
+    """
+    Return the cached structured-output model for the given model settings
+
+    The model (and the JSON schema conversion behind it) is built once per
+    (schema, model, temperature, max_tokens, backend) and reused by every caller.
+
+    Args:
+        schema: Pydantic model the output is parsed into
+        model (str): OpenAI model name
+        temperature (float): Sampling temperature
+        max_tokens (int): Maximum number of completion tokens
+        loop (asyncio.AbstractEventLoop): Event loop the model will be awaited
+            on; None for models that are only invoked synchronously
+        backend (str): Key of LLM_BACKENDS; defaults to EMAIL_LLM_BACKEND
+
+    Returns:
+        LangChainStructuredModel or OpenAIStructuredModel: call invoke or
+            ainvoke, then parse on what it returns
+    """
+    key = (schema, model, temperature, max_tokens, backend)
+    with _lock:
+        registry = _registry if loop is None else _loop_registries.setdefault(loop, {})
+        runnable = registry.get(key)
+    if runnable is not None:
+        return runnable
+
+    # Serialise builds so a burst of first calls constructs the model only once
+    with _build_lock:
+        runnable = registry.get(key)
+        if runnable is None:
+            runnable = _build_structured_model(schema, model, temperature, max_tokens, loop, backend)
+            with _lock:
+                registry[key] = runnable
+        return runnable
+
+
+async def aget_structured_model(
+    schema, model: str, temperature: float, max_tokens: int, backend: str = LLM_BACKEND
+):
+    """
+    Async version of get_structured_model for the running event loop
+
+    A cache miss builds the model in a worker thread, since creating the
+    clients loads TLS certificates synchronously.
+    """
+    loop = asyncio.get_running_loop()
+    runnable = _loop_registries.get(loop, {}).get((schema, model, temperature, max_tokens, backend))
+    if runnable is not None:
+        return runnable
+    return await asyncio.to_thread(
+        get_structured_model, schema, model, temperature, max_tokens, loop, backend
+    )
+
+
+def usage_from_message(message) -> dict:
+    """
+    Token usage of an AIMessage, splitting prompt tokens into cached and uncached
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens", 0)
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached_tokens,
+        "uncached_prompt_tokens": prompt_tokens - cached_tokens,
+        "completion_tokens": usage.get("output_tokens", 0),
+    }
+
+
+def usage_from_completion(usage) -> dict:
+    """
+    Token usage of an openai SDK chat completion, in the usage_from_message format
+    """
+    if usage is None:
+        return usage_from_message(None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_prompt_tokens": cached_tokens,
+        "uncached_prompt_tokens": usage.prompt_tokens - cached_tokens,
+        "completion_tokens": usage.completion_tokens,
+    }
+
+
+def parse_structured_output(output: dict):
+    """
+    Unpack the result of a LangChain structured-output runnable into (parsed object, usage dict)
+
+    Raises StructuredOutputError if the model's output did not match the schema.
+    """
+    if output.get("parsing_error") is not None:
+        raise StructuredOutputError(str(output["parsing_error"])) from output["parsing_error"]
+    if output.get("parsed") is None:
+        raise StructuredOutputError("Model returned no structured output")
+    return output["parsed"], usage_from_message(output.get("raw"))
+
+
+def response_format_for(schema) -> dict:
+    """
+    OpenAI 'json_schema' response_format for a pydantic model, in strict mode
+
+    Strict mode requires every property to be required and no extra ones,
+    which holds for the flat models used here.
+    """
+    json_schema = schema.model_json_schema()
+    json_schema["additionalProperties"] = False
+    json_schema["required"] = list(json_schema.get("properties", {}))
+    for definition in json_schema.get("$defs", {}).values():
+        definition["additionalProperties"] = False
+        definition["required"] = list(definition.get("properties", {}))
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema.__name__, "strict": True, "schema": json_schema},
+    }
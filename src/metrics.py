@@ -0,0 +1,142 @@
+import contextlib
+import contextvars
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Add a Server-Timing header with per-stage durations to every API response
+SERVER_TIMING_ENABLED = os.getenv("EMAIL_SERVER_TIMING", "0") == "1"
+
+# Stages of one generation: prompt_build, queue (waiting for a concurrency
+# slot), rate_limit (waiting for request/token budget), llm_call, parse,
+# validate (local checks and repairs) and serialize (rendering the API response)
+STAGE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+STAGE_SECONDS = Histogram(
+    "email_stage_seconds", "Time spent in each stage of email generation", ["stage", "model"], buckets=STAGE_BUCKETS
+)
+TOKENS = Counter("email_tokens", "Tokens used by LLM calls", ["kind", "model"])
+LLM_CALLS = Counter(
+    "email_llm_calls", "LLM calls after retries, by outcome ('ok' or the error kind)", ["outcome", "model"]
+)
+RETRIES = Counter("email_llm_retries", "LLM calls retried, by the error that caused the retry", ["error_type", "model"])
+CACHE_LOOKUPS = Counter("email_cache_lookups", "Generation cache lookups", ["result", "model"])
+VALIDATION_ISSUES = Counter(
+    "email_validation_issues",
+    "Problems found in generated emails, by how they were repaired ('local', 'llm' or 'unresolved')",
+    ["issue", "repair", "model"],
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "email_scheduler_wait_seconds",
+    "Time LLM calls waited in the fair scheduler for a slot",
+    ["priority"],
+    buckets=STAGE_BUCKETS,
+)
+# Summed over the live workers when several share PROMETHEUS_MULTIPROC_DIR
+SCHEDULER_QUEUED = Gauge(
+    "email_scheduler_queued", "LLM calls waiting in the fair scheduler", ["priority"], multiprocess_mode="livesum"
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "email_http_request_seconds", "API request latency", ["method", "route", "status"], buckets=STAGE_BUCKETS
+)
+
+# Stage durations of the API request being served, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def observe_stage(stage: str, model: str, seconds: float):
+    """
+    Record time spent in a stage, also adding it to the current request's timings
+    """
+    STAGE_SECONDS.labels(stage, model).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def stage_timer(stage: str, model: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, model, time.perf_counter() - start)
+
+
+def record_usage(model: str, usage: dict):
+    """
+    Count the tokens of one LLM call, from a usage dict as built by llm_client.usage_from_message
+    """
+    TOKENS.labels("prompt", model).inc(usage.get("prompt_tokens", 0))
+    TOKENS.labels("cached_prompt", model).inc(usage.get("cached_prompt_tokens", 0))
+    TOKENS.labels("completion", model).inc(usage.get("completion_tokens", 0))
+
+
+def record_llm_call(model: str, outcome: str):
+    LLM_CALLS.labels(outcome, model).inc()
+
+
+def record_retry(model: str, error_type: str):
+    RETRIES.labels(error_type, model).inc()
+
+
+def record_cache_lookup(model: str, hit: bool):
+    CACHE_LOOKUPS.labels("hit" if hit else "miss", model).inc()
+
+
+def record_validation(model: str, issue: str, repair: str):
+    VALIDATION_ISSUES.labels(issue, repair, model).inc()
+
+
+def record_scheduler_wait(priority: str, seconds: float):
+    SCHEDULER_WAIT_SECONDS.labels(priority).observe(seconds)
+
+
+def set_scheduler_queued(priority: str, queued: int):
+    SCHEDULER_QUEUED.labels(priority).set(queued)
+
+
+def start_request_timing() -> dict:
+    """
+    Start collecting stage durations for the current request
+
+    Tasks spawned while handling the request share the returned dict, so for
+    multi-lead requests each stage holds the total over all leads.
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: dict, total: float) -> str:
+    """
+    Format stage durations (in seconds) as a Server-Timing header value in milliseconds
+    """
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def render_metrics() -> tuple:
+    """
+    Current metrics in the Prometheus text format, with its content type
+
+    With PROMETHEUS_MULTIPROC_DIR set (as gunicorn.conf.py does for several
+    workers) every worker writes its metrics there and this sums them all.
+    """
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
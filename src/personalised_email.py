@@ -2,399 +2,190 @@ from dotenv import load_dotenv
 import os
 import warnings
 import io
-from langchain_openai import ChatOpenAI
+import asyncio
+import contextlib
+import threading
 import time
+from collections import Counter
+from typing import List
 from pydantic import BaseModel, Field
+from llm_client import aget_structured_model
+from rate_limiter import get_rate_limiter, estimate_tokens
+from cache import cache_key, get_generation_cache
+from prompts import build_messages, build_packed_messages, build_repair_messages
+# Re-exported: code written before prompts.py existed imports these from here
+from prompts import style, product_database  # noqa: F401
+from token_budget import compact_lead, count_tokens, output_token_budget
+from company_digest import company_digest, company_key, split_company_fields
+from retry import aretry, classify_error, RETRYABLE_ERRORS
+from hedging import (
+    CALL_TIMEOUT,
+    HEDGE_ENABLED,
+    PACKED_CALL,
+    REPAIR_CALL,
+    SINGLE_CALL,
+    VARIANTS_CALL,
+    get_hedger,
+)
+from scheduler import Lane
+from singleflight import COALESCE_ENABLED, get_single_flight
+from variants import distinct_variants
+from validation import (
+    LLM_REPAIR_ENABLED,
+    VALIDATION_ENABLED,
+    find_issues,
+    paragraphs_to_fix,
+    repair_locally,
+    repair_paragraphs,
+    repair_problems,
+    sender_details,
+)
+from metrics import (
+    observe_stage,
+    record_cache_lookup,
+    record_llm_call,
+    record_retry,
+    record_usage,
+    record_validation,
+    stage_timer,
+)
 warnings.filterwarnings("ignore", category=UserWarning)
 
 # Load environment variables
 load_dotenv()
 
+# Model settings used for email generation
+MODEL_NAME = "gpt-4o-mini"
+TEMPERATURE = 0.7
+# Sized for a 150-word email in JSON rather than the model's maximum
+MAX_TOKENS = int(os.getenv("EMAIL_MAX_TOKENS", str(output_token_budget())))
+# Most completion tokens MODEL_NAME accepts in one call; packed and variant
+# calls ask for MAX_TOKENS per email up to this
+MODEL_MAX_OUTPUT_TOKENS = int(os.getenv("EMAIL_MODEL_MAX_OUTPUT_TOKENS", "16384"))
+# Bump whenever the prompt changes so cached emails from the old prompt are not reused
+PROMPT_VERSION = "6"
+
+# Maximum number of LLM calls in flight at once for multi-lead generation
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("EMAIL_MAX_CONCURRENCY", "20"))
+# Leads per call in packed mode (pack_size=0 in a call means this default)
+DEFAULT_PACK_SIZE = int(os.getenv("EMAIL_PACK_SIZE", "5"))
+# Largest pack whose emails all fit in one call's output
+MAX_PACK_SIZE = max(MODEL_MAX_OUTPUT_TOKENS // MAX_TOKENS, 1)
+# Fix-up calls on emails that failed validation should change as little as possible
+REPAIR_TEMPERATURE = 0.2
+
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
 class EmailResponse(BaseModel):
     subject: str
     body: str
     lead_id: str
 
-# Define the email generation prompt
-style = """
-Start with a greeting and then go on to say that you are reaching out because of [reason].
-Do not use too much buttering and unnecessary words specially after the first line (I was going through your profile and noticed your inspiring journey is phenomenal,fabulous, etc. Don't use such unnecessary buttering. Jus go like "I was going through your profile and noticed [mention things which are relevant to product and matches with the lead's profile, no unnecessary buttering]")
-Be casual, friendly and direct. 
-It should be a short, personalized email (100–150 words) to a potential lead who could benefit from your product/service/solution. It should:
-                    1.	Start with deep personalization — Reference something specific about the lead’s business, role, recent announcement, or pain point you’ve identified. Show you understand them—not just their company name. Use different phrases/styles/variation/words to start the email.
-                    2.	Make a relevant connection — Briefly explain who you are and why you’re reaching out. Make it clear why they specifically are a fit for what you offer.
-                    3. Talk about the problems in the lead's industry and how the product can solve the problem.
-                    4.	Focus on value (not features) — Position your solution around a problem or opportunity that matters to them. Avoid a hard sell—offer insight, benefit, or a useful idea that shows you can help.
-                    5.	Keep it short and natural — Write like a human, not a sales robot. End with a simple CTA (e.g., “open to a quick chat?” or “would you be interested in exploring this further?”).
-
-Use human like tone and language. Follow this style:
-1. First Person Pronouns: I, me, my, mine, we, us, our, ours. Write as if you are the one talking to the lead and do not use generalised statements.
-2. Fillers & Disfluencies
-Spoken or informal written human language often includes:
-	•	uh, um, like, you know, kinda, sorta, actually, basically, literally
-	•	contractions: gonna, wanna, gotta, ain't
-3. Personal Experience Markers
-	•	I think, I believe, I feel, in my opinion
-	•	yesterday, last week, when I was in school
-	•	my friend, my boss, my mom said
-4. Typos and Misspellings
-Humans often make minor spelling or grammatical errors:
-	•	definately → definitely
-	•	alot → a lot
-	•	seperate → separate
-5. Emotional/Spontaneous Expressions
-Humans express feelings impulsively or with less filter:
-	•	wow, amazing, omg, haha, lol, damn, yay
-	•	love it, hate that, so cool, super weird
-"""
-
-product_database = """
-parchaa = {
-    "problem_it_solves": (
-        "Long OPD wait times due to high patient footfall; "
-        "short consultation durations and overworked staff; "
-        "manual processes and lack of automation; "
-        "poor patient engagement and adherence; "
-        "lack of authentic health data for governance and research; "
-        "insufficient infrastructure and digital tools in rural/NGO settings; "
-        "inefficiencies and errors in emergency room triaging; "
-        "limited mental healthcare access in academic institutions."
-    ),
-    "solution": (
-        "A comprehensive AI-powered digital health platform covering OPD, emergency, air-gapped, and wellness workflows. "
-        "It supports the full healthcare journey—onboarding, consultation, follow-up, and monitoring—while being interoperable "
-        "with existing hospital systems and government initiatives like ABHA and Ayushman Bharat. "
-        "It offers remote, offline-compatible deployments, smart dashboards, and CDSS support."
-    ),
-    "unique_selling_point": (
-        "End-to-end digital healthcare platform functional in both online and offline modes; "
-        "powered by advanced AI/LLM models trained on Indian and global clinical standards (ICMR, WHO, CDC, etc.); "
-        "first-in-class emergency room automation tools including triage classification and resource dashboards; "
-        "deep focus on underserved areas and community care; "
-        "modular, white-label deployment suitable for hospitals, NGOs, and academic institutions."
-    ),
-    "features": (
-        "Smart OPD with AI-led triaging, diagnosis, and prescriptions; "
-        "Clinical Decision Support System (CDSS) with alerts for ADRs and contra-indications; "
-        "Patient app with teleconsultation, medication reminders, and adherence tracking; "
-        "Emergency module with auto-triaging and saturation dashboards; "
-        "Air-gapped mode for rural deployment with vitals tracking, inventory management, and follow-up tools; "
-        "WellKiwi for campus wellness including mental health support, insurance, and health analytics; "
-        "Dashboards for administrators, wardens, and doctors; "
-        "Interoperability with existing HIS, ABHA, PHRs, pharmacies, and diagnostics (e.g., 1mg integration)."
-    ),
-    "benefits": (
-        "Reduces patient wait time and improves quality of consultations; "
-        "supports doctors with AI-based decision tools; "
-        "boosts hospital efficiency through automation and data insights; "
-        "enables healthcare access in rural and remote regions; "
-        "improves patient follow-up, engagement, and outcomes; "
-        "promotes mental wellness and proactive health management in students; "
-        "enables fast, accurate emergency triaging; "
-        "standardizes care protocols and improves collaboration among stakeholders."
-    )
-}
-,
-"predCo": {
-  "problem_it_solves": [
-    "Unplanned equipment failures causing production delays and financial losses.",
-    "Inefficient maintenance strategies leading to safety concerns and operational disruptions.",
-    "Fragmented systems and lack of centralized monitoring in industrial operations.",
-    "Lack of real-time visibility and decision-making across assets and departments.",
-    "Stockouts, overstocking, and asset mismanagement in supply chain operations.",
-    "Manual, error-prone inventory tracking methods.",
-    "Delayed threat detection and response in surveillance operations."
-  ],
-  "solution": [
-    "AI-powered predictive maintenance and condition monitoring platform.",
-    "Digital Twin technology to simulate and optimize operations in real time.",
-    "Smart inventory management using RFID and computer vision.",
-    "Centralized monitoring and data integration for legacy systems and SCADA.",
-    "GenAI-powered assistants for real-time document retrieval and support.",
-    "Geofencing solutions for real-time asset tracking and alerts.",
-    "Role-based access and proactive alert systems for operations control."
-  ],
-  "unique_selling_point": [
-    "Unified AI-driven platform integrating IoT, ML, and digital twin technologies.",
-    "Real-time actionable insights across a wide array of machinery and assets.",
-    "Highly scalable and adaptable solutions tailored for legacy and modern systems.",
-    "Seamless integration with existing infrastructure, no new hardware needed.",
-    "Use-case agnostic architecture spanning energy, manufacturing, logistics, and security."
-  ],
-  "features": [
-    "Dynamic dashboards with real-time visualization and KPI tracking.",
-    "Customizable alerts based on threshold breaches and anomaly detection.",
-    "Real-time data acquisition from diverse IoT sensors.",
-    "Integrated ML models to predict equipment failure and remaining useful life.",
-    "Computer vision for automated shelf and item recognition.",
-    "GenAI tools for document digitization and knowledge retrieval.",
-    "Geofencing alerts and asset movement tracking.",
-    "Role-based access and operational rule configuration."
-  ],
-  "benefits": [
-    "Reduce equipment downtime by 35-40%.",
-    "Extend asset lifespan by up to 30%.",
-    "Lower maintenance costs by 8-12%.",
-    "Improve inventory turnover by 40% and reduce shrinkage by 50%.",
-    "Minimize manual monitoring efforts and decision-making delays.",
-    "Achieve up to 87% accuracy in lifecycle predictions of critical components.",
-    "Enhance workplace safety and compliance through AI-powered surveillance.",
-    "Boost operational transparency and inter-departmental collaboration."
-  ]
-},
-"InvestorBase": {
-    "problem_it_solves": [
-        "Overwhelming volume of inbound pitch decks makes it hard for VCs to evaluate each one thoroughly.",
-        "Current deal evaluation processes are manual, slow, biased, and inconsistent.",
-        "Due diligence is time-consuming, taking up to 2 weeks per deal.",
-        "Missed opportunities due to delays and inefficient workflows."
-    ],
-    "solution": [
-        "AI-driven pitch deck analyzer that extracts key information instantly.",
-        "Human-augmented analysis ensures depth and credibility of insights.",
-        "Dynamic opportunity scoring aligned with the fund’s investment thesis.",
-        "Automated red flag detection, validation, and memo generation."
-    ],
-    "unique_selling_point": [
-        "Combines speed and precision of AI with expert analyst judgment.",
-        "Customizable scoring tailored to specific investment theses.",
-        "Scalable solution that handles 10 to 1,000+ decks per month.",
-        "Delivers analyst-grade insights in 24–48 hours."
-    ],
-    "features": [
-        "Pitch Deck Analyzer – instant insights from uploaded decks.",
-        "Thesis Alignment – auto scoring of decks based on fund criteria.",
-        "InsightMaster – AI assistant for deeper analysis.",
-        "Auto Analysis + Alerts – real-time notifications for matching deals.",
-        "Market Intel – context-rich competitive and news insights.",
-        "Investor Research – deeper, customized insights beyond basic data.",
-        "Automated Collection – centralized collection from various sources.",
-        "Investor Memos – auto-generated, ready-to-use investment memos."
-    ],
-    "benefits": [
-        "Faster and smarter deal evaluation with reduced manual effort.",
-        "Increased chances of discovering high-potential investments.",
-        "Higher quality decisions through objective and consistent scoring.",
-        "Significant time savings in screening and due diligence.",
-        "Enhanced founder engagement and reduced deal drop-offs."
-    ]
-},
-   "sankalpam": {
-    "problem_it_solves": "Inefficient temple operations, outdated communication, inadequate resource management, limited accessibility for devotees, and challenges in preserving cultural heritage and managing religious tourism.",
-    
-    "solution": "A technology-driven platform that empowers temples through AI, IoT, and cloud tools to improve operational efficiency, enhance devotee engagement, enable secure fundraising, digitize cultural assets, and modernize communication.",
-    
-    "unique_selling_point": "Sankalpam bridges the gap between tradition and modernity, offering temples smart management tools, immersive devotee experiences, and government collaboration frameworks, all under one unified platform.",
-    
-    "features": [
-        "AI-powered surveillance and crowd control",
-        "IoT-enabled resource and environmental monitoring",
-        "Mobile app for temple services, communication, and ticketing",
-        "Digital donation platforms with global access",
-        "AR/VR-based cultural immersion experiences",
-        "Live streaming of religious rituals (Darshan)",
-        "Virtual pooja booking (Sankalp)",
-        "Online astrology consultations (Jyotish Vani)",
-        "Sacred offering delivery (Prasadam)",
-        "Pilgrimage planning assistance (Yatra)",
-        "Comprehensive Hindu knowledge repository (Gyan Kosh)"
-    ],
-    
-    "benefits": {
-        "For Temples": [
-            "Enhanced operational efficiency and crowd management",
-            "Reduced administrative costs and better resource allocation",
-            "Increased donations and new revenue streams",
-            "Greater transparency in financial management",
-            "Improved security and heritage preservation"
-        ],
-        "For Devotees": [
-            "Seamless access to services through online bookings and virtual participation",
-            "Personalized spiritual experiences",
-            "Improved accessibility for elderly and differently-abled",
-            "Interactive cultural education and deeper immersion"
-        ],
-        "For Governments": [
-            "Smart heritage management using data and AI",
-            "Boosted religious tourism and economic development",
-            "Stronger cultural preservation and social impact through temple-centric community engagement"
-        ]
+class PackedEmailResponse(BaseModel):
+    emails: List[EmailResponse]
+
+class EmailVariants(BaseModel):
+    variants: List[EmailResponse]
+
+class EmailRepair(BaseModel):
+    paragraphs: List[str]
+
+def error_email(lead: dict, error: Exception) -> dict:
+    """
+    Build the placeholder result recorded for a lead whose generation failed
+
+    'error_type' says what went wrong and 'retryable' whether resubmitting the
+    lead later is likely to succeed.
+    """
+    print(f"Error processing lead {lead.get('name', 'Unknown')}: {str(error)}")
+    error_type = classify_error(error)
+    return {
+        'subject': 'Error generating email',
+        'body': f'Error generating personalized email: {str(error)}',
+        'lead_id': str(lead.get('lead_id')),
+        'status': 'error',
+        'error_type': error_type,
+        'retryable': error_type in RETRYABLE_ERRORS,
     }
-},
-"Opticall": {
-    "problem_it_solves": 
-        "General: High call volumes, inconsistent call handling quality, delayed insights, and ineffective coaching that increase costs and reduce performance.\n"
-        "Sales Center: Sales reps face chaotic lead volumes, cold leads, and lack real-time visibility into performance gaps, resulting in missed revenue opportunities.\n"
-        "Contact Center: Overwhelmed agents, long wait times, inconsistent service, and buried insights lead to high costs, low customer satisfaction, and limited performance visibility.",
-    
-    "solution": 
-        "General: A unified AI platform that automates queries via bots, supports agents in real time, and converts raw call data into actionable insights through customizable dashboards.\n"
-        "Sales Center: Automates repetitive lead engagement, provides real-time pitch coaching, and surfaces deep post-call insights to optimize sales conversions.\n"
-        "Contact Center: Automates customer queries with virtual agents, supports agents with real-time assistance, and delivers performance insights from every call to improve support quality.",
-    
-    "unique_selling_point": 
-        "General: Modular, phygital-ready architecture with deep tech and lightweight deployment that fits any workflow and delivers real-time insights across audio, video, and text.\n"
-        "Sales Center: Requires no change in existing sales workflows—adapts to your team with flexible tools, custom templates, and sales-specific dashboards.\n"
-        "Contact Center: Fully customizable to existing support operations, delivering automation and real-time coaching without altering how your team works.",
-    
-    "features": 
-        "General: Agent Assist, automated call scoring, dynamic dashboards, vernacular engine (28+ languages), real-time prompts, and video/audio analytics.\n"
-        "Sales Center: Virtual sales agents, real-time objection handling, pitch prompts, AI-powered knowledge base, performance dashboards, multilingual support, and coaching tools.\n"
-        "Contact Center: AI-powered virtual agents, real-time agent guidance with visual checklists, instant knowledge access, automated escalations, coaching hub, and compliance support.",
-    
-    "benefits": 
-        "General: +18 CSAT points, 95% QA coverage (up from 2%), and 22% reduction in support costs with real-time insights and automation.\n"
-        "Sales Center: 12% increase in conversions, 9% growth in monthly bookings, 18% reduction in customer acquisition cost, and accelerated deal closures.\n"
-        "Contact Center: +18 CSAT points, 98% QA cove
-,
-    "IndikaAI": {
-        "problem_it_solves": (
-            "Enterprises face challenges in AI adoption due to unclear AI roadmaps, data readiness issues, "
-            "lack of internal expertise, difficulty integrating AI with existing systems, and rapid technology changes. "
-            "These factors hinder ROI and effective AI implementation."
-        ),
-        "solution": (
-            "Indika AI provides end-to-end AI solutions, including strategy formulation, data preparation, "
-            "foundation model selection, model fine-tuning, deployment, and continuous monitoring. It offers tailored "
-            "products for industries like healthcare, judiciary, infrastructure, and customer service."
-        ),
-        "unique_selling_point": (
-            "Comprehensive AI development lifecycle support, domain-specific AI products, access to 50,000+ experts "
-            "across 100+ languages, and experience across sectors including judiciary, healthcare, infrastructure, and BFSI."
-        ),
-        "features": (
-            "• AI strategy and roadmap development\n"
-            "• Data digitization, anonymization, and labeling\n"
-            "• Custom generative AI, NLP, computer vision, and audio processing\n"
-            "• Platforms like DigiVerse (digitization), DataStudio (model training), FlexiBench (expert workforce)\n"
-            "• Industry-specific AI solutions (Nyaay AI, PredCo, RoadVision AI, Parchaa AI, Choice AI)\n"
-            "• Ready-to-deploy tools (OCR, speech-to-text, trust & safety, synthetic data generation)"
-        ),
-        "benefits": (
-            "• Faster and smoother AI adoption\n"
-            "• Improved operational efficiency and automation\n"
-            "• Enhanced decision-making through AI-powered insights\n"
-            "• Access to scalable AI solutions tailored to specific industries\n"
-            "• Expert support across all AI development stages\n"
-            "• Multilingual and multidisciplinary support"
-        )
-},
-"Flexibench": {
-    "problem_it_solves": "Lack of trained professionals with domain-specific expertise to contribute to AI systems effectively; need for culturally and linguistically aware AI development.",
-    "solution": "A talent development hub that trains domain experts in hands-on AI tasks (e.g., data labeling, RLHF, annotation), offering real project experience and earnings while learning.",
-    "unique_selling_point": "Combines real-world AI project exposure with specialized domain training and global language support, turning professionals into AI contributors.",
-    "features": [
-        "Training across 100+ languages for localization and bias reduction",
-        "Tailored learning paths in fields like law, medicine, engineering, and linguistics",
-        "Real industry experience through live AI projects",
-        "Focus on essential AI lifecycle skills (data labeling, RLHF, annotation)",
-        "Support for 20+ academic fields with 60,000+ experts onboarded"
-    ],
-    "benefits": [
-        "Earn while gaining AI industry experience",
-        "Transform domain knowledge into valuable AI contributions",
-        "Enable accurate, culturally aware AI systems",
-        "Promote India's global role in AI excellence",
-        "Join a global network of trained professionals for AI projects"
-    ]
-},
-"InspireAI": {
-    "problem_it_solves": "Content creators and marketers face burnout, creative blocks, and inefficiencies when generating engaging and consistent content across platforms.",
-    "solution": "InspireAI offers an AI-powered platform that generates personalized, high-quality, and engaging content at scale, reducing the creative workload and boosting productivity.",
-    "unique_selling_point": "Combines personalization, scalability, and creative storytelling powered by AI, tailored specifically for content marketers and creators.",
-    "features": [
-        "AI-driven content generation",
-        "Personalized content suggestions",
-        "Multi-platform optimization",
-        "Content calendar integration",
-        "Real-time collaboration tools",
-        "Performance analytics and insights"
-    ],
-    "benefits": [
-        "Saves time and reduces creative fatigue",
-        "Increases content output without compromising quality",
-        "Boosts audience engagement through personalized storytelling",
-        "Streamlines content workflow for teams and individuals",
-        "Improves ROI through data-driven content strategies"
-    ]
-},
-"Insituate": {
-    "problem_it_solves": (
-        "Businesses struggle with rapid AI advancements due to lack of AI talent, "
-        "compliance concerns (handling sensitive data), and compatibility issues with legacy systems."
-    ),
-    "solution": (
-        "A secure, no-code, end-to-end AI development platform enabling enterprises to adopt "
-        "state-of-the-art LLMs and RAG pipelines, while keeping all data in-house."
-    ),
-    "unique_selling_point": (
-        "The only platform to offer a no-code, one-stop solution for building end-to-end AI copilots "
-        "that integrate with legacy systems and prioritize data security."
-    ),
-    "features": (
-        "• In-situ (on-premise) database\n"
-        "• No-code development interface\n"
-        "• Ironclad security protocols\n"
-        "• State-of-the-art LLM and RAG integration\n"
-        "• 100+ pre-built templates\n"
-        "• Compatibility with legacy software\n"
-        "• Gridsearch for copilot optimization\n"
-        "• Sentry mode for continuous improvement\n"
-        "• AutoLLM deployment within a week\n"
-        "• LLMOps capabilities\n"
-        "• On-cloud and on-premise deployment options\n"
-        "• Team collaboration and one-click export"
-    ),
-    "benefits": (
-        "• Accelerates enterprise AI adoption without requiring in-house AI talent\n"
-        "• Maintains data privacy and regulatory compliance\n"
-        "• Saves time and cost (AutoLLM in 1 week vs. traditional 24 months)\n"
-        "• Streamlines development and deployment with minimal technical barriers\n"
-        "• Empowers internal teams to create domain-specific copilots\n"
-        "• Taps into a large, global, multi-vertical market"
-    )
-},
-"choiceAI": {
-    "problem_it_solves": (
-        "1. Lack of regulatory framework for OTT content certification.\n"
-        "2. Inability of OTT platforms to filter offensive or harmful content effectively.\n"
-        "3. Viewer concerns about exposure to explicit/inappropriate content and lack of parental controls.\n"
-        "4. Production houses face delays and risks in content release due to censorship.\n"
-        "5. Lack of personalized content access and inclusivity for diverse viewers."
-    ),
-    "solution": (
-        "1. AI tool that ensures responsible content distribution and compliance.\n"
-        "2. Personalized viewer experience using advanced tagging and filtering.\n"
-        "3. Parental controls and content warnings to protect minors and sensitive viewers.\n"
-        "4. Streamlined certification and approval process for content creators.\n"
-        "5. Intelligent content assessment to maintain compliance without limiting creativity."
-    ),
-    "unique_selling_point": (
-        "Only solution offering comprehensive customization, real-time AI moderation, "
-        "personalized viewing, compliance with censorship, and collaboration with CBFC and OTT platforms."
-    ),
-    "features": (
-        "1. Choice Tagger: Tags content (e.g., sex, violence, nudity) for CBFC and OTT.\n"
-        "2. Choice Viewer: Lets users filter content based on tags.\n"
-        "3. AI-powered moderation and certification.\n"
-        "4. Personalized recommendations and curated experiences.\n"
-        "5. Parental control and age-based filtering.\n"
-        "6. Collaboration tools for CBFC and independent creators.\n"
-        "7. OEM integration with OTT platforms."
-    ),
-    "benefits": (
-        "1. Viewers enjoy safe, personalized, and culturally sensitive content.\n"
-        "2. Parents can restrict inappropriate content for children.\n"
-        "3. Content creators maintain creative freedom while complying with regulations.\n"
-        "4. OTT platforms enhance user experience and reduce legal risk.\n"
-        "5. CBFC streamlines verification and sets unified digital standards.\n"
-        "6. Independent creators gain exposure and platform support.\n"
-        "7. Faster content approval and reduced release delays."
-    )
-}
-"""
 
-def generate_email_for_single_lead(lead_details: dict, product_details: str) -> dict:
+
+def email_cache_key(lead_details: dict, product_details: str) -> str:
+    """
+    Generation cache key of a lead's email under the current prompt and model settings
+    """
+    return cache_key(lead_details, product_details, PROMPT_VERSION, MODEL_NAME, TEMPERATURE)
+
+
+def prepare_messages(lead_details: dict, product_details: str, variants: int = None) -> tuple:
+    """
+    Build the prompt messages for one lead, compacting the lead first
+
+    Args:
+        lead_details (dict): Lead details (see generate_email_for_single_lead)
+        product_details (str): Product documentation/information
+        variants (int): Ask for this many alternative emails (see agenerate_email_variants)
+
+    Returns:
+        tuple: (messages, stats dict with 'lead_tokens_before' and 'lead_tokens_after')
+    """
+    compacted_lead, company_context, lead_stats = _prepare_lead(lead_details)
+
+    # Construct the prompt with lead details and product information
+    return build_messages(compacted_lead, product_details, company_context, variants), lead_stats
+
+
+def _prepare_lead(lead_details: dict) -> tuple:
+    """
+    Compact a lead for the prompt
+
+    Returns:
+        tuple: (person fields, company digest or None, stats dict with
+            'lead_tokens_before' and 'lead_tokens_after')
+    """
+    # Company fields become a digest computed once per company; the person's
+    # own fields are stripped of scraping noise and trimmed to their budgets
+    company_fields, person_fields = split_company_fields(lead_details)
+    company_context = company_digest(company_fields) if company_fields else None
+    compacted_lead, lead_stats = compact_lead(person_fields)
+    lead_stats["lead_tokens_before"] += sum(count_tokens(str(v)) for v in company_fields.values())
+    lead_stats["lead_tokens_after"] += count_tokens(company_context or "")
+    return compacted_lead, company_context, lead_stats
+
+
+def run_sync(coro):
+    """
+    Run a coroutine for the synchronous API on a shared background event loop
+
+    Keeping one loop for the life of the process lets sync callers reuse the
+    pooled async clients instead of building new ones for every call.
+    """
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="email-sync-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
+
+
+async def awarmup():
+    """
+    Do the one-off setup of the first generation ahead of time on the running loop
+
+    Loads the tokenizer and the LLM client libraries and builds the email
+    model with its connection pool, so the first request does not wait for them.
+    """
+    await asyncio.to_thread(count_tokens, "warmup")
+    await aget_structured_model(EmailResponse, MODEL_NAME, TEMPERATURE, MAX_TOKENS)
+
+
+def generate_email_for_single_lead(
+    lead_details: dict,
+    product_details: str,
+    use_cache: bool = True,
+    include_usage: bool = False,
+    hedge: bool = True,
+) -> dict:
     """
     Generate a personalized email for a single lead
     
@@ -408,77 +199,602 @@ def generate_email_for_single_lead(lead_details: dict, product_details: str) ->
             - company_overview: str
             - company_industry: str
         product_details (str): Product documentation/information
+        use_cache (bool): Serve and store the result in the generation cache
+        include_usage (bool): Add a 'usage' dict with prompt (cached and
+            uncached) and completion token counts
+        hedge (bool): Start a second call if the first is slower than most
+            recent calls (see hedging.Hedger)
         
     Returns:
         dict: Dictionary containing 'subject', 'body', and 'lead_id' of the email
     """
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are an B2B expert marketer. Based on the list of leads, their details and the product document provides , write a personalized email to the lead  in a concise manner, keeping in mind they have limited time to read the email. Write in a way that a fifth year student can understand and state your objective of helping the lead with your product"""
-                "You avoid formal templates, skip unnecessary flattery, and talk like a real person. Follow the tone and style guide provided."
-                "Refer product database as per the given product details for context, problems in lead's industry and how the product can solve the problem, {product_database}"
-                "Do fact check about the problems and after verifying the facts, put them in the email else dont."
-            )
-        },
-        {
-            "role": "user",
-            "content": f"""
-Task:
-Write a personalized email for the lead above. Follow the subject/body formatting rules. Return the result in a JSON object with keys: 'subject', 'body', and 'lead_id'. Keep variations in starting the email, use different way to start the email. Make sure the email must not contain any placeholders (like [xyz]). For sender's contact details, use the details given in the "ProductDetails" section.
-
-Style Guide:
-{style}
-
-Lead Details:
-{lead_details}
-
-"ProductDetails":
-{product_details}
-
-Return the results in a dictionary with these keys:
-1. 'subject': The email subject line (style as provided)
-2. 'body': The email body content. It must contain;
-    - Greeting with the lead's name
-    - Content in multiple paragraphs in the above mentioned style
-    - Closing with a call to action
-    - Sender's contact details (Take from the ProductDetails section, skip if not provided)
-3. 'lead_id': The lead ID
-
-"""
+    return run_sync(
+        agenerate_email_for_single_lead(
+            lead_details, product_details, use_cache=use_cache, include_usage=include_usage, hedge=hedge
+        )
+    )
+
+
+async def agenerate_email_for_single_lead(
+    lead_details: dict,
+    product_details: str,
+    use_cache: bool = True,
+    semaphore: asyncio.Semaphore = None,
+    include_usage: bool = False,
+    hedge: bool = False,
+) -> dict:
+    """
+    Async version of generate_email_for_single_lead built on the model's ainvoke
+
+    Args:
+        lead_details (dict): Lead details (see generate_email_for_single_lead)
+        product_details (str): Product documentation/information
+        use_cache (bool): Serve and store the result in the generation cache
+        semaphore (asyncio.Semaphore): Held only around the LLM call, so cache
+            hits never wait for a slot
+        include_usage (bool): Add a 'usage' dict with token counts
+        hedge (bool): Hedge slow calls with a duplicate call; meant for
+            interactive requests, where tail latency matters more than cost
+
+    Concurrent calls for the same lead and product share one generation (see
+    singleflight.SingleFlight) if they are of the same scheduler priority
+    class; the usage of those that joined another call says 'coalesced'
+    instead of counting its tokens again.
+
+    Returns:
+        dict: Dictionary containing 'subject', 'body', and 'lead_id' of the email,
+            plus 'issues' listing any validation problems repair could not fix
+    """
+    key = email_cache_key(lead_details, product_details)
+    cache = get_generation_cache() if use_cache else None
+    if cache is not None:
+        cached = await cache.aget(key)
+        record_cache_lookup(MODEL_NAME, cached is not None)
+        if cached is not None:
+            if include_usage:
+                cached["usage"] = {"cache_hit": True}
+            return cached
+
+    async def generate():
+        with stage_timer("prompt_build", MODEL_NAME):
+            messages, lead_stats = prepare_messages(lead_details, product_details)
+        structured_email = await aget_structured_model(EmailResponse, MODEL_NAME, TEMPERATURE, MAX_TOKENS)
+
+        email_response, usage, attempts = await _acall_model(
+            structured_email, messages, semaphore, hedge=hedge and HEDGE_ENABLED
+        )
+        email_response_dict, repair_usage = await avalidate_email(
+            email_response.model_dump(), lead_details, product_details, semaphore
+        )
+        # Emails with problems left are not kept, so the next request tries again
+        if cache is not None and "issues" not in email_response_dict:
+            await cache.aset(key, email_response_dict)
+        usage = {**usage, **lead_stats, "attempts": attempts}
+        if repair_usage is not None:
+            usage["repair"] = repair_usage
+        return email_response_dict, usage
+
+    if COALESCE_ENABLED:
+        # The generation is queued in its starter's lane, so an interactive
+        # request must not end up waiting on a bulk one
+        flight_key = f"{semaphore.priority}:{key}" if isinstance(semaphore, Lane) else key
+        (email, usage), coalesced = await get_single_flight().run(flight_key, generate)
+    else:
+        (email, usage), coalesced = await generate(), False
+    # Every caller gets its own copy of a shared result
+    email_response_dict = dict(email)
+    if include_usage:
+        email_response_dict["usage"] = {"cache_hit": False, "coalesced": True} if coalesced else {
+            "cache_hit": False, **usage
         }
-    ]
+    return email_response_dict
+
+
+async def agenerate_email_variants(
+    lead_details: dict,
+    product_details: str,
+    variants: int,
+    semaphore: asyncio.Semaphore = None,
+    include_usage: bool = False,
+) -> list:
+    """
+    Generate several alternative emails for one lead, e.g. for A/B testing
+
+    All variants come from a single structured-output call, so the prompt is
+    paid for once, and the model sees its other versions while writing each
+    one. Each variant is validated like a single email; variants whose
+    subject and opening are near duplicates of an earlier one are dropped
+    (see variants.distinct_variants), so fewer than requested may be returned.
+    Variants are neither cached nor coalesced, since every request should get
+    fresh candidates.
+
+    Args:
+        lead_details (dict): Lead details (see generate_email_for_single_lead)
+        product_details (str): Product documentation/information
+        variants (int): Number of variants to ask for
+        semaphore (asyncio.Semaphore): Held only around the LLM calls
+        include_usage (bool): Add a 'usage' dict with token counts to each
+            variant, the call's tokens split evenly across the variants
+
+    Returns:
+        list: Dictionaries containing 'subject', 'body', 'lead_id' and the
+            'variant' number of each email
+    """
+    with stage_timer("prompt_build", MODEL_NAME):
+        messages, lead_stats = prepare_messages(lead_details, product_details, variants)
+    # Output budget grows with the number of variants, so each count gets its own runnable
+    structured_variants = await aget_structured_model(
+        EmailVariants, MODEL_NAME, TEMPERATURE, min(MAX_TOKENS * variants, MODEL_MAX_OUTPUT_TOKENS)
+    )
+    answer, usage, attempts = await _acall_model(
+        structured_variants, messages, semaphore, timeout=CALL_TIMEOUT * variants, kind=VARIANTS_CALL
+    )
+    validated = await asyncio.gather(*(
+        avalidate_email(email.model_dump(), lead_details, product_details, semaphore)
+        for email in answer.variants[:variants]
+    ))
+    emails = distinct_variants([email for email, _ in validated])
+    repairs = {id(email): repair_usage for email, repair_usage in validated}
+    for number, email in enumerate(emails):
+        email['variant'] = number
+        if include_usage:
+            email["usage"] = {
+                "cache_hit": False,
+                "variants": len(emails),
+                "variants_dropped": len(answer.variants[:variants]) - len(emails),
+                **{name: count // len(emails) for name, count in usage.items()},
+                **lead_stats,
+                "attempts": attempts,
+            }
+            if repairs[id(email)] is not None:
+                email["usage"]["repair"] = repairs[id(email)]
+    return emails
+
+
+async def _acall_model(
+    structured_model,
+    messages: list,
+    semaphore: asyncio.Semaphore = None,
+    timeout: float = CALL_TIMEOUT,
+    hedge: bool = False,
+    kind: str = SINGLE_CALL,
+) -> tuple:
+    """
+    Call a structured-output model with retries, deadline and optional hedging
+
+    Records the queue, rate_limit, llm_call and parse stage timings, retries,
+    the call's outcome and its token usage. semaphore may also be a
+    scheduler.Lane, in which case the call is queued by its prompt tokens.
+    kind picks the hedger whose latency window the call is timed in (see
+    hedging.get_hedger).
+
+    Returns:
+        tuple: (parsed output, usage dict, number of attempts)
+    """
+    prompt_tokens = estimate_tokens(messages)
+    rate_limiter = get_rate_limiter()
+    # The fair scheduler charges each call its prompt tokens
+    slot = semaphore.with_cost(prompt_tokens) if isinstance(semaphore, Lane) else semaphore
+
+    async def hedge_call():
+        # A hedged duplicate spends budget like any other call
+        await rate_limiter.acquire(prompt_tokens)
+        return await structured_model.ainvoke(messages)
+
+    async def call_model():
+        queued = time.perf_counter()
+        # The slot is released between attempts so backoff never holds it
+        async with slot or contextlib.nullcontext():
+            observe_stage("queue", MODEL_NAME, time.perf_counter() - queued)
+            # Wait for room in the shared request/token budget
+            with stage_timer("rate_limit", MODEL_NAME):
+                await rate_limiter.acquire(prompt_tokens)
+            with stage_timer("llm_call", MODEL_NAME):
+                output = await get_hedger(kind).run(
+                    lambda: structured_model.ainvoke(messages), timeout, hedge=hedge, hedge_call=hedge_call
+                )
+        # LangChain validates the JSON inside the call, so with that backend
+        # this only covers unpacking; schema validation time is part of llm_call
+        with stage_timer("parse", MODEL_NAME):
+            return structured_model.parse(output)
+
     try:
-        api_key = os.getenv("OPENAI_API_KEY")
+        (parsed, usage), attempts = await aretry(
+            call_model, on_retry=lambda error: record_retry(MODEL_NAME, classify_error(error))
+        )
     except Exception as e:
-        raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
-        
-    model = ChatOpenAI(
-        model="gpt-4o-mini",
-        openai_api_key=api_key,
-        temperature=0.7,
-        max_tokens=4096,
+        record_llm_call(MODEL_NAME, classify_error(e))
+        raise
+    record_llm_call(MODEL_NAME, "ok")
+    record_usage(MODEL_NAME, usage)
+    return parsed, usage, attempts
+
+
+async def avalidate_email(
+    email: dict,
+    lead_details: dict,
+    product_details: str,
+    semaphore: asyncio.Semaphore = None,
+    llm_repair: bool = LLM_REPAIR_ENABLED,
+) -> tuple:
+    """
+    Check a generated email and repair what fails instead of regenerating it
+
+    lead_id, greeting and sender placeholders are fixed locally. Only the
+    paragraphs still holding placeholders, and the fewest paragraphs that
+    can absorb a length that is off, go to a small fix-up call (see
+    validation.paragraphs_to_fix). Problems left after that are listed
+    under 'issues' in the returned email. llm_repair=False skips the fix-up
+    call.
+
+    Returns:
+        tuple: (email dict, usage dict of the fix-up call or None)
+    """
+    if not VALIDATION_ENABLED:
+        return email, None
+    with stage_timer("validate", MODEL_NAME):
+        issues = find_issues(email, lead_details)
+        if not issues:
+            return email, None
+        email = repair_locally(email, lead_details, product_details)
+        after_local = find_issues(email, lead_details)
+
+    remaining, usage = after_local, None
+    paragraphs, indices = paragraphs_to_fix(email, after_local)
+    # Problems outside the paragraphs a fix-up call may rewrite are not worth a call
+    if indices and llm_repair:
+        try:
+            structured_repair = await aget_structured_model(EmailRepair, MODEL_NAME, REPAIR_TEMPERATURE, MAX_TOKENS)
+            messages = build_repair_messages(
+                [paragraphs[index] for index in indices],
+                repair_problems(email, after_local, paragraphs, indices),
+                sender_details(product_details),
+            )
+            repair, usage, _ = await _acall_model(structured_repair, messages, semaphore, kind=REPAIR_CALL)
+            email = repair_locally(
+                repair_paragraphs(email, paragraphs, indices, repair.paragraphs), lead_details, product_details
+            )
+            remaining = find_issues(email, lead_details)
+        except Exception as e:
+            print(f"Fix-up call for lead {lead_details.get('lead_id')} failed: {str(e)}")
+
+    for issue in issues:
+        if issue in remaining:
+            record_validation(MODEL_NAME, issue, "unresolved")
+        else:
+            record_validation(MODEL_NAME, issue, "llm" if issue in after_local else "local")
+    if remaining:
+        email["issues"] = remaining
+    return email, usage
+
+
+async def _generate_or_error(lead_details: dict, product_details: str, **kwargs) -> dict:
+    """
+    Generate one lead's email for a multi-lead call, tagging it with a 'status'
+
+    Failures (after retries) become the error dict from error_email rather
+    than an exception, so one bad lead never fails the rest of the batch.
+    """
+    try:
+        result = await agenerate_email_for_single_lead(lead_details, product_details, **kwargs)
+    except Exception as e:
+        return error_email(lead_details, e)
+    result['status'] = 'ok'
+    return result
+
+
+async def _generate_variants_or_error(
+    lead_details: dict, product_details: str, variants: int, **kwargs
+) -> list:
+    """
+    Generate one lead's variants for a multi-lead call, tagging each with a 'status'
+
+    Returns:
+        list: The variants, or the single error dict from error_email
+    """
+    try:
+        results = await agenerate_email_variants(lead_details, product_details, variants, **kwargs)
+    except Exception as e:
+        return [error_email(lead_details, e)]
+    for result in results:
+        result['status'] = 'ok'
+    return results
+
+
+async def _agenerate_pack(pack: list, product_details: str, semaphore: asyncio.Semaphore = None) -> tuple:
+    """
+    Generate the emails for a pack of leads with one structured-output call
+
+    The lead_ids in the pack must be distinct. An email is only accepted if
+    its lead_id belongs to the pack and appears exactly once in the answer.
+
+    Returns:
+        tuple: (list aligned with pack holding each lead's email dict, or None
+            if the model skipped or duplicated it; usage of the whole call;
+            per-lead stats; number of attempts)
+    """
+    with stage_timer("prompt_build", MODEL_NAME):
+        prepared = [_prepare_lead(lead) for lead in pack]
+        messages = build_packed_messages([(lead, company) for lead, company, _ in prepared], product_details)
+    # Output budget grows with the pack, so each pack size gets its own runnable
+    structured_emails = await aget_structured_model(
+        PackedEmailResponse, MODEL_NAME, TEMPERATURE, min(MAX_TOKENS * len(pack), MODEL_MAX_OUTPUT_TOKENS)
     )
-        
-    # Construct the prompt with lead details and product information
-   
+    packed, usage, attempts = await _acall_model(
+        structured_emails, messages, semaphore, timeout=CALL_TIMEOUT * len(pack), kind=PACKED_CALL
+    )
+    counts = Counter(email.lead_id for email in packed.emails)
+    emails = {email.lead_id: email.model_dump() for email in packed.emails if counts[email.lead_id] == 1}
+    results = [emails.get(str(lead.get('lead_id'))) for lead in pack]
+    return results, usage, [stats for _, _, stats in prepared], attempts
+
+
+async def _agenerate_packed(
+    leads_list: list,
+    product_details: str,
+    pack_size: int,
+    semaphore: asyncio.Semaphore,
+    use_cache: bool = True,
+    include_usage: bool = False,
+) -> list:
+    """
+    Packed mode of agenerate_email_for_multiple_leads
 
-    
-    # Structure the output in given pydantic format
-    structured_email = model.with_structured_output(EmailResponse)
+    Cache misses are grouped into packs of up to pack_size leads, each
+    generated by a single call. Leads missing from a pack's answer, and every
+    lead of a pack whose call failed, are generated with single-lead calls.
+    """
+    cache = get_generation_cache() if use_cache else None
+    results = [None] * len(leads_list)
+    misses = []
+    # Identical leads within the batch are generated once: index -> index of the first copy
+    duplicates = {}
+    first_for_key = {}
+    for index, lead in enumerate(leads_list):
+        key = email_cache_key(lead, product_details)
+        if COALESCE_ENABLED and key in first_for_key:
+            duplicates[index] = first_for_key[key]
+            continue
+        first_for_key[key] = index
+        cached = await cache.aget(key) if cache is not None else None
+        if cache is not None:
+            record_cache_lookup(MODEL_NAME, cached is not None)
+        if cached is None:
+            misses.append(index)
+            continue
+        cached['status'] = 'ok'
+        if include_usage:
+            cached["usage"] = {"cache_hit": True}
+        results[index] = cached
+
+    # A repeated lead_id could not be told apart in the answer, so it starts a new pack
+    packs, current, lead_ids = [], [], set()
+    for index in misses:
+        lead_id = str(leads_list[index].get('lead_id'))
+        if current and (len(current) >= pack_size or lead_id in lead_ids):
+            packs.append(current)
+            current, lead_ids = [], set()
+        current.append(index)
+        lead_ids.add(lead_id)
+    if current:
+        packs.append(current)
+
+    async def run_pack(indices: list):
+        pack = [leads_list[index] for index in indices]
+        try:
+            emails, usage, lead_stats, attempts = await _agenerate_pack(pack, product_details, semaphore)
+        except Exception as e:
+            print(f"Packed generation of {len(pack)} leads failed, falling back to single calls: {str(e)}")
+            emails, lead_stats = [None] * len(pack), [{}] * len(pack)
+
+        validated = await asyncio.gather(*(
+            avalidate_email(email, lead, product_details, semaphore)
+            for lead, email in zip(pack, emails)
+            if email is not None
+        ))
+        validated = iter(validated)
+        fallbacks = []
+        for index, lead, email, stats in zip(indices, pack, emails, lead_stats):
+            if email is None:
+                fallbacks.append(index)
+                continue
+            email, repair_usage = next(validated)
+            if cache is not None and "issues" not in email:
+                await cache.aset(email_cache_key(lead, product_details), email)
+            email['status'] = 'ok'
+            if include_usage:
+                # Tokens of the shared call, split evenly across its emails
+                email["usage"] = {
+                    "cache_hit": False,
+                    "pack_size": len(pack),
+                    **{name: count // len(pack) for name, count in usage.items()},
+                    **stats,
+                    "attempts": attempts,
+                }
+                if repair_usage is not None:
+                    email["usage"]["repair"] = repair_usage
+            results[index] = email
+
+        fallback_results = await asyncio.gather(*(
+            _generate_or_error(
+                leads_list[index],
+                product_details,
+                use_cache=use_cache,
+                semaphore=semaphore,
+                include_usage=include_usage,
+            )
+            for index in fallbacks
+        ))
+        for index, result in zip(fallbacks, fallback_results):
+            results[index] = result
+
+    await asyncio.gather(*(run_pack(indices) for indices in packs))
+    for index, first in duplicates.items():
+        results[index] = dict(results[first])
+        # An error from error_email has no usage and is copied as it is
+        if include_usage and "usage" in results[first] and not results[first]["usage"].get("cache_hit"):
+            results[index]["usage"] = {"cache_hit": False, "coalesced": True}
+    return results
+
+
+async def agenerate_email_for_multiple_leads(
+    leads_list: list,
+    product_details: str,
+    max_concurrency: int = None,
+    semaphore: asyncio.Semaphore = None,
+    use_cache: bool = True,
+    include_usage: bool = False,
+    pack_size: int = None,
+    variants: int = None,
+) -> list:
+    """
+    Generate personalized emails for multiple leads concurrently
 
-    # Invoke the model to generate the email
-    email_response = structured_email.invoke(messages)
+    At most max_concurrency LLM calls are in flight at any time. Results are
+    returned in the same order as leads_list, each with a 'status' of 'ok' or
+    'error'; a lead that still fails after retries gets an error dict in its
+    slot instead of failing the whole batch, so only the failed lead_ids need
+    to be resubmitted.
 
-    # Convert the email response to a dictionary    
-    email_response_dict = email_response.model_dump()
+    Args:
+        leads_list (list): List of lead detail dictionaries
+        product_details (str): Product documentation/information
+        max_concurrency (int): Maximum number of concurrent LLM calls
+            (defaults to EMAIL_MAX_CONCURRENCY)
+        semaphore (asyncio.Semaphore): Shared semaphore bounding LLM calls
+            across callers; overrides max_concurrency when given
+        use_cache (bool): Serve and store results in the generation cache
+        include_usage (bool): Add a 'usage' dict with token counts to each result
+        pack_size (int): Write the emails for up to this many leads per LLM
+            call, sharing the prompt's style guide and product context
+            (0 means EMAIL_PACK_SIZE; None or 1 makes one call per lead),
+            capped at MAX_PACK_SIZE
+        variants (int): Generate this many alternative emails per lead with
+            one call each (see agenerate_email_variants); pack_size and
+            use_cache do not apply then
 
-    # Return the email response
-    return email_response_dict
+    Returns:
+        list: List of dictionaries, each containing 'subject', 'body', 'lead_id'
+            and 'status' of the email ('error_type' and 'retryable' on errors).
+            With variants, each lead's variants follow each other in lead
+            order, numbered by 'variant'.
+    """
+    if not leads_list:
+        raise ValueError("No leads provided in the list")
 
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max_concurrency or DEFAULT_MAX_CONCURRENCY)
+
+    if variants is not None and variants > 1:
+        results = await asyncio.gather(*(
+            _generate_variants_or_error(
+                lead, product_details, variants, semaphore=semaphore, include_usage=include_usage
+            )
+            for lead in leads_list
+        ))
+        return [email for lead_results in results for email in lead_results]
+
+    def generate(lead: dict):
+        return _generate_or_error(
+            lead,
+            product_details,
+            use_cache=use_cache,
+            semaphore=semaphore,
+            include_usage=include_usage,
+        )
 
-def generate_email_for_multiple_leads(leads_list: list, product_details: str) -> list:
+    # Start leads grouped by company so each company's digest is built once and
+    # consecutive prompts share the longest possible prefix for prompt caching
+    order = sorted(range(len(leads_list)), key=lambda i: company_key(leads_list[i]))
+    if pack_size is not None and pack_size != 1:
+        results = await _agenerate_packed(
+            [leads_list[i] for i in order],
+            product_details,
+            min(pack_size or DEFAULT_PACK_SIZE, MAX_PACK_SIZE),
+            semaphore,
+            use_cache=use_cache,
+            include_usage=include_usage,
+        )
+    else:
+        results = await asyncio.gather(*(generate(leads_list[i]) for i in order))
+
+    # Put results back in input order
+    ordered = [None] * len(leads_list)
+    for index, result in zip(order, results):
+        ordered[index] = result
+    return ordered
+
+
+async def aiter_emails_for_multiple_leads(
+    leads,
+    product_details: str,
+    max_concurrency: int = None,
+    semaphore: asyncio.Semaphore = None,
+    use_cache: bool = True,
+    include_usage: bool = False,
+):
+    """
+    Generate emails for multiple leads and yield each one as soon as it is ready
+
+    Results are yielded in completion order, so callers should match them by
+    'lead_id'. Only max_concurrency leads are taken from leads at a time, so
+    memory stays flat however many leads there are.
+
+    Args:
+        leads: Iterable of lead detail dictionaries
+        product_details (str): Product documentation/information
+        max_concurrency (int): Maximum number of leads in flight
+            (defaults to EMAIL_MAX_CONCURRENCY)
+        semaphore (asyncio.Semaphore): Shared semaphore bounding LLM calls
+            across callers
+        use_cache (bool): Serve and store results in the generation cache
+        include_usage (bool): Add a 'usage' dict with token counts to each result
+
+    Yields:
+        dict: Dictionary containing 'subject', 'body', and 'lead_id' of the email
+    """
+    window = max_concurrency or DEFAULT_MAX_CONCURRENCY
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(window)
+
+    def generate(lead: dict):
+        return _generate_or_error(
+            lead,
+            product_details,
+            use_cache=use_cache,
+            semaphore=semaphore,
+            include_usage=include_usage,
+        )
+
+    leads = iter(leads)
+    pending = set()
+    try:
+        while True:
+            # Top the window up from the input before waiting on the next result
+            for lead in leads:
+                pending.add(asyncio.ensure_future(generate(lead)))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # The consumer went away (e.g. client disconnected): stop outstanding calls
+        for task in pending:
+            task.cancel()
+
+
+def generate_email_for_multiple_leads(
+    leads_list: list,
+    product_details: str,
+    max_concurrency: int = None,
+    use_cache: bool = True,
+    include_usage: bool = False,
+    mode: str = "interactive",
+    pack_size: int = None,
+) -> list:
     """
     Generate personalized emails for multiple leads
     
@@ -492,43 +808,37 @@ def generate_email_for_multiple_leads(leads_list: list, product_details: str) ->
             - company_overview: str
             - company_industry: str
         product_details (str): Product documentation/information
+        max_concurrency (int): Maximum number of concurrent LLM calls
+            (defaults to EMAIL_MAX_CONCURRENCY)
+        use_cache (bool): Serve and store results in the generation cache
+        include_usage (bool): Add a 'usage' dict with token counts to each result
+        mode (str): 'interactive' for concurrent API calls, or 'batch' to go
+            through the Batch API (cheaper, results within 24h; see batch_api)
+        pack_size (int): Leads per LLM call in interactive mode (see
+            agenerate_email_for_multiple_leads)
         
     Returns:
         list: List of dictionaries, each containing 'subject', 'body', and 'lead_id' of the email
     """
-    if not leads_list:
-        raise ValueError("No leads provided in the list")
-    
-    all_emails = []
-    
-    # Process in batches of 5 leads
-    batch_size = 5
-    for i in range(0, len(leads_list), batch_size):
-        batch_leads = leads_list[i:i + batch_size]
-        
-        # Process each lead in the batch
-        batch_emails = []
-        for lead in batch_leads:
-            try:
-                # Generate email for this lead
-                result = generate_email_for_single_lead(lead, product_details)
-                batch_emails.append(result)
-            except Exception as e:
-                print(f"Error processing lead {lead.get('name', 'Unknown')}: {str(e)}")
-                batch_emails.append({
-                    'subject': 'Error generating email',
-                    'body': f'Error generating personalized email: {str(e)}',
-                    'lead_id': str(lead.get('lead_id'))
-                })
-        
-        # Add the batch results to our main list
-        all_emails.extend(batch_emails)
-        
-        # Add delay between batches to avoid rate limits
-        if i + batch_size < len(leads_list):
-            time.sleep(2)
-    
-    return all_emails
+    if mode == "batch":
+        from batch_api import run_email_batch
+
+        return run_email_batch(
+            leads_list, product_details, use_cache=use_cache, include_usage=include_usage
+        )
+    if mode != "interactive":
+        raise ValueError(f"Unknown generation mode: {mode}")
+
+    return run_sync(
+        agenerate_email_for_multiple_leads(
+            leads_list,
+            product_details,
+            max_concurrency,
+            use_cache=use_cache,
+            include_usage=include_usage,
+            pack_size=pack_size,
+        )
+    )
 
 def main():
     """
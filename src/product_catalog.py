@@ -0,0 +1,467 @@
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+# Number of catalog entries sent with each prompt
+PRODUCT_TOP_K = int(os.getenv("EMAIL_PRODUCT_TOP_K", "1"))
+# Entries scoring below this fraction of the best match are left out
+PRODUCT_MIN_RELATIVE_SCORE = float(os.getenv("EMAIL_PRODUCT_MIN_RELATIVE_SCORE", "0.5"))
+
+# Structured product database: problems, solution, USP, features and benefits per product
+PRODUCTS = {
+"parchaa": {
+    "problem_it_solves": (
+        "Long OPD wait times due to high patient footfall; "
+        "short consultation durations and overworked staff; "
+        "manual processes and lack of automation; "
+        "poor patient engagement and adherence; "
+        "lack of authentic health data for governance and research; "
+        "insufficient infrastructure and digital tools in rural/NGO settings; "
+        "inefficiencies and errors in emergency room triaging; "
+        "limited mental healthcare access in academic institutions."
+    ),
+    "solution": (
+        "A comprehensive AI-powered digital health platform covering OPD, emergency, air-gapped, and wellness workflows. "
+        "It supports the full healthcare journey—onboarding, consultation, follow-up, and monitoring—while being interoperable "
+        "with existing hospital systems and government initiatives like ABHA and Ayushman Bharat. "
+        "It offers remote, offline-compatible deployments, smart dashboards, and CDSS support."
+    ),
+    "unique_selling_point": (
+        "End-to-end digital healthcare platform functional in both online and offline modes; "
+        "powered by advanced AI/LLM models trained on Indian and global clinical standards (ICMR, WHO, CDC, etc.); "
+        "first-in-class emergency room automation tools including triage classification and resource dashboards; "
+        "deep focus on underserved areas and community care; "
+        "modular, white-label deployment suitable for hospitals, NGOs, and academic institutions."
+    ),
+    "features": (
+        "Smart OPD with AI-led triaging, diagnosis, and prescriptions; "
+        "Clinical Decision Support System (CDSS) with alerts for ADRs and contra-indications; "
+        "Patient app with teleconsultation, medication reminders, and adherence tracking; "
+        "Emergency module with auto-triaging and saturation dashboards; "
+        "Air-gapped mode for rural deployment with vitals tracking, inventory management, and follow-up tools; "
+        "WellKiwi for campus wellness including mental health support, insurance, and health analytics; "
+        "Dashboards for administrators, wardens, and doctors; "
+        "Interoperability with existing HIS, ABHA, PHRs, pharmacies, and diagnostics (e.g., 1mg integration)."
+    ),
+    "benefits": (
+        "Reduces patient wait time and improves quality of consultations; "
+        "supports doctors with AI-based decision tools; "
+        "boosts hospital efficiency through automation and data insights; "
+        "enables healthcare access in rural and remote regions; "
+        "improves patient follow-up, engagement, and outcomes; "
+        "promotes mental wellness and proactive health management in students; "
+        "enables fast, accurate emergency triaging; "
+        "standardizes care protocols and improves collaboration among stakeholders."
+    )
+}
+,
+"predCo": {
+  "problem_it_solves": [
+    "Unplanned equipment failures causing production delays and financial losses.",
+    "Inefficient maintenance strategies leading to safety concerns and operational disruptions.",
+    "Fragmented systems and lack of centralized monitoring in industrial operations.",
+    "Lack of real-time visibility and decision-making across assets and departments.",
+    "Stockouts, overstocking, and asset mismanagement in supply chain operations.",
+    "Manual, error-prone inventory tracking methods.",
+    "Delayed threat detection and response in surveillance operations."
+  ],
+  "solution": [
+    "AI-powered predictive maintenance and condition monitoring platform.",
+    "Digital Twin technology to simulate and optimize operations in real time.",
+    "Smart inventory management using RFID and computer vision.",
+    "Centralized monitoring and data integration for legacy systems and SCADA.",
+    "GenAI-powered assistants for real-time document retrieval and support.",
+    "Geofencing solutions for real-time asset tracking and alerts.",
+    "Role-based access and proactive alert systems for operations control."
+  ],
+  "unique_selling_point": [
+    "Unified AI-driven platform integrating IoT, ML, and digital twin technologies.",
+    "Real-time actionable insights across a wide array of machinery and assets.",
+    "Highly scalable and adaptable solutions tailored for legacy and modern systems.",
+    "Seamless integration with existing infrastructure, no new hardware needed.",
+    "Use-case agnostic architecture spanning energy, manufacturing, logistics, and security."
+  ],
+  "features": [
+    "Dynamic dashboards with real-time visualization and KPI tracking.",
+    "Customizable alerts based on threshold breaches and anomaly detection.",
+    "Real-time data acquisition from diverse IoT sensors.",
+    "Integrated ML models to predict equipment failure and remaining useful life.",
+    "Computer vision for automated shelf and item recognition.",
+    "GenAI tools for document digitization and knowledge retrieval.",
+    "Geofencing alerts and asset movement tracking.",
+    "Role-based access and operational rule configuration."
+  ],
+  "benefits": [
+    "Reduce equipment downtime by 35-40%.",
+    "Extend asset lifespan by up to 30%.",
+    "Lower maintenance costs by 8-12%.",
+    "Improve inventory turnover by 40% and reduce shrinkage by 50%.",
+    "Minimize manual monitoring efforts and decision-making delays.",
+    "Achieve up to 87% accuracy in lifecycle predictions of critical components.",
+    "Enhance workplace safety and compliance through AI-powered surveillance.",
+    "Boost operational transparency and inter-departmental collaboration."
+  ]
+},
+"InvestorBase": {
+    "problem_it_solves": [
+        "Overwhelming volume of inbound pitch decks makes it hard for VCs to evaluate each one thoroughly.",
+        "Current deal evaluation processes are manual, slow, biased, and inconsistent.",
+        "Due diligence is time-consuming, taking up to 2 weeks per deal.",
+        "Missed opportunities due to delays and inefficient workflows."
+    ],
+    "solution": [
+        "AI-driven pitch deck analyzer that extracts key information instantly.",
+        "Human-augmented analysis ensures depth and credibility of insights.",
+        "Dynamic opportunity scoring aligned with the fund’s investment thesis.",
+        "Automated red flag detection, validation, and memo generation."
+    ],
+    "unique_selling_point": [
+        "Combines speed and precision of AI with expert analyst judgment.",
+        "Customizable scoring tailored to specific investment theses.",
+        "Scalable solution that handles 10 to 1,000+ decks per month.",
+        "Delivers analyst-grade insights in 24–48 hours."
+    ],
+    "features": [
+        "Pitch Deck Analyzer – instant insights from uploaded decks.",
+        "Thesis Alignment – auto scoring of decks based on fund criteria.",
+        "InsightMaster – AI assistant for deeper analysis.",
+        "Auto Analysis + Alerts – real-time notifications for matching deals.",
+        "Market Intel – context-rich competitive and news insights.",
+        "Investor Research – deeper, customized insights beyond basic data.",
+        "Automated Collection – centralized collection from various sources.",
+        "Investor Memos – auto-generated, ready-to-use investment memos."
+    ],
+    "benefits": [
+        "Faster and smarter deal evaluation with reduced manual effort.",
+        "Increased chances of discovering high-potential investments.",
+        "Higher quality decisions through objective and consistent scoring.",
+        "Significant time savings in screening and due diligence.",
+        "Enhanced founder engagement and reduced deal drop-offs."
+    ]
+},
+   "sankalpam": {
+    "problem_it_solves": "Inefficient temple operations, outdated communication, inadequate resource management, limited accessibility for devotees, and challenges in preserving cultural heritage and managing religious tourism.",
+    
+    "solution": "A technology-driven platform that empowers temples through AI, IoT, and cloud tools to improve operational efficiency, enhance devotee engagement, enable secure fundraising, digitize cultural assets, and modernize communication.",
+    
+    "unique_selling_point": "Sankalpam bridges the gap between tradition and modernity, offering temples smart management tools, immersive devotee experiences, and government collaboration frameworks, all under one unified platform.",
+    
+    "features": [
+        "AI-powered surveillance and crowd control",
+        "IoT-enabled resource and environmental monitoring",
+        "Mobile app for temple services, communication, and ticketing",
+        "Digital donation platforms with global access",
+        "AR/VR-based cultural immersion experiences",
+        "Live streaming of religious rituals (Darshan)",
+        "Virtual pooja booking (Sankalp)",
+        "Online astrology consultations (Jyotish Vani)",
+        "Sacred offering delivery (Prasadam)",
+        "Pilgrimage planning assistance (Yatra)",
+        "Comprehensive Hindu knowledge repository (Gyan Kosh)"
+    ],
+    
+    "benefits": {
+        "For Temples": [
+            "Enhanced operational efficiency and crowd management",
+            "Reduced administrative costs and better resource allocation",
+            "Increased donations and new revenue streams",
+            "Greater transparency in financial management",
+            "Improved security and heritage preservation"
+        ],
+        "For Devotees": [
+            "Seamless access to services through online bookings and virtual participation",
+            "Personalized spiritual experiences",
+            "Improved accessibility for elderly and differently-abled",
+            "Interactive cultural education and deeper immersion"
+        ],
+        "For Governments": [
+            "Smart heritage management using data and AI",
+            "Boosted religious tourism and economic development",
+            "Stronger cultural preservation and social impact through temple-centric community engagement"
+        ]
+    }
+},
+"Opticall": {
+    "problem_it_solves": 
+        "General: High call volumes, inconsistent call handling quality, delayed insights, and ineffective coaching that increase costs and reduce performance.\n"
+        "Sales Center: Sales reps face chaotic lead volumes, cold leads, and lack real-time visibility into performance gaps, resulting in missed revenue opportunities.\n"
+        "Contact Center: Overwhelmed agents, long wait times, inconsistent service, and buried insights lead to high costs, low customer satisfaction, and limited performance visibility.",
+    
+    "solution": 
+        "General: A unified AI platform that automates queries via bots, supports agents in real time, and converts raw call data into actionable insights through customizable dashboards.\n"
+        "Sales Center: Automates repetitive lead engagement, provides real-time pitch coaching, and surfaces deep post-call insights to optimize sales conversions.\n"
+        "Contact Center: Automates customer queries with virtual agents, supports agents with real-time assistance, and delivers performance insights from every call to improve support quality.",
+    
+    "unique_selling_point": 
+        "General: Modular, phygital-ready architecture with deep tech and lightweight deployment that fits any workflow and delivers real-time insights across audio, video, and text.\n"
+        "Sales Center: Requires no change in existing sales workflows—adapts to your team with flexible tools, custom templates, and sales-specific dashboards.\n"
+        "Contact Center: Fully customizable to existing support operations, delivering automation and real-time coaching without altering how your team works.",
+    
+    "features": 
+        "General: Agent Assist, automated call scoring, dynamic dashboards, vernacular engine (28+ languages), real-time prompts, and video/audio analytics.\n"
+        "Sales Center: Virtual sales agents, real-time objection handling, pitch prompts, AI-powered knowledge base, performance dashboards, multilingual support, and coaching tools.\n"
+        "Contact Center: AI-powered virtual agents, real-time agent guidance with visual checklists, instant knowledge access, automated escalations, coaching hub, and compliance support.",
+    
+    "benefits": 
+        "General: +18 CSAT points, 95% QA coverage (up from 2%), and 22% reduction in support costs with real-time insights and automation.\n"
+        "Sales Center: 12% increase in conversions, 9% growth in monthly bookings, 18% reduction in customer acquisition cost, and accelerated deal closures.\n"
+        "Contact Center: +18 CSAT points, 98% QA coverage."
+},
+    "IndikaAI": {
+        "problem_it_solves": (
+            "Enterprises face challenges in AI adoption due to unclear AI roadmaps, data readiness issues, "
+            "lack of internal expertise, difficulty integrating AI with existing systems, and rapid technology changes. "
+            "These factors hinder ROI and effective AI implementation."
+        ),
+        "solution": (
+            "Indika AI provides end-to-end AI solutions, including strategy formulation, data preparation, "
+            "foundation model selection, model fine-tuning, deployment, and continuous monitoring. It offers tailored "
+            "products for industries like healthcare, judiciary, infrastructure, and customer service."
+        ),
+        "unique_selling_point": (
+            "Comprehensive AI development lifecycle support, domain-specific AI products, access to 50,000+ experts "
+            "across 100+ languages, and experience across sectors including judiciary, healthcare, infrastructure, and BFSI."
+        ),
+        "features": (
+            "• AI strategy and roadmap development\n"
+            "• Data digitization, anonymization, and labeling\n"
+            "• Custom generative AI, NLP, computer vision, and audio processing\n"
+            "• Platforms like DigiVerse (digitization), DataStudio (model training), FlexiBench (expert workforce)\n"
+            "• Industry-specific AI solutions (Nyaay AI, PredCo, RoadVision AI, Parchaa AI, Choice AI)\n"
+            "• Ready-to-deploy tools (OCR, speech-to-text, trust & safety, synthetic data generation)"
+        ),
+        "benefits": (
+            "• Faster and smoother AI adoption\n"
+            "• Improved operational efficiency and automation\n"
+            "• Enhanced decision-making through AI-powered insights\n"
+            "• Access to scalable AI solutions tailored to specific industries\n"
+            "• Expert support across all AI development stages\n"
+            "• Multilingual and multidisciplinary support"
+        )
+},
+"Flexibench": {
+    "problem_it_solves": "Lack of trained professionals with domain-specific expertise to contribute to AI systems effectively; need for culturally and linguistically aware AI development.",
+    "solution": "A talent development hub that trains domain experts in hands-on AI tasks (e.g., data labeling, RLHF, annotation), offering real project experience and earnings while learning.",
+    "unique_selling_point": "Combines real-world AI project exposure with specialized domain training and global language support, turning professionals into AI contributors.",
+    "features": [
+        "Training across 100+ languages for localization and bias reduction",
+        "Tailored learning paths in fields like law, medicine, engineering, and linguistics",
+        "Real industry experience through live AI projects",
+        "Focus on essential AI lifecycle skills (data labeling, RLHF, annotation)",
+        "Support for 20+ academic fields with 60,000+ experts onboarded"
+    ],
+    "benefits": [
+        "Earn while gaining AI industry experience",
+        "Transform domain knowledge into valuable AI contributions",
+        "Enable accurate, culturally aware AI systems",
+        "Promote India's global role in AI excellence",
+        "Join a global network of trained professionals for AI projects"
+    ]
+},
+"InspireAI": {
+    "problem_it_solves": "Content creators and marketers face burnout, creative blocks, and inefficiencies when generating engaging and consistent content across platforms.",
+    "solution": "InspireAI offers an AI-powered platform that generates personalized, high-quality, and engaging content at scale, reducing the creative workload and boosting productivity.",
+    "unique_selling_point": "Combines personalization, scalability, and creative storytelling powered by AI, tailored specifically for content marketers and creators.",
+    "features": [
+        "AI-driven content generation",
+        "Personalized content suggestions",
+        "Multi-platform optimization",
+        "Content calendar integration",
+        "Real-time collaboration tools",
+        "Performance analytics and insights"
+    ],
+    "benefits": [
+        "Saves time and reduces creative fatigue",
+        "Increases content output without compromising quality",
+        "Boosts audience engagement through personalized storytelling",
+        "Streamlines content workflow for teams and individuals",
+        "Improves ROI through data-driven content strategies"
+    ]
+},
+"Insituate": {
+    "problem_it_solves": (
+        "Businesses struggle with rapid AI advancements due to lack of AI talent, "
+        "compliance concerns (handling sensitive data), and compatibility issues with legacy systems."
+    ),
+    "solution": (
+        "A secure, no-code, end-to-end AI development platform enabling enterprises to adopt "
+        "state-of-the-art LLMs and RAG pipelines, while keeping all data in-house."
+    ),
+    "unique_selling_point": (
+        "The only platform to offer a no-code, one-stop solution for building end-to-end AI copilots "
+        "that integrate with legacy systems and prioritize data security."
+    ),
+    "features": (
+        "• In-situ (on-premise) database\n"
+        "• No-code development interface\n"
+        "• Ironclad security protocols\n"
+        "• State-of-the-art LLM and RAG integration\n"
+        "• 100+ pre-built templates\n"
+        "• Compatibility with legacy software\n"
+        "• Gridsearch for copilot optimization\n"
+        "• Sentry mode for continuous improvement\n"
+        "• AutoLLM deployment within a week\n"
+        "• LLMOps capabilities\n"
+        "• On-cloud and on-premise deployment options\n"
+        "• Team collaboration and one-click export"
+    ),
+    "benefits": (
+        "• Accelerates enterprise AI adoption without requiring in-house AI talent\n"
+        "• Maintains data privacy and regulatory compliance\n"
+        "• Saves time and cost (AutoLLM in 1 week vs. traditional 24 months)\n"
+        "• Streamlines development and deployment with minimal technical barriers\n"
+        "• Empowers internal teams to create domain-specific copilots\n"
+        "• Taps into a large, global, multi-vertical market"
+    )
+},
+"choiceAI": {
+    "problem_it_solves": (
+        "1. Lack of regulatory framework for OTT content certification.\n"
+        "2. Inability of OTT platforms to filter offensive or harmful content effectively.\n"
+        "3. Viewer concerns about exposure to explicit/inappropriate content and lack of parental controls.\n"
+        "4. Production houses face delays and risks in content release due to censorship.\n"
+        "5. Lack of personalized content access and inclusivity for diverse viewers."
+    ),
+    "solution": (
+        "1. AI tool that ensures responsible content distribution and compliance.\n"
+        "2. Personalized viewer experience using advanced tagging and filtering.\n"
+        "3. Parental controls and content warnings to protect minors and sensitive viewers.\n"
+        "4. Streamlined certification and approval process for content creators.\n"
+        "5. Intelligent content assessment to maintain compliance without limiting creativity."
+    ),
+    "unique_selling_point": (
+        "Only solution offering comprehensive customization, real-time AI moderation, "
+        "personalized viewing, compliance with censorship, and collaboration with CBFC and OTT platforms."
+    ),
+    "features": (
+        "1. Choice Tagger: Tags content (e.g., sex, violence, nudity) for CBFC and OTT.\n"
+        "2. Choice Viewer: Lets users filter content based on tags.\n"
+        "3. AI-powered moderation and certification.\n"
+        "4. Personalized recommendations and curated experiences.\n"
+        "5. Parental control and age-based filtering.\n"
+        "6. Collaboration tools for CBFC and independent creators.\n"
+        "7. OEM integration with OTT platforms."
+    ),
+    "benefits": (
+        "1. Viewers enjoy safe, personalized, and culturally sensitive content.\n"
+        "2. Parents can restrict inappropriate content for children.\n"
+        "3. Content creators maintain creative freedom while complying with regulations.\n"
+        "4. OTT platforms enhance user experience and reduce legal risk.\n"
+        "5. CBFC streamlines verification and sets unified digital standards.\n"
+        "6. Independent creators gain exposure and platform support.\n"
+        "7. Faster content approval and reduced release delays."
+    )
+}
+}
+
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the to with "
+    "we our your their this these those into across all can more".split()
+)
+# Product names count this many times, so naming a product outweighs shared vocabulary
+_NAME_WEIGHT = 3
+
+
+def tokenize(text: str) -> list:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def _flatten(value) -> str:
+    """
+    Join a catalog field (str, list or nested dict of lists) into plain text
+    """
+    if isinstance(value, dict):
+        return "\n".join(f"{key}: {_flatten(item)}" for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return "\n".join(_flatten(item) for item in value)
+    return str(value)
+
+
+def render_product(name: str, fields: dict) -> str:
+    """
+    Render one catalog entry as compact text for the prompt
+    """
+    lines = [f"{name}:"]
+    for field, value in fields.items():
+        lines.append(f"- {field.replace('_', ' ')}: {_flatten(value)}")
+    return "\n".join(lines)
+
+
+class ProductIndex:
+    """
+    Okapi BM25 index over the product catalog
+
+    Args:
+        products (dict): Product name -> catalog fields
+        k1 (float): Term frequency saturation
+        b (float): Document length normalisation
+    """
+
+    def __init__(self, products: dict, k1: float = 1.5, b: float = 0.75):
+        self.products = products
+        self.k1 = k1
+        self.b = b
+        self._names = list(products)
+        self._docs = []
+        for name, fields in products.items():
+            name_tokens = tokenize(re.sub(r"(?<=[a-z])(?=[A-Z])", " ", name)) + tokenize(name)
+            self._docs.append(Counter(name_tokens * _NAME_WEIGHT + tokenize(_flatten(fields))))
+        self._lengths = [sum(doc.values()) for doc in self._docs]
+        self._avg_length = sum(self._lengths) / len(self._lengths)
+        frequencies = Counter(term for doc in self._docs for term in doc)
+        count = len(self._docs)
+        self._idf = {
+            term: math.log(1 + (count - freq + 0.5) / (freq + 0.5))
+            for term, freq in frequencies.items()
+        }
+
+    def search(self, query: str, top_k: int = PRODUCT_TOP_K) -> list:
+        """
+        Return up to top_k (name, score) pairs with a positive score, best first
+        """
+        terms = Counter(tokenize(query))
+        scores = []
+        for name, doc, length in zip(self._names, self._docs, self._lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self._avg_length)
+            for term, query_count in terms.items():
+                freq = doc.get(term)
+                if freq:
+                    score += query_count * self._idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((name, score))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:top_k]
+
+
+_index = ProductIndex(PRODUCTS)
+
+
+@lru_cache(maxsize=256)
+def relevant_product_context(product_details: str, top_k: int = PRODUCT_TOP_K) -> str:
+    """
+    Catalog entries matching product_details, rendered for the prompt
+
+    Entries scoring under PRODUCT_MIN_RELATIVE_SCORE of the best match are
+    dropped; an empty string means nothing in the catalog matches.
+    """
+    matches = _index.search(product_details, top_k)
+    if not matches:
+        return ""
+    best = matches[0][1]
+    return "\n\n".join(
+        render_product(name, PRODUCTS[name])
+        for name, score in matches
+        if score >= best * PRODUCT_MIN_RELATIVE_SCORE
+    )
+
+
+def full_catalog_text() -> str:
+    """
+    Every catalog entry rendered for the prompt
+    """
+    return "\n\n".join(render_product(name, fields) for name, fields in PRODUCTS.items())
@@ -0,0 +1,266 @@
+import json
+
+from product_catalog import full_catalog_text, relevant_product_context
+
+# Tone and style guide for every email
+style = """
+Start with a greeting and then go on to say that you are reaching out because of [reason].
+Do not use too much buttering and unnecessary words specially after the first line (I was going through your profile and noticed your inspiring journey is phenomenal,fabulous, etc. Don't use such unnecessary buttering. Jus go like "I was going through your profile and noticed [mention things which are relevant to product and matches with the lead's profile, no unnecessary buttering]")
+Be casual, friendly and direct. 
+It should be a short, personalized email (100–150 words) to a potential lead who could benefit from your product/service/solution. It should:
+                    1.	Start with deep personalization — Reference something specific about the lead’s business, role, recent announcement, or pain point you’ve identified. Show you understand them—not just their company name. Use different phrases/styles/variation/words to start the email.
+                    2.	Make a relevant connection — Briefly explain who you are and why you’re reaching out. Make it clear why they specifically are a fit for what you offer.
+                    3. Talk about the problems in the lead's industry and how the product can solve the problem.
+                    4.	Focus on value (not features) — Position your solution around a problem or opportunity that matters to them. Avoid a hard sell—offer insight, benefit, or a useful idea that shows you can help.
+                    5.	Keep it short and natural — Write like a human, not a sales robot. End with a simple CTA (e.g., “open to a quick chat?” or “would you be interested in exploring this further?”).
+
+Use human like tone and language. Follow this style:
+1. First Person Pronouns: I, me, my, mine, we, us, our, ours. Write as if you are the one talking to the lead and do not use generalised statements.
+2. Fillers & Disfluencies
+Spoken or informal written human language often includes:
+	•	uh, um, like, you know, kinda, sorta, actually, basically, literally
+	•	contractions: gonna, wanna, gotta, ain't
+3. Personal Experience Markers
+	•	I think, I believe, I feel, in my opinion
+	•	yesterday, last week, when I was in school
+	•	my friend, my boss, my mom said
+4. Typos and Misspellings
+Humans often make minor spelling or grammatical errors:
+	•	definately → definitely
+	•	alot → a lot
+	•	seperate → separate
+5. Emotional/Spontaneous Expressions
+Humans express feelings impulsively or with less filter:
+	•	wow, amazing, omg, haha, lol, damn, yay
+	•	love it, hate that, so cool, super weird
+"""
+
+# Full product database as text; prompts only carry the entries relevant to the product
+product_database = full_catalog_text()
+
+
+SYSTEM_INSTRUCTIONS = (
+    "You are an B2B expert marketer. Based on the list of leads, their details and the product document provides , write a personalized email to the lead  in a concise manner, keeping in mind they have limited time to read the email. Write in a way that a fifth year student can understand and state your objective of helping the lead with your product. "
+    "You avoid formal templates, skip unnecessary flattery, and talk like a real person. Follow the tone and style guide provided. "
+    "Refer to the product database entries given with the product details for context, problems in lead's industry and how the product can solve the problem. "
+    "Do fact check about the problems and after verifying the facts, put them in the email else dont."
+)
+
+TASK_INSTRUCTIONS = """
+Write a personalized email for the lead given in the user message. Follow the subject/body formatting rules. Return the result in a JSON object with keys: 'subject', 'body', and 'lead_id'. Keep variations in starting the email, use different way to start the email. Make sure the email must not contain any placeholders (like [xyz]). For sender's contact details, use the details given in the "ProductDetails" section.
+
+Return the results in a dictionary with these keys:
+1. 'subject': The email subject line (style as provided)
+2. 'body': The email body content. It must contain;
+    - Greeting with the lead's name
+    - Content in multiple paragraphs in the above mentioned style
+    - Closing with a call to action
+    - Sender's contact details (Take from the ProductDetails section, skip if not provided)
+3. 'lead_id': The lead ID
+"""
+
+PACKED_TASK_INSTRUCTIONS = """
+Write a separate personalized email for every lead given in the user message; the leads are independent of each other and each email must only use its own lead's details. Follow the subject/body formatting rules. Keep variations in starting the emails, use a different way to start each one. Make sure no email contains any placeholders (like [xyz]). For sender's contact details, use the details given in the "ProductDetails" section.
+
+Return a JSON object with the key 'emails': a list with exactly one entry per lead, each a dictionary with these keys:
+1. 'subject': The email subject line (style as provided)
+2. 'body': The email body content. It must contain;
+    - Greeting with the lead's name
+    - Content in multiple paragraphs in the above mentioned style
+    - Closing with a call to action
+    - Sender's contact details (Take from the ProductDetails section, skip if not provided)
+3. 'lead_id': The lead ID, copied exactly from that lead's details
+"""
+
+VARIANTS_TASK_INSTRUCTIONS = """
+Write several alternative personalized emails for the lead given in the user message, as many as the user message asks for; they are candidates for an A/B test of subject lines and openings. Follow the subject/body formatting rules. Every version must have its own subject line and start in its own way, with a different angle, hook or first sentence; do not reword one email several times. Make sure no email contains any placeholders (like [xyz]). For sender's contact details, use the details given in the "ProductDetails" section.
+
+Return a JSON object with the key 'variants': a list with one entry per version, each a dictionary with these keys:
+1. 'subject': The email subject line (style as provided)
+2. 'body': The email body content. It must contain;
+    - Greeting with the lead's name
+    - Content in multiple paragraphs in the above mentioned style
+    - Closing with a call to action
+    - Sender's contact details (Take from the ProductDetails section, skip if not provided)
+3. 'lead_id': The lead ID
+"""
+
+# Everything that does not depend on the request, assembled once in a fixed
+# order so the provider's automatic prompt caching sees a byte-identical
+# prefix on every call
+SYSTEM_PROMPT = (
+    SYSTEM_INSTRUCTIONS
+    + "\n\nStyle Guide:\n" + style
+    + "\nTask:\n" + TASK_INSTRUCTIONS
+)
+
+# System prompt for packed calls, which write the emails for several leads at once
+PACKED_SYSTEM_PROMPT = (
+    SYSTEM_INSTRUCTIONS
+    + "\n\nStyle Guide:\n" + style
+    + "\nTask:\n" + PACKED_TASK_INSTRUCTIONS
+)
+
+# System prompt for calls writing several versions of one lead's email
+VARIANTS_SYSTEM_PROMPT = (
+    SYSTEM_INSTRUCTIONS
+    + "\n\nStyle Guide:\n" + style
+    + "\nTask:\n" + VARIANTS_TASK_INSTRUCTIONS
+)
+
+USER_TEMPLATE = """Product database entries:
+{product_context}
+
+"ProductDetails":
+{product_details}
+{company_section}
+Lead Details:
+{lead_details}
+"""
+
+# Appended to the user message of a variants call, after the lead
+VARIANTS_REQUEST_TEMPLATE = """
+Write {variants} versions of the email.
+"""
+
+PACKED_USER_TEMPLATE = """Product database entries:
+{product_context}
+
+"ProductDetails":
+{product_details}
+
+Leads:
+{leads}"""
+
+PACKED_LEAD_TEMPLATE = """
+--- Lead {number} ---
+{company_section}
+Lead Details:
+{lead_details}
+"""
+
+COMPANY_TEMPLATE = """
+Lead's Company:
+{company_context}
+"""
+
+
+def render_lead(lead_details: dict) -> str:
+    """
+    Serialise lead details deterministically for the prompt
+    """
+    return json.dumps(lead_details, ensure_ascii=False, indent=1, default=str)
+
+
+def build_messages(
+    lead_details: dict, product_details: str, company_context: str = None, variants: int = None
+) -> list:
+    """
+    Build the chat messages used to generate an email for one lead
+
+    The static system prompt comes first, then the product context shared by
+    a whole batch (the best matching catalog entries and the product details),
+    then the company digest shared by leads at the same company, and the
+    person-specific content last.
+
+    Args:
+        lead_details (dict): Lead details (see generate_email_for_single_lead)
+        product_details (str): Product documentation/information
+        company_context (str): Condensed company description; when given,
+            lead_details should no longer carry the company fields
+        variants (int): Ask for this many alternative emails in one answer
+            instead of a single email
+
+    Returns:
+        list: Messages in the role/content format accepted by ChatOpenAI
+    """
+    content = USER_TEMPLATE.format(
+        product_context=relevant_product_context(product_details) or "(no matching entry)",
+        product_details=product_details.strip(),
+        company_section=COMPANY_TEMPLATE.format(company_context=company_context) if company_context else "",
+        lead_details=render_lead(lead_details),
+    )
+    if variants:
+        return [
+            {"role": "system", "content": VARIANTS_SYSTEM_PROMPT},
+            {"role": "user", "content": content + VARIANTS_REQUEST_TEMPLATE.format(variants=variants)},
+        ]
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+
+def build_packed_messages(leads: list, product_details: str) -> list:
+    """
+    Build the chat messages used to generate emails for several leads in one call
+
+    The product context is sent once for the whole pack; each lead follows
+    with its own company digest.
+
+    Args:
+        leads (list): (lead_details, company_context) pairs, as for build_messages
+        product_details (str): Product documentation/information
+
+    Returns:
+        list: Messages in the role/content format accepted by ChatOpenAI
+    """
+    lead_blocks = "".join(
+        PACKED_LEAD_TEMPLATE.format(
+            number=number,
+            company_section=COMPANY_TEMPLATE.format(company_context=company_context) if company_context else "",
+            lead_details=render_lead(lead_details),
+        )
+        for number, (lead_details, company_context) in enumerate(leads, start=1)
+    )
+    return [
+        {"role": "system", "content": PACKED_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": PACKED_USER_TEMPLATE.format(
+                product_context=relevant_product_context(product_details) or "(no matching entry)",
+                product_details=product_details.strip(),
+                leads=lead_blocks,
+            ),
+        },
+    ]
+
+
+# Fix-up call for the parts of an email that failed validation; it only sees
+# those paragraphs, not the lead or the product
+REPAIR_SYSTEM_PROMPT = """You fix specific problems in paragraphs of a sales email without rewriting it.
+You get the problems and numbered paragraphs. Return a JSON object with the key 'paragraphs': the fixed paragraphs, exactly one per numbered paragraph and in the same order. Change only what the problems require and keep the wording, tone, facts, greeting, call to action and sign-off. Never write placeholders such as [your name]."""
+
+REPAIR_USER_TEMPLATE = """Problems:
+{problems}
+
+Sender details (use these; leave out anything not listed):
+{sender_details}
+
+Paragraphs:
+{paragraphs}"""
+
+
+def build_repair_messages(paragraphs: list, problems: list, sender_details: dict) -> list:
+    """
+    Build the chat messages for a fix-up call on some paragraphs of an email
+
+    Args:
+        paragraphs (list): Paragraphs to fix, in order
+        problems (list): One sentence per problem to fix
+        sender_details (dict): Sender details known from the product text
+
+    Returns:
+        list: Messages in the role/content format accepted by ChatOpenAI
+    """
+    return [
+        {"role": "system", "content": REPAIR_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": REPAIR_USER_TEMPLATE.format(
+                problems="\n".join(f"- {problem}" for problem in problems),
+                sender_details="\n".join(f"{key}: {value}" for key, value in sender_details.items()) or "(none)",
+                paragraphs="\n\n".join(f"[{number}] {paragraph}" for number, paragraph in enumerate(paragraphs, 1)),
+            ),
+        },
+    ]
@@ -0,0 +1,304 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Starting budget; the provider's x-ratelimit-* headers replace these after the first response
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_RPM_LIMIT", "5000"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TPM_LIMIT", "2000000"))
+# Pause applied after a 429 that carries no Retry-After or reset header
+DEFAULT_RETRY_AFTER = 1.0
+# SQLite file holding a budget shared by every worker process on this host;
+# unset, each process keeps its own budget
+RATE_LIMIT_DB_PATH = os.getenv("OPENAI_RATE_LIMIT_DB", "")
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse a rate-limit reset value such as '1s', '6m0s' or '20ms' into seconds
+
+    Returns None if the value cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(messages: list) -> int:
+    """
+    Cheaply estimate the prompt tokens of a list of role/content messages
+
+    Uses the ~4 characters per token rule of thumb plus the per-message
+    overhead of the chat format; it only has to be close enough to pace calls.
+    """
+    return sum(len(str(message.get("content", ""))) // 4 + 4 for message in messages) + 3
+
+
+class _Bucket:
+    """
+    Token bucket refilled continuously at capacity per minute
+
+    The level may go negative: a reservation always succeeds and the caller
+    waits until the bucket has refilled back to zero.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float) -> float:
+        """
+        Remove amount from the bucket and return how long the caller has to wait
+        """
+        self.level -= amount
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class RateLimiter:
+    """
+    Adaptive requests-per-minute and tokens-per-minute limiter
+
+    Each LLM call reserves one request and its estimated prompt tokens before
+    it is sent. Responses from the provider feed back through observe_response:
+    x-ratelimit-limit-* headers resize the buckets, x-ratelimit-remaining-*
+    headers pull the local budget down to what the provider reports, and a
+    429 pauses every caller for Retry-After seconds.
+
+    The limiter is thread-safe and can be awaited from any event loop.
+    """
+
+    def __init__(self, requests_per_minute: int = None, tokens_per_minute: int = None):
+        self._lock = threading.Lock()
+        self._requests = _Bucket(requests_per_minute or DEFAULT_REQUESTS_PER_MINUTE)
+        self._tokens = _Bucket(tokens_per_minute or DEFAULT_TOKENS_PER_MINUTE)
+        self._blocked_until = 0.0
+
+    @contextlib.contextmanager
+    def _state(self):
+        """
+        Hold the buckets for reading and updating
+        """
+        with self._lock:
+            yield
+
+    def _reserve(self, tokens: int) -> float:
+        """
+        Charge one request and tokens to the buckets and return the delay before sending
+        """
+        with self._state():
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            # A single call larger than the whole bucket would otherwise never go through
+            tokens = min(tokens, self._tokens.capacity)
+            delay = max(
+                self._requests.take(1),
+                self._tokens.take(tokens),
+                self._blocked_until - now,
+            )
+            return max(delay, 0.0)
+
+    async def _run(self, function, *args):
+        """
+        Run a budget update from the event loop
+        """
+        return function(*args)
+
+    async def acquire(self, tokens: int = 0):
+        """
+        Wait until a request with the given estimated tokens fits in the budget
+        """
+        delay = await self._run(self._reserve, tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def observe_response(self, status_code: int, headers) -> None:
+        """
+        Adjust the budget from a provider response's status and rate-limit headers
+
+        Args:
+            status_code (int): HTTP status of the response
+            headers: Case-insensitive mapping of response headers
+        """
+        limit_requests = headers.get("x-ratelimit-limit-requests")
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+
+        with self._state():
+            now = time.monotonic()
+            for bucket, limit, remaining in (
+                (self._requests, limit_requests, remaining_requests),
+                (self._tokens, limit_tokens, remaining_tokens),
+            ):
+                bucket.refill(now)
+                if limit and limit.isdigit() and int(limit) > 0:
+                    bucket.capacity = float(limit)
+                if remaining and remaining.isdigit():
+                    bucket.level = min(bucket.level, float(remaining))
+
+            if status_code == 429:
+                retry_after = self._retry_after(headers)
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+                self._requests.level = min(self._requests.level, 0.0)
+                self._tokens.level = min(self._tokens.level, 0.0)
+
+    async def aobserve_response(self, status_code: int, headers) -> None:
+        """
+        observe_response for callers on the event loop
+        """
+        await self._run(self.observe_response, status_code, headers)
+
+    @staticmethod
+    def _retry_after(headers) -> float:
+        """
+        Seconds to pause after a 429, from Retry-After or the reset headers
+        """
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            delay = parse_duration(retry_after_ms)
+            if delay is not None:
+                return delay / 1000.0
+        for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+            delay = parse_duration(headers.get(name))
+            if delay is not None:
+                return delay
+        return DEFAULT_RETRY_AFTER
+
+    def stats(self) -> dict:
+        """
+        Current budget, for logging and diagnostics
+        """
+        with self._state():
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            return {
+                "requests_per_minute": self._requests.capacity,
+                "tokens_per_minute": self._tokens.capacity,
+                "requests_available": self._requests.level,
+                "tokens_available": self._tokens.level,
+                "blocked_for": max(self._blocked_until - now, 0.0),
+            }
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    RateLimiter whose budget lives in a SQLite file shared by several processes
+
+    Every reservation and observed response loads the buckets, updates them
+    and writes them back in one IMMEDIATE transaction, so the worker
+    processes of a host draw on a single budget for the API key and a 429
+    seen by one of them pauses them all. Bucket times come from
+    time.monotonic, which is the same clock in every process of the host.
+    Waiting for the file's write lock can take a while when the workers are
+    busy, so acquire and aobserve_response do it on a thread of their own
+    instead of the event loop.
+
+    Args:
+        path (str): SQLite file holding the budget
+        requests_per_minute (int): Starting request budget if the file has none yet
+        tokens_per_minute (int): Starting token budget if the file has none yet
+    """
+
+    def __init__(self, path: str, requests_per_minute: int = None, tokens_per_minute: int = None):
+        super().__init__(requests_per_minute, tokens_per_minute)
+        # Transactions are managed explicitly; the budget is worthless after a crash
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "requests_capacity REAL, requests_level REAL, requests_updated REAL, "
+            "tokens_capacity REAL, tokens_level REAL, tokens_updated REAL, blocked_until REAL)"
+        )
+        # Updates are serialised by _lock anyway, so one thread is enough
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="rate-limit")
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    @contextlib.contextmanager
+    def _state(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT requests_capacity, requests_level, requests_updated, "
+                    "tokens_capacity, tokens_level, tokens_updated, blocked_until FROM rate_limit"
+                ).fetchone()
+                # Times ahead of the clock were written before the host rebooted
+                if row is not None and max(row[2], row[5]) <= time.monotonic():
+                    (
+                        self._requests.capacity, self._requests.level, self._requests.updated,
+                        self._tokens.capacity, self._tokens.level, self._tokens.updated,
+                        self._blocked_until,
+                    ) = row
+                yield
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit VALUES (0, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        self._requests.capacity, self._requests.level, self._requests.updated,
+                        self._tokens.capacity, self._tokens.level, self._tokens.updated,
+                        self._blocked_until,
+                    ),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+def reset_shared_budget(path: str):
+    """
+    Forget the budget stored in a SharedRateLimiter file, e.g. when a deployment starts
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS rate_limit")
+    finally:
+        conn.close()
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Return the process-wide rate limiter shared by every LLM call
+
+    With OPENAI_RATE_LIMIT_DB set the budget is also shared with the other
+    processes using that file.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = SharedRateLimiter(RATE_LIMIT_DB_PATH) if RATE_LIMIT_DB_PATH else RateLimiter()
+        return _rate_limiter
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+
+import httpx
+from pydantic import ValidationError
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    stop_before_delay,
+    wait_random_exponential,
+)
+
+from llm_client import StructuredOutputError
+
+# Retry policy for LLM calls: attempts per lead, overall deadline in seconds
+# and the bounds of the jittered exponential backoff between attempts
+RETRY_MAX_ATTEMPTS = int(os.getenv("EMAIL_RETRY_ATTEMPTS", "4"))
+RETRY_DEADLINE = float(os.getenv("EMAIL_RETRY_DEADLINE", "90"))
+RETRY_INITIAL_WAIT = float(os.getenv("EMAIL_RETRY_INITIAL_WAIT", "0.5"))
+RETRY_MAX_WAIT = float(os.getenv("EMAIL_RETRY_MAX_WAIT", "20"))
+
+# Error kinds worth another attempt; 'rejected' and 'fatal' are not retried
+RETRYABLE_ERRORS = {"rate_limited", "server_error", "timeout", "connection", "parse_error"}
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Sort an exception from an LLM call into an error kind
+
+    Returns:
+        str: 'rate_limited', 'server_error', 'timeout', 'connection' or
+            'parse_error' for transient failures, 'rejected' when the provider
+            refused the request (bad request, authentication, exhausted quota)
+            and 'fatal' for everything else (e.g. a missing API key)
+    """
+    # Imported here to keep the SDK off the startup path; any LLM error
+    # means it is loaded already
+    import openai
+
+    if isinstance(error, openai.RateLimitError):
+        # A 429 for an exhausted quota will not clear up by waiting
+        if getattr(error, "code", None) == "insufficient_quota":
+            return "rejected"
+        return "rate_limited"
+    if isinstance(error, (openai.APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return "connection"
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code >= 500 or error.status_code in (408, 409):
+            return "server_error"
+        return "rejected"
+    parse_errors = (StructuredOutputError, ValidationError, openai.LengthFinishReasonError)
+    # LangChain's parser error can only occur once the LangChain backend has loaded it
+    langchain_exceptions = sys.modules.get("langchain_core.exceptions")
+    if langchain_exceptions is not None:
+        parse_errors += (langchain_exceptions.OutputParserException,)
+    if isinstance(error, parse_errors):
+        return "parse_error"
+    return "fatal"
+
+
+def is_retryable(error: Exception) -> bool:
+    return classify_error(error) in RETRYABLE_ERRORS
+
+
+async def aretry(call, deadline: float = RETRY_DEADLINE, max_attempts: int = RETRY_MAX_ATTEMPTS, on_retry=None):
+    """
+    Await call() until it succeeds, retrying transient failures
+
+    Waits between attempts are drawn uniformly from an exponentially growing
+    window (full jitter), so leads that failed together do not retry together.
+    No attempt is started if its wait would run past the deadline; the last
+    error is then re-raised unchanged.
+
+    Args:
+        call: Coroutine function making one attempt
+        deadline (float): Seconds after the first attempt within which retries may start
+        max_attempts (int): Maximum number of attempts, including the first
+        on_retry: Called with the exception of each attempt that will be retried
+
+    Returns:
+        tuple: (result of call, number of attempts made)
+    """
+    retrying = AsyncRetrying(
+        retry=retry_if_exception(is_retryable),
+        wait=wait_random_exponential(multiplier=RETRY_INITIAL_WAIT, max=RETRY_MAX_WAIT),
+        stop=stop_after_attempt(max_attempts) | stop_before_delay(deadline),
+        reraise=True,
+        before_sleep=(lambda state: on_retry(state.outcome.exception())) if on_retry else None,
+    )
+    async for attempt in retrying:
+        with attempt:
+            result = await call()
+    return result, attempt.retry_state.attempt_number
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from metrics import record_scheduler_wait, set_scheduler_queued
+
+# Priority classes: requests a person is waiting on, and batch work
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Share of the LLM tokens each class gets while both have calls waiting; an
+# idle class's share goes to the other
+CLASS_WEIGHTS = {
+    INTERACTIVE: float(os.getenv("EMAIL_SCHED_INTERACTIVE_WEIGHT", "4")),
+    BULK: float(os.getenv("EMAIL_SCHED_BULK_WEIGHT", "1")),
+}
+# Fraction of the concurrency slots each class may hold at once. The rest of
+# what bulk cannot take stays free for interactive calls arriving later.
+CLASS_MAX_SHARES = {
+    INTERACTIVE: float(os.getenv("EMAIL_SCHED_INTERACTIVE_MAX_SHARE", "1.0")),
+    BULK: float(os.getenv("EMAIL_SCHED_BULK_MAX_SHARE", "0.75")),
+}
+# Number of recent waits per class the wait percentiles are taken over
+WAIT_WINDOW = int(os.getenv("EMAIL_SCHED_WAIT_WINDOW", "1000"))
+
+
+class _Tenant:
+    def __init__(self, vtime: float):
+        # Tokens served to this tenant, the tenant-level virtual time
+        self.vtime = vtime
+        self.waiters = deque()
+
+
+class _Class:
+    def __init__(self, weight: float, max_slots: int):
+        self.weight = weight
+        self.max_slots = max_slots
+        # Tokens served divided by weight, the class-level virtual time
+        self.vtime = 0.0
+        self.tenants = {}
+        self.queued = 0
+        self.in_flight = 0
+        self.counters = {"dispatched": 0, "tokens": 0}
+        self.waits = deque(maxlen=WAIT_WINDOW)
+
+    def wait_percentile(self, percentile: float) -> float:
+        if not self.waits:
+            return None
+        waits = sorted(self.waits)
+        return waits[min(int(len(waits) * percentile / 100), len(waits) - 1)]
+
+
+class FairScheduler:
+    """
+    Weighted fair queueing of LLM calls between priority classes and tenants
+
+    Every call is a job holding one of max_concurrency slots while it runs,
+    with a priority class, a tenant (e.g. an API key) and a cost in tokens.
+    When a slot frees up it goes to the class that has received the fewest
+    tokens relative to its weight, and within that class to the tenant that
+    has received the fewest tokens, so one tenant's large batch cannot starve
+    the others. A class never holds more than its share of the slots, which
+    keeps room for interactive calls while bulk work uses the spare capacity.
+    A class or tenant that was idle resumes at the level of the busiest
+    waiting one instead of cashing in the time it was idle.
+
+    Not thread-safe: all calls must come from the event loop it serves.
+    """
+
+    def __init__(self, max_concurrency: int, weights: dict = None, max_shares: dict = None):
+        weights = weights or CLASS_WEIGHTS
+        max_shares = max_shares or CLASS_MAX_SHARES
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self._classes = {
+            name: _Class(weight, max(1, int(max_concurrency * max_shares[name])))
+            for name, weight in weights.items()
+        }
+
+    def lane(self, priority: str = BULK, tenant: str = "default") -> "Lane":
+        """
+        A semaphore-like handle for the calls of one priority class and tenant
+
+        Raises:
+            ValueError: If priority is not a configured class
+        """
+        if priority not in self._classes:
+            raise ValueError(f"Unknown priority class: {priority}")
+        return Lane(self, priority, tenant)
+
+    async def acquire(self, priority: str, tenant: str, tokens: int = 1):
+        """
+        Wait for a slot for a call of the given class and tenant costing tokens
+        """
+        klass = self._classes[priority]
+        enqueued = time.perf_counter()
+        if not klass.queued and klass.in_flight < klass.max_slots and self.in_flight < self.max_concurrency:
+            # Nobody of this class is waiting and there is room, so nothing is overtaken
+            self._start(klass, self._tenant(klass, tenant), tokens)
+            self._forget_idle(klass, tenant)
+            self._record_wait(priority, klass, 0.0)
+            return
+
+        if not klass.queued:
+            waiting = [other.vtime for other in self._classes.values() if other.queued]
+            if waiting:
+                klass.vtime = max(klass.vtime, min(waiting))
+        flow = self._tenant(klass, tenant)
+        waiter = (asyncio.get_running_loop().create_future(), tokens)
+        flow.waiters.append(waiter)
+        klass.queued += 1
+        set_scheduler_queued(priority, klass.queued)
+        try:
+            await waiter[0]
+        except asyncio.CancelledError:
+            if waiter[0].done() and not waiter[0].cancelled():
+                # Granted just before the cancellation arrived
+                self.release(priority)
+            elif waiter in flow.waiters:
+                # Still queued; if _dispatch had reached it first, it would have dropped it
+                flow.waiters.remove(waiter)
+                klass.queued -= 1
+                set_scheduler_queued(priority, klass.queued)
+                self._forget_idle(klass, tenant)
+            raise
+        self._record_wait(priority, klass, time.perf_counter() - enqueued)
+
+    def release(self, priority: str):
+        klass = self._classes[priority]
+        klass.in_flight -= 1
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _tenant(self, klass: _Class, tenant: str) -> _Tenant:
+        flow = klass.tenants.get(tenant)
+        if flow is None:
+            waiting = [other.vtime for other in klass.tenants.values() if other.waiters]
+            flow = klass.tenants[tenant] = _Tenant(min(waiting) if waiting else 0.0)
+        return flow
+
+    def _forget_idle(self, klass: _Class, tenant: str):
+        # Tenants come and go; one with nothing queued is rebuilt on its next call
+        flow = klass.tenants.get(tenant)
+        if flow is not None and not flow.waiters:
+            del klass.tenants[tenant]
+
+    def _start(self, klass: _Class, flow: _Tenant, tokens: int):
+        klass.vtime += tokens / klass.weight
+        flow.vtime += tokens
+        klass.in_flight += 1
+        self.in_flight += 1
+        klass.counters["dispatched"] += 1
+        klass.counters["tokens"] += tokens
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrency:
+            eligible = [
+                (name, klass) for name, klass in self._classes.items()
+                if klass.queued and klass.in_flight < klass.max_slots
+            ]
+            if not eligible:
+                return
+            name, klass = min(eligible, key=lambda item: item[1].vtime)
+            tenant, flow = min(
+                ((tenant, flow) for tenant, flow in klass.tenants.items() if flow.waiters),
+                key=lambda item: item[1].vtime,
+            )
+            future, tokens = flow.waiters.popleft()
+            klass.queued -= 1
+            set_scheduler_queued(name, klass.queued)
+            self._forget_idle(klass, tenant)
+            if future.done():
+                # Cancelled while queued, before its task got to run the cleanup
+                continue
+            self._start(klass, flow, tokens)
+            future.set_result(None)
+
+    def _record_wait(self, priority: str, klass: _Class, seconds: float):
+        klass.waits.append(seconds)
+        record_scheduler_wait(priority, seconds)
+
+    def stats(self) -> dict:
+        """
+        Queue depth, slots in use, work done and recent waits per class
+        """
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "classes": {
+                name: {
+                    "weight": klass.weight,
+                    "max_slots": klass.max_slots,
+                    "queued": klass.queued,
+                    "in_flight": klass.in_flight,
+                    **klass.counters,
+                    "p50_wait": klass.wait_percentile(50),
+                    "p95_wait": klass.wait_percentile(95),
+                    "queued_by_tenant": {
+                        tenant: len(flow.waiters) for tenant, flow in klass.tenants.items() if flow.waiters
+                    },
+                }
+                for name, klass in self._classes.items()
+            },
+        }
+
+
+class Lane:
+    """
+    Slots of a FairScheduler for one priority class and tenant
+
+    Used like an asyncio.Semaphore (async with lane), so it can be passed
+    wherever the generation functions take a semaphore. with_cost gives a
+    handle charging a call's estimated tokens instead of one per call.
+    """
+
+    def __init__(self, scheduler: FairScheduler, priority: str, tenant: str, tokens: int = 1):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.tenant = tenant
+        self.tokens = tokens
+
+    def with_cost(self, tokens: int) -> "Lane":
+        return Lane(self.scheduler, self.priority, self.tenant, tokens)
+
+    async def __aenter__(self):
+        await self.scheduler.acquire(self.priority, self.tenant, self.tokens)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.scheduler.release(self.priority)
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import threading
+import weakref
+
+# Let concurrent requests for the same lead and product share one generation
+COALESCE_ENABLED = os.getenv("EMAIL_COALESCE", "1") == "1"
+
+
+class SingleFlight:
+    """
+    Share one in-flight call between concurrent callers asking for the same key
+
+    The first caller for a key starts the call as a task of its own; callers
+    arriving while it runs wait for that task and get its result or its
+    exception. The task is only cancelled once every caller waiting on it has
+    been cancelled. Calls are tracked per event loop, since a task cannot be
+    awaited from another loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = weakref.WeakKeyDictionary()
+        self._counters = {"calls": 0, "coalesced": 0}
+
+    async def run(self, key: str, call) -> tuple:
+        """
+        Await call() for key, or join the call already running for it
+
+        Args:
+            key (str): Identity of the call, e.g. a generation cache key
+            call: Coroutine function making the call
+
+        Returns:
+            tuple: (result of the call, True if it was started by another caller)
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flights = self._flights.setdefault(loop, {})
+            flight = flights.get(key)
+            joined = flight is not None
+            if flight is None:
+                # [task, number of callers waiting on it]
+                flight = flights[key] = [loop.create_task(call()), 0]
+
+                def forget(_, flight=flight):
+                    if flights.get(key) is flight:
+                        del flights[key]
+
+                flight[0].add_done_callback(forget)
+            self._counters["coalesced" if joined else "calls"] += 1
+            flight[1] += 1
+
+        task = flight[0]
+        try:
+            return await asyncio.shield(task), joined
+        except asyncio.CancelledError:
+            if flight[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            flight[1] -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = sum(len(flights) for flights in self._flights.values())
+        return stats
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    Return the process-wide single-flight group for email generations
+    """
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
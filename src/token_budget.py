@@ -0,0 +1,150 @@
+import os
+import re
+import threading
+
+# Token budget for any free-text lead field not listed in FIELD_TOKEN_BUDGETS
+DEFAULT_FIELD_TOKEN_BUDGET = int(os.getenv("EMAIL_FIELD_TOKEN_BUDGET", "200"))
+
+# Per-field budgets, keyed by normalised field name (lowercase, underscores)
+FIELD_TOKEN_BUDGETS = {
+    "experience": 300,
+    "current_experience": 300,
+    "education": 100,
+    "company_overview": 200,
+    "company_industry": 20,
+    "company": 20,
+    "name": 20,
+}
+
+# Fields that identify the lead and are never cleaned or trimmed
+UNTOUCHED_FIELDS = {"lead_id"}
+
+# Target email length from the style guide, used to size max_tokens
+EMAIL_MAX_WORDS = int(os.getenv("EMAIL_MAX_WORDS", "150"))
+
+# Lines produced by scraping LinkedIn profiles that carry no information
+_BOILERPLATE_LINES = re.compile(
+    r"^\s*(?:"
+    r"show all \d+ \w+"
+    r"|(?:…|\.\.\.)?\s*see (?:more|less)"
+    r"|show (?:more|less|credential|project|publication)"
+    r"|\d+ (?:followers?|connections?|endorsements?)"
+    r"|endorsed by .*"
+    r"|(?:company )?logo"
+    r"|education|experience|about"
+    r")\s*[.:]?\s*$",
+    re.IGNORECASE,
+)
+_INLINE_NOISE = re.compile(r"(?:…|\.\.\.)\s*see more", re.IGNORECASE)
+_SPACES = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """
+    Load the gpt-4o tokenizer from tiktoken if available
+
+    tiktoken is optional and fetches its vocabulary on first use; when it is
+    missing or offline, count_tokens falls back to a character estimate.
+    """
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                _encoder = False
+        return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of text locally
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    # About 4 characters per token for English prose
+    return (len(text) + 3) // 4
+
+
+def clean_field(text: str) -> str:
+    """
+    Remove scraping boilerplate, duplicate lines and extra whitespace from a lead field
+    """
+    text = _INLINE_NOISE.sub("", text)
+    lines = []
+    for line in text.splitlines():
+        line = _SPACES.sub(" ", line).strip()
+        if _BOILERPLATE_LINES.match(line):
+            continue
+        # LinkedIn repeats titles and company names on consecutive lines
+        if line and lines and line == lines[-1]:
+            continue
+        lines.append(line)
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def trim_to_budget(text: str, budget: int) -> str:
+    """
+    Cut text to at most budget tokens, preferring to end on a sentence or line break
+    """
+    if count_tokens(text) <= budget:
+        return text
+    encoder = _get_encoder()
+    if encoder:
+        cut = encoder.decode(encoder.encode(text, disallowed_special=())[:budget])
+    else:
+        cut = text[:budget * 4]
+    # Back off to the last sentence or line boundary if that keeps most of the text
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    if boundary > len(cut) * 0.6:
+        cut = cut[:boundary + 1]
+    return cut.rstrip() + " …"
+
+
+def _budget_for(field: str, budgets: dict) -> int:
+    key = field.strip().lower().replace(" ", "_")
+    return budgets.get(key, DEFAULT_FIELD_TOKEN_BUDGET)
+
+
+def compact_lead(lead_details: dict, budgets: dict = None) -> tuple:
+    """
+    Clean and trim every free-text field of a lead to its token budget
+
+    Args:
+        lead_details (dict): Lead details as received
+        budgets (dict): Per-field token budgets overriding FIELD_TOKEN_BUDGETS
+
+    Returns:
+        tuple: (compacted lead dict, stats dict with 'lead_tokens_before' and
+            'lead_tokens_after')
+    """
+    budgets = {**FIELD_TOKEN_BUDGETS, **(budgets or {})}
+    compacted = {}
+    before = after = 0
+    for field, value in lead_details.items():
+        if field in UNTOUCHED_FIELDS or not isinstance(value, str):
+            compacted[field] = value
+            continue
+        before += count_tokens(value)
+        value = trim_to_budget(clean_field(value), _budget_for(field, budgets))
+        after += count_tokens(value)
+        compacted[field] = value
+    return compacted, {"lead_tokens_before": before, "lead_tokens_after": after}
+
+
+def output_token_budget(max_words: int = EMAIL_MAX_WORDS) -> int:
+    """
+    max_tokens needed for one structured email of up to max_words words
+
+    Allows ~1.4 tokens per word, a subject line, the JSON envelope, and 2x
+    headroom so the model does not get cut off when it runs long.
+    """
+    return int((max_words * 1.4 + 40 + 30) * 2)
@@ -0,0 +1,276 @@
+import os
+import re
+from functools import lru_cache
+
+from token_budget import EMAIL_MAX_WORDS
+
+# Check every generated email and repair what fails
+VALIDATION_ENABLED = os.getenv("EMAIL_VALIDATE", "1") == "1"
+# Send what cannot be repaired locally (placeholders inside sentences, wrong
+# length) to a small fix-up LLM call
+LLM_REPAIR_ENABLED = os.getenv("EMAIL_LLM_REPAIR", "1") == "1"
+# Word range the style guide asks for
+EMAIL_MIN_WORDS = int(os.getenv("EMAIL_MIN_WORDS", "100"))
+
+# Problems find_issues reports
+LEAD_ID = "lead_id"
+GREETING = "greeting"
+LEAD_NAME = "lead_name"
+PLACEHOLDER = "placeholder"
+WORD_COUNT = "word_count"
+
+# [your name], [link to schedule](#), {{first_name}}, <your company>, (#)
+_PLACEHOLDER = re.compile(
+    r"\[[^\[\]\n]{1,80}\](?:\([^)\n]*\))?|\{\{?[^{}\n]{1,80}\}\}?|<your [^<>\n]{1,40}>|\(#\)",
+    re.IGNORECASE,
+)
+_GREETING = re.compile(
+    r"^\s*(?:hi|hello|hey|dear|greetings|good (?:morning|afternoon|evening))\b", re.IGNORECASE
+)
+# The salutation at the start of a greeting line with whatever name follows it,
+# e.g. "Hello there," or "Dear Mr. Rohit Sharma," in "Dear Mr. Rohit Sharma, I noticed..."
+_SALUTATION = re.compile(
+    r"^(\s*)(?i:hi|hello|hey|dear|greetings|good (?:morning|afternoon|evening))\b"
+    r"(?:(?:\s+(?:(?i:there|team|all|mr|ms|mrs|dr)\.?|[A-Z][\w'’.-]*)){1,3}(?=\s*(?:[,!:\-–—]|$)))?"
+    r"(?:\s*[,!:\-–—])?"
+)
+# A line that only closes the email, e.g. "Best regards," or "Thanks!"; the
+# sender's name and contact details follow it
+_SIGN_OFF = re.compile(
+    r"^\s*(?:(?:best|kind|warm|warmest)(?: regards| wishes)?|regards|cheers|(?:many )?thanks|thank you"
+    r"|sincerely|yours(?: truly| sincerely)?|talk soon|all the best)\s*[,.!]?\s*$",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+# Sender details that may be spelled out in the product text, e.g. "Contact: Priya Rao"
+_SENDER_FIELDS = {
+    "name": re.compile(r"^\s*(?:sender(?: name)?|contact(?: person)?|from)\s*[:\-]\s*(.+?)\s*$", re.I | re.M),
+    "position": re.compile(r"^\s*(?:title|position|role|designation)\s*[:\-]\s*(.+?)\s*$", re.I | re.M),
+    "company": re.compile(r"^\s*(?:company(?: name)?|organi[sz]ation)\s*[:\-]\s*(.+?)\s*$", re.I | re.M),
+    "email": re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"),
+    "phone": re.compile(r"(?:phone|mobile|tel|call)[^\d+\n]{0,12}(\+?\d[\d ().-]{7,}\d)", re.I),
+    "link": re.compile(r"https?://[^\s)>\]]+"),
+}
+# Product texts often open with "ProductName: description"
+_PRODUCT_NAME = re.compile(r"^\s*([^\s:][^:\n]{0,40}?)\s*:\s")
+
+# Which sender detail a placeholder asks for, tried in order
+_PLACEHOLDER_KINDS = [
+    ("email", re.compile(r"e-?mail", re.I)),
+    ("phone", re.compile(r"phone|mobile|number", re.I)),
+    ("link", re.compile(r"link|calendar|schedul|calendly|website|url|here", re.I)),
+    ("position", re.compile(r"position|title|role|designation", re.I)),
+    ("company", re.compile(r"company|organi[sz]ation", re.I)),
+    ("contact", re.compile(r"contact", re.I)),
+    ("name", re.compile(r"name", re.I)),
+]
+
+
+def count_words(text: str) -> int:
+    return len(_WORD.findall(text or ""))
+
+
+def _main_paragraphs(paragraphs: list) -> list:
+    """
+    Indices of the paragraphs holding the email's text
+
+    Leaves out a first paragraph that is only the greeting, and the paragraph
+    with the sign-off line and everything after it.
+    """
+    start = 1 if paragraphs and "\n" not in paragraphs[0].strip() and _GREETING.match(paragraphs[0]) else 0
+    for index in range(start, len(paragraphs)):
+        if any(_SIGN_OFF.match(line) for line in paragraphs[index].split("\n")):
+            return list(range(start, index))
+    return list(range(start, len(paragraphs)))
+
+
+def main_text(body: str) -> str:
+    """
+    The text of an email body without its greeting and its sign-off and signature
+
+    The style guide's word range is meant for this part; the sender's
+    contact block alone can take 20 words or more.
+    """
+    lines = (body or "").strip().split("\n")
+    if _GREETING.match(lines[0]):
+        # A short first line is the greeting alone; a longer one goes on with the opening
+        lines[0] = "" if count_words(lines[0]) <= 5 else _SALUTATION.sub("", lines[0], count=1)
+    for index, line in enumerate(lines):
+        if _SIGN_OFF.match(line):
+            lines = lines[:index]
+            break
+    return "\n".join(lines)
+
+
+def lead_name(lead_details: dict) -> str:
+    """
+    The lead's first name, whatever the case of the 'name' key
+    """
+    for key, value in lead_details.items():
+        if key.lower() == "name" and value:
+            return str(value).split()[0].strip(",")
+    return None
+
+
+@lru_cache(maxsize=256)
+def sender_details(product_details: str) -> dict:
+    """
+    Sender details found in the product text: name, position, company, email, phone, link
+    """
+    details = {}
+    for field, pattern in _SENDER_FIELDS.items():
+        match = pattern.search(product_details or "")
+        if match:
+            details[field] = match.group(match.lastindex or 0)
+    if "company" not in details:
+        match = _PRODUCT_NAME.match(product_details or "")
+        if match and len(match.group(1).split()) <= 4:
+            details["company"] = match.group(1)
+    contact = [details[field] for field in ("email", "phone") if field in details]
+    if contact:
+        details["contact"] = " | ".join(contact)
+    return details
+
+
+def _placeholder_value(placeholder: str, details: dict) -> str:
+    for kind, pattern in _PLACEHOLDER_KINDS:
+        if pattern.search(placeholder):
+            return details.get(kind)
+    return None
+
+
+def find_issues(email: dict, lead_details: dict) -> list:
+    """
+    Check an email against the prompt's rules
+
+    Returns:
+        list: The problems found, as LEAD_ID, GREETING, LEAD_NAME, PLACEHOLDER and WORD_COUNT
+    """
+    issues = []
+    body = email.get("body") or ""
+    lead_id = lead_details.get("lead_id")
+    if lead_id is not None and str(email.get("lead_id")) != str(lead_id):
+        issues.append(LEAD_ID)
+    first_line = body.strip().split("\n", 1)[0]
+    if not _GREETING.match(first_line):
+        issues.append(GREETING)
+    name = lead_name(lead_details)
+    if name and name.lower() not in first_line.lower():
+        issues.append(LEAD_NAME)
+    if _PLACEHOLDER.search(body) or _PLACEHOLDER.search(email.get("subject") or ""):
+        issues.append(PLACEHOLDER)
+    if not EMAIL_MIN_WORDS <= count_words(main_text(body)) <= EMAIL_MAX_WORDS:
+        issues.append(WORD_COUNT)
+    return issues
+
+
+def repair_locally(email: dict, lead_details: dict, product_details: str) -> dict:
+    """
+    Fix what needs no model: lead_id, greeting, and placeholders for sender details
+
+    Placeholders get the matching sender detail from the product text; a
+    signature line that is nothing but an unknown placeholder is dropped, as
+    the prompt says to skip details that are not provided. Placeholders
+    inside sentences are left for repair_paragraphs; unknown ones in the
+    subject, which fix-up calls never see, are dropped.
+
+    Returns:
+        dict: A repaired copy of email
+    """
+    email = dict(email)
+    lead_id = lead_details.get("lead_id")
+    if lead_id is not None:
+        email["lead_id"] = str(lead_id)
+
+    details = sender_details(product_details)
+
+    def substitute(match):
+        value = _placeholder_value(match.group(0), details)
+        return value if value else match.group(0)
+
+    lines = []
+    for line in (email.get("body") or "").split("\n"):
+        line = _PLACEHOLDER.sub(substitute, line)
+        if _PLACEHOLDER.search(line) and not _PLACEHOLDER.sub("", line).strip(" \t-|,.:"):
+            continue
+        lines.append(line)
+    body = "\n".join(lines).strip()
+    subject = _PLACEHOLDER.sub(substitute, email.get("subject") or "")
+    email["subject"] = " ".join(_PLACEHOLDER.sub("", subject).split()).strip(" -|,:") or subject
+
+    name = lead_name(lead_details)
+    greeting = f"Hi {name or 'there'},"
+    first_line, _, rest = body.partition("\n")
+    if not _GREETING.match(first_line):
+        body = f"{greeting}\n\n{body}"
+    elif name and name.lower() not in first_line.lower():
+        # Swap the salutation only; the opening sentence may share its line
+        first_line = _SALUTATION.sub(lambda match: f"{match.group(1)}{greeting}", first_line, count=1)
+        body = f"{first_line}\n{rest}" if rest else first_line
+    email["body"] = body
+    return email
+
+
+def paragraphs_to_fix(email: dict, issues: list) -> tuple:
+    """
+    The body's paragraphs and the indices of those a fix-up call has to rewrite
+
+    The paragraphs still holding placeholders are always sent. A wrong
+    length adds the longest paragraphs of the main text (see main_text) until
+    they hold at least twice the words to cut or add, so no paragraph has to
+    change beyond recognition; the greeting and signature are never sent.
+
+    Returns:
+        tuple: (list of paragraphs, sorted list of indices to rewrite)
+    """
+    paragraphs = _PARAGRAPH_BREAK.split(email.get("body") or "")
+    indices = {index for index, paragraph in enumerate(paragraphs) if _PLACEHOLDER.search(paragraph)}
+    if WORD_COUNT in issues:
+        words = count_words(main_text(email.get("body")))
+        gap = words - EMAIL_MAX_WORDS if words > EMAIL_MAX_WORDS else EMAIL_MIN_WORDS - words
+        longest = sorted(_main_paragraphs(paragraphs), key=lambda index: -count_words(paragraphs[index]))
+        for index in longest:
+            if sum(count_words(paragraphs[chosen]) for chosen in indices) >= 2 * gap:
+                break
+            indices.add(index)
+    return paragraphs, sorted(indices)
+
+
+def repair_paragraphs(email: dict, paragraphs: list, indices: list, rewritten: list) -> dict:
+    """
+    Put the paragraphs returned by a fix-up call back into the email
+
+    Returns:
+        dict: A copy of email with paragraphs[indices] replaced, or email
+            unchanged if the call did not return one paragraph per index
+    """
+    if len(rewritten) != len(indices):
+        return email
+    paragraphs = list(paragraphs)
+    for index, paragraph in zip(indices, rewritten):
+        paragraphs[index] = paragraph.strip()
+    return {**email, "body": "\n\n".join(paragraph for paragraph in paragraphs if paragraph)}
+
+
+def repair_problems(email: dict, issues: list, paragraphs: list, indices: list) -> list:
+    """
+    Describe the problems left after repair_locally for a fix-up call on paragraphs[indices]
+    """
+    problems = []
+    if PLACEHOLDER in issues:
+        problems.append(
+            "Some paragraphs contain placeholders in brackets or braces. Replace each with the "
+            "matching sender detail, or reword the sentence so it is not needed."
+        )
+    if WORD_COUNT in issues:
+        total = count_words(main_text(email.get("body")))
+        sent = sum(count_words(paragraphs[index]) for index in indices)
+        low, high = EMAIL_MIN_WORDS - (total - sent), EMAIL_MAX_WORDS - (total - sent)
+        problems.append(
+            f"The email is {total} words long but must be {EMAIL_MIN_WORDS}-{EMAIL_MAX_WORDS} words. "
+            f"{'Shorten' if total > EMAIL_MAX_WORDS else 'Expand'} these paragraphs so together they "
+            f"have {max(low, 1)}-{high} words (now {sent})."
+        )
+    return problems
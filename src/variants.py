@@ -0,0 +1,56 @@
+import os
+import re
+
+# Most alternative emails one request may ask for
+MAX_VARIANTS = int(os.getenv("EMAIL_MAX_VARIANTS", "5"))
+# Variants whose subject and opening overlap more than this (Jaccard similarity
+# of their word pairs) count as near duplicates
+VARIANT_MAX_SIMILARITY = float(os.getenv("EMAIL_VARIANT_MAX_SIMILARITY", "0.6"))
+
+_WORD = re.compile(r"[^\W_]+(?:['’][^\W_]+)*")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_GREETING = re.compile(r"^\s*(?:hi|hello|hey|dear|greetings|good (?:morning|afternoon|evening))\b[^\n]*$", re.I)
+
+
+def _opening(body: str) -> str:
+    """
+    First paragraph of the body after a greeting-only line
+    """
+    for paragraph in _PARAGRAPH_BREAK.split(body or ""):
+        paragraph = paragraph.strip()
+        if paragraph and not _GREETING.match(paragraph):
+            return paragraph
+    return ""
+
+
+def _shingles(email: dict) -> set:
+    """
+    Word pairs of the subject and opening, the parts an A/B test compares
+    """
+    shingles = set()
+    for text in (email.get("subject") or "", _opening(email.get("body"))):
+        words = [word.lower() for word in _WORD.findall(text)]
+        shingles.update(zip(words, words[1:]) if len(words) > 1 else words)
+    return shingles
+
+
+def _jaccard(first: set, second: set) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def distinct_variants(emails: list, max_similarity: float = VARIANT_MAX_SIMILARITY) -> list:
+    """
+    Drop variants whose subject and opening are near duplicates of an earlier one
+
+    Returns:
+        list: The emails kept, in their original order
+    """
+    kept, kept_shingles = [], []
+    for email in emails:
+        shingles = _shingles(email)
+        if all(_jaccard(shingles, other) <= max_similarity for other in kept_shingles):
+            kept.append(email)
+            kept_shingles.append(shingles)
+    return kept
@@ -0,0 +1,81 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from batch_api import LocalBatchBackend, OpenAIBatchBackend, run_email_batch
+
+LEADS = [{"lead_id": "1", "name": "Ada Lovelace"}, {"lead_id": "2", "name": "Bob Stone"}]
+PRODUCT = "InvestorBase: AI-powered deal flow screening for venture capital funds."
+
+
+class CrashingBackend(LocalBatchBackend):
+    """
+    Local backend whose process 'dies' on the first poll
+    """
+
+    def __init__(self, workdir: str):
+        super().__init__(workdir)
+        self.submitted = []
+        self.crash = True
+
+    def submit(self, requests_path: str) -> str:
+        batch_id = super().submit(requests_path)
+        self.submitted.append(batch_id)
+        return batch_id
+
+    def poll(self, batch_id: str) -> dict:
+        if self.crash:
+            self.crash = False
+            raise KeyboardInterrupt
+        return super().poll(batch_id)
+
+
+def test_an_interrupted_run_resumes_its_submitted_batch(tmp_path):
+    workdir = str(tmp_path)
+    backend = CrashingBackend(workdir)
+    with pytest.raises(KeyboardInterrupt):
+        run_email_batch(LEADS, PRODUCT, backend=backend, workdir=workdir, use_cache=False)
+    assert any(name.startswith("run-") for name in os.listdir(workdir))
+
+    results = run_email_batch(LEADS, PRODUCT, backend=backend, workdir=workdir, use_cache=False)
+    assert len(backend.submitted) == 1
+    assert [(result["lead_id"], result["status"]) for result in results] == [("1", "ok"), ("2", "ok")]
+    assert results[1]["body"].startswith("Hi Bob,")
+    assert "issues" not in results[0]
+    assert not any(name.startswith("run-") for name in os.listdir(workdir))
+
+
+class FakeFiles:
+    def __init__(self, contents: dict):
+        self.contents = contents
+        self.with_streaming_response = self
+
+    def content(self, file_id: str):
+        contents = self.contents[file_id]
+
+        class Response:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def stream_to_file(self, path: str):
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write(contents)
+
+        return Response()
+
+
+@pytest.mark.parametrize("status", ["expired", "cancelled"])
+def test_poll_downloads_the_finished_part_of_an_unfinished_batch(tmp_path, status):
+    batch = SimpleNamespace(status=status, output_file_id="file-out", error_file_id=None)
+    client = SimpleNamespace(
+        batches=SimpleNamespace(retrieve=lambda batch_id: batch),
+        files=FakeFiles({"file-out": '{"custom_id": "0:1"}\n'}),
+    )
+    state = OpenAIBatchBackend(str(tmp_path), client=client).poll("batch_1")
+    assert state["status"] == status
+    with open(state["output_path"], encoding="utf-8") as file:
+        assert file.read() == '{"custom_id": "0:1"}\n'
@@ -0,0 +1,23 @@
+from bulk_cli import iter_leads
+
+
+def test_iter_leads_skips_empty_rows_and_ids_rows_without_one(tmp_path):
+    path = tmp_path / "leads.csv"
+    path.write_text(
+        "Full Name,ID,Company\n"
+        "Ada Lovelace,1,Analytical Engines\n"
+        "\n"
+        ",,\n"
+        "Bob Stone,2,Stone Capital\n"
+        "Cara Diaz,,Diaz Labs\n"
+        " , ,\n",
+        encoding="utf-8",
+    )
+    leads = list(iter_leads(str(path), {}))
+    assert [(number, lead["name"], lead["lead_id"]) for number, lead in leads] == [
+        (1, "Ada Lovelace", "1"),
+        (4, "Bob Stone", "2"),
+        (5, "Cara Diaz", "row-5"),
+    ]
+    # Resuming after row 4 skips by row number, blank rows included
+    assert [lead["name"] for _, lead in iter_leads(str(path), {}, skip=4)] == ["Cara Diaz"]
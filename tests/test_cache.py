@@ -0,0 +1,48 @@
+import asyncio
+import sqlite3
+import threading
+
+from cache import GenerationCache
+
+
+def test_aset_and_aget_go_through_both_tiers(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def main():
+        await GenerationCache(path=path).aset("key", {"subject": "Hi"})
+        cache = GenerationCache(path=path)
+        assert await cache.aget("key") == {"subject": "Hi"}
+        assert await cache.aget("key") == {"subject": "Hi"}
+        assert await cache.aget("other") is None
+        stats = cache.stats()
+        assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+
+    asyncio.run(main())
+
+
+def test_a_locked_disk_tier_does_not_block_the_event_loop(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = GenerationCache(path=path)
+    # Another worker process holding the write lock
+    other = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, other.execute, ("COMMIT",)).start()
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        await cache.aset("key", {"subject": "Hi"})
+        ticker.cancel()
+        # The memory tier answers at once, without waiting for the disk
+        assert await cache.aget("key") == {"subject": "Hi"}
+        return ticks
+
+    assert asyncio.run(main()) >= 10
+    assert GenerationCache(path=path).get("key") == {"subject": "Hi"}
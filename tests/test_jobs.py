@@ -0,0 +1,45 @@
+import asyncio
+import sqlite3
+
+import jobs
+from jobs import COMPLETED, RUNNING, JobManager, JobStore
+
+
+async def fake_generate(lead: dict, product_details: str, semaphore=None) -> dict:
+    return {"subject": "Hi", "body": f"Hi {lead['name']}", "lead_id": lead["lead_id"], "status": "ok"}
+
+
+def run_job(store: JobStore, leads: list) -> str:
+    async def main():
+        manager = JobManager(store)
+        job_id = store.create_job(leads, "product")
+        manager.start(job_id)
+        await asyncio.gather(*manager._tasks.values())
+        return job_id
+
+    return asyncio.run(main())
+
+
+def test_a_job_completes_once_every_lead_is_saved(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "_generate_or_error", fake_generate)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = run_job(store, [{"lead_id": str(idx), "name": f"Lead {idx}"} for idx in range(5)])
+    job = store.get_job(job_id)
+    assert (job["status"], job["completed"], job["pending"]) == (COMPLETED, 5, 0)
+
+
+def test_a_lead_that_could_not_be_saved_keeps_the_job_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "_generate_or_error", fake_generate)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    save_result = store.save_result
+    failures = [sqlite3.OperationalError("database is locked")]
+
+    def flaky_save_result(*args):
+        if failures:
+            raise failures.pop()
+        save_result(*args)
+
+    monkeypatch.setattr(store, "save_result", flaky_save_result)
+    job_id = run_job(store, [{"lead_id": str(idx), "name": f"Lead {idx}"} for idx in range(3)])
+    job = store.get_job(job_id)
+    assert (job["status"], job["completed"], job["pending"]) == (RUNNING, 2, 1)
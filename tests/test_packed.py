@@ -0,0 +1,107 @@
+import asyncio
+import re
+
+import pytest
+
+import personalised_email
+from personalised_email import EmailResponse, PackedEmailResponse, agenerate_email_for_multiple_leads
+
+PRODUCT = "InvestorBase: AI-powered deal flow screening for venture capital funds."
+USAGE = {"prompt_tokens": 100, "cached_prompt_tokens": 0, "uncached_prompt_tokens": 100, "completion_tokens": 40}
+_LEAD = re.compile(r'"lead_id": "([^"]+)",\s*"name": "([^"]+)"')
+
+
+def lead(lead_id: str, name: str) -> dict:
+    return {"lead_id": lead_id, "name": name}
+
+
+def email_for(lead_id: str, name: str) -> EmailResponse:
+    body = f"Hi {name.split()[0]},\n\n" + "We help funds screen more deals. " * 20 + "\n\nBest,\nPriya"
+    return EmailResponse(subject=f"An idea for {name}", body=body, lead_id=lead_id)
+
+
+class FakeModel:
+    """
+    Stands in for _acall_model, answering from the leads in the prompt
+
+    answer_pack turns a pack's (lead_id, name) pairs into the emails of its answer.
+    """
+
+    def __init__(self, answer_pack=None, fail_packs: bool = False, fail_singles: bool = False):
+        self.answer_pack = answer_pack or (lambda leads: [email_for(*pair) for pair in leads])
+        self.fail_packs = fail_packs
+        self.fail_singles = fail_singles
+        self.packs = []
+        self.singles = []
+
+    async def __call__(self, structured_model, messages: list, semaphore=None, **kwargs) -> tuple:
+        leads = _LEAD.findall(messages[-1]["content"])
+        if structured_model is PackedEmailResponse:
+            self.packs.append([lead_id for lead_id, _ in leads])
+            if self.fail_packs:
+                raise RuntimeError("pack failed")
+            return PackedEmailResponse(emails=self.answer_pack(leads)), dict(USAGE), 1
+        assert structured_model is EmailResponse and len(leads) == 1
+        self.singles.append(leads[0][0])
+        if self.fail_singles:
+            raise ValueError("bad request")
+        return email_for(*leads[0]), dict(USAGE), 1
+
+
+@pytest.fixture
+def model(monkeypatch):
+    async def structured_model(schema, *args, **kwargs):
+        return schema
+
+    fake = FakeModel()
+    monkeypatch.setattr(personalised_email, "aget_structured_model", structured_model)
+    monkeypatch.setattr(personalised_email, "_acall_model", fake)
+    return fake
+
+
+def generate(leads: list, pack_size: int = 5, include_usage: bool = False) -> list:
+    return asyncio.run(agenerate_email_for_multiple_leads(
+        leads, PRODUCT, pack_size=pack_size, use_cache=False, include_usage=include_usage
+    ))
+
+
+def test_leads_the_model_skipped_or_duplicated_fall_back_to_single_calls(model):
+    # Lead 2 answered twice and lead 3 not at all
+    model.answer_pack = lambda leads: [email_for(*leads[0]), email_for(*leads[1]), email_for(*leads[1])]
+    results = generate([lead("1", "Ada Lovelace"), lead("2", "Bob Stone"), lead("3", "Cara Diaz")], include_usage=True)
+    assert model.packs == [["1", "2", "3"]]
+    assert sorted(model.singles) == ["2", "3"]
+    assert [(result["lead_id"], result["status"]) for result in results] == [("1", "ok"), ("2", "ok"), ("3", "ok")]
+    assert results[0]["usage"]["pack_size"] == 3
+    assert "pack_size" not in results[1]["usage"]
+    assert results[2]["body"].startswith("Hi Cara,")
+
+
+def test_a_failed_pack_falls_back_to_single_calls(model):
+    model.fail_packs = True
+    results = generate([lead("1", "Ada Lovelace"), lead("2", "Bob Stone")])
+    assert model.packs == [["1", "2"]]
+    assert sorted(model.singles) == ["1", "2"]
+    assert [result["status"] for result in results] == ["ok", "ok"]
+
+
+def test_a_repeated_lead_id_starts_a_new_pack(model):
+    results = generate([lead("1", "Ada Lovelace"), lead("2", "Bob Stone"), lead("1", "Cara Diaz")])
+    assert model.packs == [["1", "2"], ["1"]]
+    assert model.singles == []
+    assert [result["body"].split(",")[0] for result in results] == ["Hi Ada", "Hi Bob", "Hi Cara"]
+
+
+def test_duplicate_leads_share_one_generation_with_usage(model):
+    results = generate([lead("1", "Ada Lovelace"), lead("1", "Ada Lovelace")], include_usage=True)
+    assert model.packs == [["1"]]
+    assert results[0]["usage"]["pack_size"] == 1
+    assert results[1]["usage"] == {"cache_hit": False, "coalesced": True}
+    assert results[1]["body"] == results[0]["body"]
+
+
+def test_duplicate_leads_that_failed_copy_the_error_with_usage(model):
+    model.fail_packs = model.fail_singles = True
+    results = generate([lead("1", "Ada Lovelace"), lead("1", "Ada Lovelace")], include_usage=True)
+    assert [(result["status"], result["error_type"]) for result in results] == [("error", "fatal")] * 2
+    assert "usage" not in results[1]
@@ -0,0 +1,68 @@
+import asyncio
+
+from scheduler import BULK, INTERACTIVE, FairScheduler
+
+
+def test_cancelled_waiter_released_in_same_iteration_does_not_leak_the_slot():
+    async def main():
+        scheduler = FairScheduler(1)
+        lane = scheduler.lane(BULK, "a")
+        await lane.__aenter__()
+        cancelled = asyncio.create_task(lane.__aenter__())
+        waiting = asyncio.create_task(lane.__aenter__())
+        await asyncio.sleep(0)
+
+        # The slot frees up before the cancelled task gets to run its cleanup
+        cancelled.cancel()
+        await lane.__aexit__(None, None, None)
+
+        await asyncio.wait_for(waiting, 1)
+        assert cancelled.cancelled()
+        assert scheduler.in_flight == 1
+        assert scheduler.stats()["classes"][BULK]["queued"] == 0
+        await lane.__aexit__(None, None, None)
+        assert scheduler.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_cancelling_many_queued_calls_keeps_the_counts_right():
+    async def main():
+        scheduler = FairScheduler(2, max_shares={INTERACTIVE: 1.0, BULK: 1.0})
+        lane = scheduler.lane(BULK, "a")
+        held = [asyncio.create_task(lane.__aenter__()) for _ in range(2)]
+        await asyncio.gather(*held)
+        queued = [asyncio.create_task(lane.__aenter__()) for _ in range(5)]
+        await asyncio.sleep(0)
+        for task in queued[:4]:
+            task.cancel()
+        await lane.__aexit__(None, None, None)
+        await asyncio.wait_for(queued[4], 1)
+        assert scheduler.in_flight == 2
+        assert scheduler.stats()["classes"][BULK]["queued"] == 0
+
+    asyncio.run(main())
+
+
+def test_interactive_calls_overtake_queued_bulk_calls():
+    async def main():
+        scheduler = FairScheduler(2)
+        order = []
+
+        async def call(priority: str, tenant: str):
+            async with scheduler.lane(priority, tenant).with_cost(100):
+                order.append((priority, tenant))
+                await asyncio.sleep(0.01)
+
+        bulk = [asyncio.create_task(call(BULK, "a")) for _ in range(4)]
+        bulk += [asyncio.create_task(call(BULK, "b")) for _ in range(2)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call(INTERACTIVE, "x"))
+        await asyncio.gather(*bulk, interactive)
+
+        # Bulk may only hold one of the two slots, so the interactive call starts at once
+        assert order[1] == (INTERACTIVE, "x")
+        # Tenants of the same class take turns
+        assert [tenant for _, tenant in order[2:5]] == ["a", "b", "a"]
+
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def main():
+        flights = SingleFlight()
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "email"
+
+        results = await asyncio.gather(*(flights.run("key", call) for _ in range(5)))
+        assert calls == 1
+        assert [joined for _, joined in results] == [False, True, True, True, True]
+        assert flights.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_cancelling_one_caller_keeps_the_call_for_the_others():
+    async def main():
+        flights = SingleFlight()
+        started = asyncio.Event()
+
+        async def call():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "email"
+
+        first = asyncio.create_task(flights.run("key", call))
+        second = asyncio.create_task(flights.run("key", call))
+        await started.wait()
+        first.cancel()
+        assert await second == ("email", True)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+
+
+def test_cancelling_every_caller_cancels_the_call():
+    async def main():
+        flights = SingleFlight()
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def call():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(flights.run("key", call)) for _ in range(3)]
+        await started.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert flights.stats()["in_flight"] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+from validation import (
+    GREETING,
+    LEAD_ID,
+    LEAD_NAME,
+    PLACEHOLDER,
+    WORD_COUNT,
+    count_words,
+    find_issues,
+    main_text,
+    paragraphs_to_fix,
+    repair_locally,
+    repair_paragraphs,
+)
+
+LEAD = {"lead_id": "7", "Name": "Rohit Sharma", "Company": "Northwind"}
+PRODUCT = (
+    "DealScout: AI screening for venture funds\n"
+    "Contact: Priya Rao\n"
+    "Title: Head of Partnerships\n"
+    "Email: priya@dealscout.io\n"
+)
+# 16 words each but ASK, which has 17
+OPENING = "I saw that Northwind doubled its seed investments this year while keeping the same small team."
+PITCH = "DealScout reads every inbound deck overnight and ranks it against your thesis before the Monday meeting."
+PROOF = "Funds using it screen three times as many companies without hiring more analysts or working weekends."
+ASK = "Would a twenty minute call next Tuesday or Wednesday be useful to see it on your pipeline?"
+SIGNATURE = "Best regards,\nPriya Rao\nHead of Partnerships, DealScout\npriya@dealscout.io | +1 415 555 0100"
+
+
+def email(body: str, subject: str = "Screening Northwind's deal flow overnight", lead_id: str = "7") -> dict:
+    return {"subject": subject, "body": body, "lead_id": lead_id}
+
+
+def body_of(*paragraphs: str, greeting: str = "Hi Rohit,", signature: str = SIGNATURE) -> str:
+    return "\n\n".join([greeting, *paragraphs, signature])
+
+
+# 113 words of main text
+GOOD_BODY = body_of(
+    f"{OPENING} {PITCH}",
+    f"{PROOF} {PITCH} {OPENING}",
+    f"{PROOF} {ASK}",
+)
+
+
+def test_a_good_email_has_no_issues():
+    assert count_words(main_text(GOOD_BODY)) == 113
+    assert find_issues(email(GOOD_BODY), LEAD) == []
+
+
+def test_greeting_and_signature_do_not_count_towards_the_length():
+    # 145 words of main text plus a 19 word signature block
+    body = body_of(f"{OPENING} {PITCH} {PROOF}", f"{OPENING} {PITCH} {PROOF}", f"{OPENING} {PITCH} {ASK}")
+    assert count_words(body) > 150
+    assert count_words(main_text(body)) == 145
+    assert WORD_COUNT not in find_issues(email(body), LEAD)
+
+
+def test_find_issues_reports_each_problem():
+    body = body_of(OPENING, greeting="I hope this finds you well.", signature="Cheers,\n[your name]")
+    issues = find_issues(email(body, subject="A quick idea for [Company]", lead_id="8"), LEAD)
+    assert issues == [LEAD_ID, GREETING, LEAD_NAME, PLACEHOLDER, WORD_COUNT]
+
+
+def test_a_greeting_sharing_its_line_with_the_opening_counts_as_a_greeting():
+    body = f"Hello Rohit, {OPENING}\n\n{PITCH}\n\n{SIGNATURE}"
+    assert count_words(main_text(body)) == 32
+    assert find_issues(email(body), LEAD) == [WORD_COUNT]
+
+
+def test_repair_locally_swaps_the_name_and_keeps_the_opening():
+    body = GOOD_BODY.replace("Hi Rohit,", f"Dear Mr. Anil Kumar, {OPENING}", 1)
+    repaired = repair_locally(email(body, lead_id="3"), LEAD, PRODUCT)
+    assert repaired["lead_id"] == "7"
+    assert repaired["body"].split("\n", 1)[0] == f"Hi Rohit, {OPENING}"
+
+    repaired = repair_locally(email(GOOD_BODY.replace("Hi Rohit,", "Hello there!", 1)), LEAD, PRODUCT)
+    assert repaired["body"] == GOOD_BODY
+
+
+def test_repair_locally_adds_a_missing_greeting():
+    body = GOOD_BODY.replace("Hi Rohit,\n\n", "", 1)
+    assert repair_locally(email(body), LEAD, PRODUCT)["body"] == GOOD_BODY
+
+
+def test_repair_locally_fills_in_sender_details_and_drops_unknown_signature_lines():
+    body = body_of(
+        f"{OPENING} {PITCH}",
+        f"{PROOF} You can book a time [here](#).",
+        signature="Best regards,\n[Your Name]\n[Your Position]\n[Your Contact Information]\n[Your LinkedIn Profile]",
+    )
+    repaired = repair_locally(email(body, subject="[Your Company] for Northwind"), LEAD, PRODUCT)
+    assert repaired["subject"] == "DealScout for Northwind"
+    assert repaired["body"].endswith(
+        "Best regards,\nPriya Rao\nHead of Partnerships\npriya@dealscout.io"
+    )
+    # Not a sender detail found in the product text, and inside a sentence
+    assert "[here](#)" in repaired["body"]
+    assert PLACEHOLDER in find_issues(repaired, LEAD)
+
+
+def test_repair_locally_drops_unknown_placeholders_from_the_subject():
+    repaired = repair_locally(email(GOOD_BODY, subject="Meeting with [Partner Firm]"), LEAD, PRODUCT)
+    assert repaired["subject"] == "Meeting with"
+    assert find_issues(repaired, LEAD) == []
+
+
+def test_paragraphs_to_fix_sends_only_paragraphs_with_placeholders():
+    body = body_of(f"{OPENING} {PITCH}", f"{PROOF} Book a time [here](#).", ASK)
+    paragraphs, indices = paragraphs_to_fix(email(body), [PLACEHOLDER])
+    assert indices == [2]
+    assert paragraphs[2] == f"{PROOF} Book a time [here](#)."
+
+
+def test_paragraphs_to_fix_sends_the_longest_paragraphs_for_a_wrong_length():
+    # 177 words of main text, 27 too many
+    long_paragraph = f"{OPENING} {PITCH} {PROOF} {OPENING} {PITCH} {PROOF}"
+    body = body_of(f"{OPENING} {PITCH}", long_paragraph, f"{PROOF} {OPENING} {ASK}")
+    assert find_issues(email(body), LEAD) == [WORD_COUNT]
+    _, indices = paragraphs_to_fix(email(body), [WORD_COUNT])
+    assert indices == [2]
+
+    # 32 words, 68 short: the greeting and signature are never sent
+    body = body_of(OPENING, PITCH)
+    paragraphs, indices = paragraphs_to_fix(email(body), [WORD_COUNT])
+    assert indices == [1, 2]
+    assert paragraphs[3] == SIGNATURE
+
+
+def test_paragraphs_to_fix_has_nothing_to_send_for_a_subject_placeholder():
+    _, indices = paragraphs_to_fix(email(GOOD_BODY, subject="[Company] x Northwind"), [PLACEHOLDER])
+    assert indices == []
+
+
+def test_repair_paragraphs_puts_the_rewritten_paragraphs_back():
+    body = body_of(f"{OPENING} {PITCH}", f"{PROOF} Book a time [here](#).", ASK)
+    paragraphs, indices = paragraphs_to_fix(email(body), [PLACEHOLDER])
+    repaired = repair_paragraphs(email(body), paragraphs, indices, [f"  {PROOF} Reply with a time that suits you.\n"])
+    assert repaired["body"] == body_of(f"{OPENING} {PITCH}", f"{PROOF} Reply with a time that suits you.", ASK)
+
+
+def test_repair_paragraphs_ignores_an_answer_with_the_wrong_number_of_paragraphs():
+    body = body_of(f"{OPENING} {PITCH}", f"{PROOF} Book a time [here](#).", ASK)
+    original = email(body)
+    paragraphs, indices = paragraphs_to_fix(original, [PLACEHOLDER])
+    assert repair_paragraphs(original, paragraphs, indices, ["One.", "Two."]) is original